@@ -2,15 +2,20 @@
 # Automatic power off script for 3D printers running Klipper / Script d'extinction automatique pour imprimante 3D sous Klipper
 # Place in ~/klipper/klippy/extras/ folder / À placer dans le dossier ~/klipper/klippy/extras/
 
+import copy
 import logging
+import math
+import mmap
+import random
+import struct
 import threading
 import time
 import os
-import json
-import subprocess
-import socket
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
 from enum import Enum, auto
-from typing import Dict, List, Optional, Union, Any, Tuple, Callable, Set, TypeVar, Generic, Type, cast
+from typing import Dict, List, Optional, Union, Any, Tuple, Callable, Set, TypeVar, Generic, Type, Deque, cast
 
 __version__ = "2.1.2"  # Module version for update checking
 
@@ -22,6 +27,11 @@ class PowerOffMethod(Enum):
     POWER_OFF = auto()  # Utilise la méthode power_off()
     CMD_OFF = auto()    # Utilise la commande GCODE POWER_OFF
     MOONRAKER = auto()  # Utilise l'API Moonraker
+    TASMOTA = auto()    # Pilote direct d'une prise Tasmota
+    SHELLY = auto()     # Pilote direct d'une prise Shelly
+    KASA = auto()       # Pilote direct d'une prise TP-Link Kasa
+    HOME_ASSISTANT = auto()  # Pilote direct via l'API Home Assistant
+    MQTT = auto()       # Commande publiée sur un broker MQTT
     UNKNOWN = auto()    # Méthode inconnue ou non déterminée
 
 class DeviceState(Enum):
@@ -39,6 +49,34 @@ class PrinterState(Enum):
     SHUTDOWN = auto()    # Imprimante arrêtée
     UNKNOWN = auto()     # État inconnu
 
+class CircuitState(Enum):
+    """Circuit breaker states for remote backends / États du disjoncteur des backends distants"""
+    CLOSED = auto()     # Backend sain, appels autorisés
+    OPEN = auto()       # Backend en échec, appels refusés immédiatement
+    HALF_OPEN = auto()  # Période d'essai : un appel de test est autorisé
+
+class Decision(Enum):
+    """Verdicts recorded in the decision journal / Verdicts enregistrés dans le journal des décisions"""
+    ACTIVITY = "postponed_activity"          # Activité G-code, compte à rebours relancé
+    PRINTING = "canceled_printing"           # Impression en cours, extinction annulée
+    NOT_IDLE = "postponed_not_idle"          # Imprimante occupée, nouvelle vérification plus tard
+    TEMPERATURE = "postponed_temperature"    # Températures au-dessus du seuil
+    JOBS_QUEUED = "postponed_jobs_queued"    # Travaux en attente dans la file Moonraker
+    POWER_OFF = "powered_off"                # Conditions réunies, extinction lancée
+    POWER_OFF_FAILED = "power_off_failed"    # Échec de l'extinction
+    CONDITION = "postponed_condition"        # Une condition keep_on_when ou d'extension garde l'imprimante allumée
+    ERROR = "error"                          # Erreur pendant la vérification
+    POWER_ON = "powered_on"                  # Imprimante rallumée et MCU reconnecté
+    POWER_ON_FAILED = "power_on_failed"      # Échec de l'allumage
+
+class PowerOffEvent(Enum):
+    """Events sent with printer.send_event() / Événements envoyés avec printer.send_event()"""
+    ARMED = "auto_power_off:armed"                # Compte à rebours démarré
+    POSTPONED = "auto_power_off:postponed"        # Extinction reportée, nouvelle échéance
+    CANCELED = "auto_power_off:canceled"          # Compte à rebours annulé
+    POWERING_OFF = "auto_power_off:powering_off"  # Séquence d'extinction lancée
+    POWERED_OFF = "auto_power_off:powered_off"    # Commande d'extinction confirmée
+
 class Language(Enum):
     """Supported languages / Langues supportées"""
     ENGLISH = "en"
@@ -72,246 +110,2546 @@ class NetworkDeviceUnreachableError(NetworkDeviceError):
 
 class MoonrakerApiError(PowerOffError):
     """Exception for Moonraker API errors / Exception pour les erreurs d'API Moonraker"""
-    pass
+    # Codes Moonraker answers for a method it does not have / Codes d'une méthode inconnue
+    METHOD_NOT_FOUND = (404, -32601)
+
+    def __init__(self, message: str, code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code  # Error code from Moonraker's answer, None for transport errors
 
 class TranslationError(Exception):
     """Exception for translation errors / Exception pour les erreurs de traduction"""
     pass
 
+class SettingsError(Exception):
+    """Exception raised for invalid runtime settings / Exception levée pour des réglages invalides"""
+    pass
+
 class MCUError(PowerOffError):
     """Exception for MCU-related errors / Exception pour les erreurs liées au MCU"""
     pass
 
+class PowerOnError(PowerOffError):
+    """Exception raised when the printer cannot be powered on / Exception levée si l'imprimante ne peut être allumée"""
+    pass
 
-class AutoPowerOff:
-    def __init__(self, config):
-        # Device state / État du périphérique
-        self.device_state: DeviceState = DeviceState.UNAVAILABLE
-        self.device_capabilities: Dict[str, bool] = {}
-        self.optimal_method: Optional[PowerOffMethod] = None
-        self.force_direct: bool = False
-
-        self.printer = config.get_printer()
-        self.reactor = self.printer.get_reactor()
-
-        # Set up logging first / Configuration du logging en premier
-        self.logger = logging.getLogger('auto_power_off')
-        self.logger.setLevel(logging.INFO)
 
-        # Language configuration / Configuration de la langue
-        self._configure_language(config)
+def jittered_backoff(base: float, attempt: int, cap: float) -> float:
+    """
+    Exponential backoff delay with jitter / Délai exponentiel avec gigue.
+    
+    The delay doubles with each attempt up to cap, and a random half of it is
+    removed so that retries from several printers do not line up.
+    
+    Args:
+        base: Delay for the first attempt in seconds
+        attempt: Zero-based attempt number
+        cap: Maximum delay in seconds
+        
+    Returns:
+        float: Delay in seconds, between half and all of the exponential delay
+    """
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2. + random.uniform(0., delay / 2.)
 
-        # Load translations / Charger les traductions
-        self._load_translations()
 
-        # Configuration parameters / Configuration des paramètres
-        self.idle_timeout: float = config.getfloat('idle_timeout', 600.0)  # Idle time in seconds (10 min default) / Temps d'inactivité en secondes (10 min par défaut)
-        self.temp_threshold: float = config.getfloat('temp_threshold', 40.0)  # Temperature threshold in °C / Seuil de température en °C
-        self.power_device: str = config.get('power_device', 'psu_control')  # Name of your power device / Nom du périphérique d'alimentation
-        self.enabled: bool = config.getboolean('auto_poweroff_enabled', False)  # Default enabled/disabled state / État activé/désactivé par défaut
-        self.moonraker_integration: bool = config.getboolean('moonraker_integration', True)  # Moonraker integration / Intégration avec Moonraker
-        self.moonraker_url: str = config.get('moonraker_url', "http://localhost:7125")  # Moonraker URL / URL de Moonraker
+class CircuitBreaker:
+    """
+    Circuit breaker guarding a remote backend (Moonraker, network device).
+    Disjoncteur protégeant un backend distant (Moonraker, périphérique réseau).
 
-        # Diagnostic mode parameters / Paramètres du mode diagnostique
-        self.diagnostic_mode: bool = config.getboolean('diagnostic_mode', False)  # Enable diagnostic logging / Activer la journalisation de diagnostic
-        self.power_off_retries: int = config.getint('power_off_retries', 3)  # Number of retry attempts / Nombre de tentatives
-        self.power_off_retry_delay: int = config.getint('power_off_retry_delay', 2)  # Delay between retries in seconds / Délai entre les tentatives en secondes
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast. Once the (jittered, exponentially growing) reset timeout has
+    elapsed, a single trial call is let through in the half-open state: a
+    success closes the circuit, a failure opens it again for longer. Other
+    callers fail fast while the trial is in flight; a trial whose outcome is
+    never recorded is given up after reset_timeout.
+    """
+    def __init__(self, name: str, reactor, failure_threshold: int = 3,
+                 reset_timeout: float = 30., max_reset_timeout: float = 600.):
+        self.name = name
+        self.reactor = reactor
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state: CircuitState = CircuitState.CLOSED
+        self.failures: int = 0
+        self.trips: int = 0
+        self.open_until: float = 0.
+        self.trial_in_flight: bool = False
 
-        # Dry run mode / Mode simulation
-        self.dry_run_mode: bool = config.getboolean('dry_run_mode', False)  # Default is real power off / Par défaut, extinction réelle
+    def allow(self) -> bool:
+        """
+        Check whether a call to the backend may be attempted.
+        
+        Returns:
+            bool: False while the circuit is open or its trial call is in flight, True otherwise
+        """
+        if self.state == CircuitState.CLOSED:
+            return True
+        now = self.reactor.monotonic()
+        if self.state == CircuitState.OPEN:
+            if now < self.open_until:
+                return False
+            self.state = CircuitState.HALF_OPEN
+        elif self.trial_in_flight and now < self.open_until + self.reset_timeout:
+            # One trial at a time / Un seul essai à la fois
+            return False
+        self.trial_in_flight = True
+        self.open_until = now
+        return True
 
-        # Network device settings / Paramètres des périphériques réseau
-        self.network_device: bool = config.getboolean('network_device', False)  # Is this a network power device / Est-ce un périphérique d'alimentation réseau
-        self.device_address: Optional[str] = config.get('device_address', None)  # IP address or hostname / Adresse IP ou nom d'hôte
-        self.network_test_attempts: int = config.getint('network_test_attempts', 3)  # Number of attempts to test connectivity / Nombre de tentatives pour tester la connectivité
-        self.network_test_interval: float = config.getfloat('network_test_interval', 1.0)  # Interval between tests in seconds / Intervalle entre les tests en secondes
+    def record_success(self) -> None:
+        """Close the circuit after a successful call / Referme le circuit après un succès"""
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.trial_in_flight = False
 
-        # Register for events / Enregistrement pour les événements
-        self.printer.register_event_handler("klippy:ready", self._handle_ready)
-        self.printer.register_event_handler("print_stats:complete", self._handle_print_complete)
+    def record_failure(self) -> None:
+        """Count a failed call and open the circuit if needed / Compte un échec et ouvre le circuit si nécessaire"""
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            timeout = jittered_backoff(self.reset_timeout, self.trips, self.max_reset_timeout)
+            self.trips += 1
+            self.failures = 0
+            self.state = CircuitState.OPEN
+            self.open_until = self.reactor.monotonic() + timeout
+            logging.getLogger('auto_power_off').warning(
+                f"Circuit for {self.name} opened for {timeout:.0f}s / Circuit {self.name} ouvert pour {timeout:.0f}s")
 
-        # Monitored components configuration / Configuration des composants à surveiller
-        self.monitor_hotend: bool = config.getboolean('monitor_hotend', True)
-        self.monitor_bed: bool = config.getboolean('monitor_bed', True)
-        self.monitor_chamber: bool = config.getboolean('monitor_chamber', False)
 
-        # State variables / Variables d'état
-        self.shutdown_timer: Optional[float] = None
-        self.is_checking_temp: bool = False
-        self.countdown_end: float = 0
-        self.last_temps: Dict[str, float] = {"hotend": 0, "bed": 0}
-        self._shutdown_in_progress: bool = False  # Flag to track shutdown state / Indicateur de suivi de l'état d'extinction
-        self.state: str = "init"  # État initial du module (init, on, off, error)
+class PlugDriver(ABC):
+    """
+    Base class for smart plugs driven directly, without the Moonraker hop.
+    Classe de base des prises connectées pilotées directement, sans passer par Moonraker.
 
-        # Register gcode commands / Enregistrement des commandes GCODE
-        gcode = self.printer.lookup_object('gcode')
-        gcode.register_command('AUTO_POWEROFF', self.cmd_AUTO_POWEROFF,
-                               desc=self.cmd_AUTO_POWEROFF_help)
+    Drivers keep their connection open between calls and use short timeouts.
+    set_power() returns the state reported by the plug after the command, so
+    callers can confirm that the plug actually switched.
+    """
+    method: PowerOffMethod = PowerOffMethod.UNKNOWN
+    default_port: int = 80
 
-        # Convenience sub-commands so users can type e.g.
-        # AUTO_POWEROFF_DIAGNOSTIC VALUE=1 directly (Klipper's parser rejects
-        # bare tokens like `AUTO_POWEROFF DIAGNOSTIC`, see issue #14).
-        # Only register aliases that don't collide with existing gcode_macros
-        # shipped in ui/fluidd/*.cfg and ui/mainsail/*.cfg.
-        for _sub in ('DIAGNOSTIC', 'DRYRUN', 'VERSION', 'RESET'):
-            _alias = f'AUTO_POWEROFF_{_sub}'
-            try:
-                gcode.register_command(
-                    _alias,
-                    self._make_alias_handler(_sub.lower()),
-                    desc=self.cmd_AUTO_POWEROFF_help,
-                )
-            except Exception as e:
-                self.logger.warning(f"Could not register {_alias}: {e}")
+    def __init__(self, host: str, port: Optional[int] = None, timeout: float = 2.0,
+                 output: int = 0, password: Optional[str] = None,
+                 token: Optional[str] = None, entity_id: Optional[str] = None):
+        self.host = host
+        self.port = port or self.default_port
+        self.timeout = timeout
+        self.output = output
+        self.password = password
+        self.token = token
+        self.entity_id = entity_id
 
-        # Register for Fluidd/Mainsail status API / Enregistrement pour l'API de status Fluidd/Mainsail
-        self.printer.register_event_handler("klippy:connect", self._handle_connect)
+    @abstractmethod
+    def set_power(self, on: bool) -> bool:
+        """
+        Switch the plug on or off.
+        
+        Args:
+            on: True to switch on, False to switch off
+            
+        Returns:
+            bool: State reported by the plug afterwards (True means on)
+            
+        Raises:
+            NetworkDeviceError: If the plug rejects the command
+            NetworkDeviceUnreachableError: If the plug cannot be reached
+        """
 
-    def get_git_version(self) -> str:
+    @abstractmethod
+    def get_state(self) -> bool:
         """
-        Récupère la version à partir de Git si disponible.
-        Évite les problèmes de 'inferred version'.
+        Read the relay state.
         
         Returns:
-            str: Numéro de version Git ou version par défaut
+            bool: True if the plug is on
         """
-        try:
-            # Vérifier si nous sommes dans un dépôt Git
-            repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-            git_dir = os.path.join(repo_dir, ".git")
-            
-            if os.path.isdir(git_dir):
-                # Essayer d'obtenir la version depuis le tag Git
-                try:
-                    with open(os.path.join(git_dir, "HEAD"), 'r') as f:
-                        head_ref = f.read().strip()
-                    
-                    # Si le HEAD pointe vers une référence
-                    if head_ref.startswith("ref:"):
-                        ref_path = head_ref[5:].strip()
-                        ref_file = os.path.join(git_dir, ref_path)
-                        
-                        if os.path.isfile(ref_file):
-                            with open(ref_file, 'r') as f:
-                                return f"v{__version__}-{f.read().strip()[:7]}"
-                except:
-                    pass
-            
-            return f"v{__version__}"
-        except:
-            return f"v{__version__}"
 
-    def _configure_language(self, config) -> None:
+    def close(self) -> None:
+        """Close the persistent connection / Ferme la connexion persistante"""
+        pass
+
+
+class HttpPlugDriver(PlugDriver):
+    """Plug driven over HTTP through a persistent keep-alive connection"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._conn = None
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None,
+                 headers: Optional[Dict[str, str]] = None) -> Any:
         """
-        Configure language settings using multiple sources.
+        Send a request and decode the JSON answer.
         
-        This method determines the language to use by checking in this order:
-        1. Explicit config parameter 'language'
-        2. Persistent language file
-        3. Environment variables (LANG, LANGUAGE, LC_ALL)
-        4. Klipper configuration files
-        5. Default to English if none of the above are available
+        A stale keep-alive connection (closed by the plug since the last call)
+        is reopened once; a fresh connection that fails is reported right away.
         
         Args:
-            config: Klipper config object containing language settings
+            method: HTTP method
+            path: Request path including the query string
+            body: Optional request body
+            headers: Optional request headers
             
         Returns:
-            None
-        
+            Any: Decoded JSON body, or an empty dict if the body is empty
+            
         Raises:
-            TranslationError: If there's an error loading translations
+            NetworkDeviceError: If the plug answers with an HTTP error
+            NetworkDeviceUnreachableError: If the plug cannot be reached
         """
-        configured_lang = config.get('language', None)
-        if configured_lang == 'auto':
-            configured_lang = None
+        import http.client
+        import json
+        
+        while True:
+            reused = self._conn is not None
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, body=body, headers=headers or {})
+                response = self._conn.getresponse()
+                payload = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                if reused:
+                    continue
+                raise NetworkDeviceUnreachableError(f"{self.host}:{self.port} unreachable: {str(e)}") from e
+            if response.will_close:
+                self.close()
+            if response.status >= 400:
+                raise NetworkDeviceError(f"{self.host}:{self.port} answered HTTP {response.status}")
+            try:
+                return json.loads(payload) if payload else {}
+            except ValueError as e:
+                raise NetworkDeviceError(f"Invalid JSON from {self.host}:{self.port}") from e
 
-        persistent_lang = self._get_persistent_language()
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
 
-        env_lang = None
-        try:
-            for env_var in ['LANG', 'LANGUAGE', 'LC_ALL']:
-                if env_var in os.environ and os.environ[env_var]:
-                    env_value = os.environ[env_var].split('.')[0].lower()
-                    if env_value.startswith('fr'):
-                        env_lang = 'fr'
-                        break
-                    elif env_value.startswith('en'):
-                        env_lang = 'en'
-                        break
-        except Exception as e:
-            self.logger.warning(f"Error checking environment language: {str(e)}")
 
-        klipper_lang = self._check_klipper_language_settings()
-        self.lang = configured_lang or persistent_lang or env_lang or klipper_lang or 'en'
+class TasmotaPlugDriver(HttpPlugDriver):
+    """Tasmota plug, HTTP command API (/cm?cmnd=Power Off)"""
+    method = PowerOffMethod.TASMOTA
+
+    def _command(self, cmnd: str) -> bool:
+        from urllib.parse import urlencode
         
-        # Validate language against available languages
-        if self.lang.lower() not in [lang.value for lang in Language]:
-            self.logger.warning(f"Unsupported language '{self.lang}'. Defaulting to English.")
-            self.lang = Language.ENGLISH.value
-        else:
-            self.lang = self.lang.lower()
+        params = {'cmnd': cmnd}
+        if self.password:
+            params.update(user='admin', password=self.password)
+        data = self._request('GET', '/cm?' + urlencode(params))
+        key = f"POWER{self.output}" if self.output else "POWER"
+        value = data.get(key, data.get('POWER1')) if isinstance(data, dict) else None
+        if value is None:
+            raise NetworkDeviceError(f"Unexpected Tasmota response: {data}")
+        return str(value).upper() == 'ON'
 
-        if configured_lang and configured_lang != persistent_lang:
-            self._save_persistent_language(self.lang)
+    def set_power(self, on: bool) -> bool:
+        return self._command(f"Power{self.output or ''} {'On' if on else 'Off'}")
 
-        self.logger.info(f"Language detection: config={configured_lang}, persistent={persistent_lang}, env={env_lang}, klipper={klipper_lang}, final={self.lang}")
+    def get_state(self) -> bool:
+        return self._command(f"Power{self.output or ''}")
 
-    def _check_klipper_language_settings(self) -> Optional[str]:
-        """
-        Check for language preference in Klipper configuration files.
+
+class ShellyPlugDriver(HttpPlugDriver):
+    """Shelly plug or relay, Gen1 REST API or Gen2+ RPC API (detected once)"""
+    method = PowerOffMethod.SHELLY
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rpc: Optional[bool] = None
+
+    def _uses_rpc(self) -> bool:
+        if self._rpc is None:
+            info = self._request('GET', '/shelly')
+            self._rpc = int(info.get('gen', 1)) >= 2
+        return self._rpc
+
+    def set_power(self, on: bool) -> bool:
+        if self._uses_rpc():
+            self._request('GET', f"/rpc/Switch.Set?id={self.output}&on={'true' if on else 'false'}")
+            return self.get_state()
+        data = self._request('GET', f"/relay/{self.output}?turn={'on' if on else 'off'}")
+        return bool(data['ison'])
+
+    def get_state(self) -> bool:
+        if self._uses_rpc():
+            return bool(self._request('GET', f"/rpc/Switch.GetStatus?id={self.output}")['output'])
+        return bool(self._request('GET', f"/relay/{self.output}")['ison'])
+
+
+class HomeAssistantPlugDriver(HttpPlugDriver):
+    """Any Home Assistant switch-like entity, REST API with a long-lived token"""
+    method = PowerOffMethod.HOME_ASSISTANT
+    default_port = 8123
+
+    def _headers(self) -> Dict[str, str]:
+        return {'Authorization': f"Bearer {self.token}", 'Content-Type': 'application/json'}
+
+    def set_power(self, on: bool) -> bool:
+        import json
         
-        This method looks for French configuration files in common paths
-        to determine if French should be used.
+        domain = self.entity_id.split('.', 1)[0]
+        body = json.dumps({'entity_id': self.entity_id}).encode()
+        self._request('POST', f"/api/services/{domain}/turn_{'on' if on else 'off'}", body, self._headers())
+        return self.get_state()
+
+    def get_state(self) -> bool:
+        return self._request('GET', f"/api/states/{self.entity_id}", headers=self._headers()).get('state') == 'on'
+
+
+class KasaPlugDriver(PlugDriver):
+    """TP-Link Kasa plug, local TCP protocol on port 9999 (XOR autokey)"""
+    method = PowerOffMethod.KASA
+    default_port = 9999
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sock = None
+
+    @staticmethod
+    def encrypt(data: bytes) -> bytes:
+        """Encrypt and frame a Kasa request / Chiffre et encadre une requête Kasa"""
+        key = 171
+        out = bytearray()
+        for byte in data:
+            key ^= byte
+            out.append(key)
+        return len(data).to_bytes(4, 'big') + bytes(out)
+
+    @staticmethod
+    def decrypt(data: bytes) -> bytes:
+        """Decrypt a Kasa payload (without its length header) / Déchiffre une réponse Kasa"""
+        key = 171
+        out = bytearray()
+        for byte in data:
+            out.append(key ^ byte)
+            key = byte
+        return bytes(out)
+
+    def _recv_exact(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError("connection closed by plug")
+            data += chunk
+        return data
+
+    def _query(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        import json
+        import socket
         
-        Returns:
-            str or None: 'fr' if French configuration is detected, None otherwise
-        """
+        request = self.encrypt(json.dumps(payload).encode())
+        while True:
+            reused = self._sock is not None
+            try:
+                if self._sock is None:
+                    self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                self._sock.sendall(request)
+                length = int.from_bytes(self._recv_exact(4), 'big')
+                data = self._recv_exact(length)
+            except OSError as e:
+                self.close()
+                if reused:
+                    continue
+                raise NetworkDeviceUnreachableError(f"{self.host}:{self.port} unreachable: {str(e)}") from e
+            try:
+                return json.loads(self.decrypt(data))
+            except ValueError as e:
+                raise NetworkDeviceError(f"Invalid response from {self.host}:{self.port}") from e
+
+    def set_power(self, on: bool) -> bool:
+        result = self._query({'system': {'set_relay_state': {'state': 1 if on else 0}}})
+        if result.get('system', {}).get('set_relay_state', {}).get('err_code', 0) != 0:
+            raise NetworkDeviceError(f"Kasa plug rejected the command: {result}")
+        return self.get_state()
+
+    def get_state(self) -> bool:
+        info = self._query({'system': {'get_sysinfo': {}}})
+        return bool(info['system']['get_sysinfo']['relay_state'])
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+# Drivers selectable with the plug_type option / Pilotes sélectionnables avec l'option plug_type
+PLUG_DRIVERS: Dict[str, Type[PlugDriver]] = {
+    'tasmota': TasmotaPlugDriver,
+    'shelly': ShellyPlugDriver,
+    'kasa': KasaPlugDriver,
+    'homeassistant': HomeAssistantPlugDriver,
+}
+
+
+class MqttPowerClient:
+    """
+    Minimal MQTT 3.1.1 client keeping one persistent session with the broker.
+    Client MQTT 3.1.1 minimal conservant une session persistante avec le broker.
+
+    A background thread owns the connection: it connects once, subscribes to
+    the plug's state topic, answers keepalives and reconnects with jittered
+    backoff. Power requests publish the command with QoS 1 from a short-lived
+    worker thread, wait for the PUBACK and for the state topic to confirm,
+    then report back to the reactor through register_async_callback, so the
+    reactor never blocks on the network.
+    """
+    method: PowerOffMethod = PowerOffMethod.MQTT
+
+    def __init__(self, reactor, host: str, port: int = 1883, client_id: str = "auto_power_off",
+                 command_topic: str = "", state_topic: Optional[str] = None,
+                 payload_on: str = "ON", payload_off: str = "OFF",
+                 state_on: Optional[str] = None, state_off: Optional[str] = None,
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 keepalive: int = 60, timeout: float = 5.0):
+        self.reactor = reactor
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.command_topic = command_topic
+        self.state_topic = state_topic
+        self.payload_on = payload_on
+        self.payload_off = payload_off
+        self.state_on = state_on or payload_on
+        self.state_off = state_off or payload_off
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.connected = threading.Event()
+        self.last_state: Optional[str] = None
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending: Set[int] = set()
+        self._acked: Set[int] = set()
+        self._packet_id = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _string(value: str) -> bytes:
+        data = value.encode('utf-8')
+        return len(data).to_bytes(2, 'big') + data
+
+    @staticmethod
+    def _packet(header: int, body: bytes = b'') -> bytes:
+        """Frame a packet with its variable-length remaining length / Encadre un paquet"""
+        length = len(body)
+        encoded = bytearray()
+        while True:
+            byte = length % 128
+            length //= 128
+            encoded.append(byte | 0x80 if length else byte)
+            if not length:
+                break
+        return bytes([header]) + bytes(encoded) + body
+
+    @staticmethod
+    def _recv_exact(sock, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("MQTT broker closed the connection")
+            data += chunk
+        return data
+
+    def _recv_packet(self, sock) -> Tuple[int, bytes]:
+        header = self._recv_exact(sock, 1)[0]
+        length, shift = 0, 0
+        while True:
+            byte = self._recv_exact(sock, 1)[0]
+            length |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header, self._recv_exact(sock, length)
+
+    def _next_packet_id(self) -> int:
+        self._packet_id = self._packet_id % 0xffff + 1
+        return self._packet_id
+
+    def _send(self, data: bytes) -> None:
+        with self._send_lock:
+            if self._sock is None:
+                raise NetworkDeviceUnreachableError(f"MQTT broker {self.host}:{self.port} not connected")
+            try:
+                self._sock.sendall(data)
+            except OSError as e:
+                raise NetworkDeviceUnreachableError(f"MQTT send failed: {str(e)}") from e
+
+    def start(self) -> None:
+        """Start the connection thread / Démarre le thread de connexion"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="auto_power_off-mqtt", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Disconnect and stop the connection thread / Déconnexion et arrêt du thread"""
+        self._stop.set()
         try:
-            config_paths = [
-                "~/printer_data/config/mainsail/auto_power_off_fr.cfg",
-                "~/printer_data/config/fluidd/auto_power_off_fr.cfg",
-                "~/klipper_config/mainsail/auto_power_off_fr.cfg",
-                "~/klipper_config/fluidd/auto_power_off_fr.cfg"
-            ]
-            for path in config_paths:
-                expanded_path = os.path.expanduser(path)
-                if os.path.exists(expanded_path):
-                    return Language.FRENCH.value
-        except Exception as e:
-            self.logger.warning(f"Error checking Klipper config: {str(e)}")
-        return None
+            self._send(self._packet(0xe0))
+        except NetworkDeviceError:
+            pass
+        self._close_socket()
+        if self._thread is not None:
+            self._thread.join(self.timeout)
+            self._thread = None
 
-    def _get_persistent_language(self) -> Optional[str]:
+    def _close_socket(self) -> None:
+        import socket
+        self.connected.clear()
+        with self._send_lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def _connect(self):
+        import socket
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            # Clean session off: the broker keeps our subscription and queued
+            # QoS 1 messages across reconnects / Session persistante côté broker
+            flags = 0
+            payload = self._string(self.client_id)
+            if self.username:
+                flags |= 0x80
+                payload += self._string(self.username)
+                if self.password:
+                    flags |= 0x40
+                    payload += self._string(self.password)
+            sock.sendall(self._packet(0x10, self._string("MQTT") + bytes([4, flags])
+                                      + self.keepalive.to_bytes(2, 'big') + payload))
+            header, body = self._recv_packet(sock)
+            if header >> 4 != 2 or len(body) < 2:
+                raise NetworkDeviceError("Unexpected answer to MQTT CONNECT")
+            if body[1] != 0:
+                raise NetworkDeviceError(f"MQTT broker refused the connection (code {body[1]})")
+            if self.state_topic:
+                # Subscribing again also makes the broker resend the retained state
+                sock.sendall(self._packet(0x82, self._next_packet_id().to_bytes(2, 'big')
+                                          + self._string(self.state_topic) + b'\x01'))
+            sock.settimeout(self.keepalive / 2. if self.keepalive else None)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _run(self) -> None:
+        import socket
+        logger = logging.getLogger('auto_power_off')
+        attempt = 0
+        while not self._stop.is_set():
+            try:
+                sock = self._connect()
+                with self._send_lock:
+                    self._sock = sock
+                self.connected.set()
+                attempt = 0
+                logger.info(f"MQTT connected to {self.host}:{self.port} / Connecté au broker MQTT")
+                while not self._stop.is_set():
+                    try:
+                        header, body = self._recv_packet(sock)
+                    except socket.timeout:
+                        self._send(self._packet(0xc0))
+                        continue
+                    self._handle_packet(header, body)
+            except (OSError, NetworkDeviceError) as e:
+                if not self._stop.is_set():
+                    logger.warning(f"MQTT connection to {self.host}:{self.port} lost: {str(e)} / Connexion MQTT perdue")
+            finally:
+                self._close_socket()
+            self._stop.wait(jittered_backoff(1., attempt, 60.))
+            attempt += 1
+
+    def _handle_packet(self, header: int, body: bytes) -> None:
+        kind = header >> 4
+        if kind == 3:  # PUBLISH
+            topic_len = int.from_bytes(body[:2], 'big')
+            topic = body[2:2 + topic_len].decode('utf-8', 'replace')
+            pos = 2 + topic_len
+            if (header >> 1) & 3:
+                self._send(self._packet(0x40, body[pos:pos + 2]))
+                pos += 2
+            if topic == self.state_topic:
+                with self._cond:
+                    self.last_state = body[pos:].decode('utf-8', 'replace').strip()
+                    self._cond.notify_all()
+        elif kind == 4:  # PUBACK
+            with self._cond:
+                packet_id = int.from_bytes(body[:2], 'big')
+                # A late PUBACK for a command given up on is dropped / PUBACK tardif ignoré
+                if packet_id in self._pending:
+                    self._acked.add(packet_id)
+                    self._cond.notify_all()
+
+    def set_power(self, on: bool) -> None:
         """
-        Get saved language from persistence file.
+        Publish the command and wait for confirmation (blocking).
         
-        Returns:
-            str or None: The language code if found in persistence file, None otherwise
+        Args:
+            on: True to switch on, False to switch off
+            
+        Raises:
+            NetworkDeviceUnreachableError: If the broker is not connected
+            NetworkDeviceError: If the command is not acknowledged or confirmed in time
         """
+        deadline = time.monotonic() + self.timeout
+        if not self.connected.wait(self.timeout):
+            raise NetworkDeviceUnreachableError(f"MQTT broker {self.host}:{self.port} not connected")
+        payload = self.payload_on if on else self.payload_off
+        expected = (self.state_on if on else self.state_off).lower()
+        with self._cond:
+            self.last_state = None
+            packet_id = self._next_packet_id()
+            self._pending.add(packet_id)
         try:
-            persistence_file = os.path.expanduser("~/printer_data/config/auto_power_off_language.conf")
-            if os.path.exists(persistence_file):
-                with open(persistence_file, 'r') as f:
-                    saved_lang = f.read().strip()
-                    return saved_lang if saved_lang in [lang.value for lang in Language] else None
-        except Exception as e:
-            self.logger.warning(f"Error reading persistent language: {str(e)}")
-        return None
+            self._send(self._packet(0x32, self._string(self.command_topic)
+                                    + packet_id.to_bytes(2, 'big') + payload.encode('utf-8')))
+            with self._cond:
+                acked = self._cond.wait_for(lambda: packet_id in self._acked,
+                                            max(0., deadline - time.monotonic()))
+        finally:
+            with self._cond:
+                self._pending.discard(packet_id)
+                self._acked.discard(packet_id)
+        if not acked:
+            raise NetworkDeviceError("MQTT broker did not acknowledge the command")
+        with self._cond:
+            if self.state_topic and not self._cond.wait_for(
+                    lambda: (self.last_state or '').lower() == expected,
+                    max(0., deadline - time.monotonic())):
+                raise NetworkDeviceError(
+                    f"MQTT state topic reported {self.last_state!r} instead of {expected!r}")
 
-    def _save_persistent_language(self, language: str) -> None:
+    def request_power(self, on: bool, callback: Callable[[float, Optional[str]], None]) -> None:
         """
-        Save language preference to persistence file.
+        Run set_power() off the reactor thread and report the outcome.
         
         Args:
-            language: The language code to save
-            
-        Returns:
-            None
+            on: True to switch on, False to switch off
+            callback: Called in the reactor as callback(eventtime, error), error being None on success
         """
-        try:
-            persistence_dir = os.path.expanduser("~/printer_data/config")
-            if not os.path.exists(persistence_dir):
-                persistence_dir = os.path.expanduser("~/klipper_config")
+        def worker():
+            error = None
+            try:
+                self.set_power(on)
+            except NetworkDeviceError as e:
+                error = str(e)
+            except Exception as e:
+                error = f"MQTT error: {str(e)}"
+            self.reactor.register_async_callback(lambda eventtime: callback(eventtime, error))
+        threading.Thread(target=worker, name="auto_power_off-mqtt-request", daemon=True).start()
+
+
+class MoonrakerClient:
+    """
+    Moonraker API client preferring the local Unix socket over HTTP.
+    Client de l'API Moonraker privilégiant le socket Unix local au lieu de HTTP.
+
+    When Moonraker's Unix domain socket exists, calls are sent as JSON-RPC
+    messages (terminated by 0x03) over one persistent connection, which skips
+    TCP and the trusted_clients authorization. Otherwise, or if connecting or
+    sending on the socket fails, the same call goes through HTTP with curl.
+    Once a request was sent on the socket it is never sent again over HTTP:
+    Moonraker may already have acted on it. The socket path is checked on
+    every call, so Moonraker starting after Klipper is picked up without a
+    restart.
+    """
+    def __init__(self, url: str, socket_path: Optional[str] = None, timeout: float = 5.0):
+        self.url = url.rstrip('/')
+        self.socket_path = os.path.expanduser(socket_path) if socket_path else None
+        self.timeout = timeout
+        self.transport: Optional[str] = None  # Last transport used: 'unix' or 'http'
+        self._sock = None
+        self._buffer = b''
+        self._request_id = 0
+        self._identified = False  # Connection registered as a Moonraker agent / Connexion enregistrée comme agent
+
+    def call(self, rpc_method: str, http_method: str, path: str,
+             params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        """
+        Call a Moonraker API method.
+        
+        Args:
+            rpc_method: JSON-RPC method name, e.g. 'machine.device_power.post_device'
+            http_method: HTTP method of the equivalent endpoint
+            path: HTTP path of the equivalent endpoint
+            params: Method parameters (JSON body for POST, query string for GET)
+            timeout: Timeout in seconds, defaults to the client timeout
+            
+        Returns:
+            Any: The 'result' member of Moonraker's answer
+            
+        Raises:
+            MoonrakerApiError: If Moonraker cannot be reached or returns an error
+        """
+        params = params or {}
+        timeout = timeout or self.timeout
+        if self.socket_path and os.path.exists(self.socket_path):
+            try:
+                result = self._call_unix(rpc_method, params, timeout)
+                self.transport = 'unix'
+                return result
+            except MoonrakerApiError:
+                raise
+            except OSError as e:
+                # Connecting or sending failed, nothing reached Moonraker / Rien n'a atteint Moonraker
+                self.close()
+                logging.getLogger('auto_power_off').debug(
+                    f"Moonraker socket unusable ({str(e)}), using HTTP / Socket Moonraker inutilisable, passage en HTTP")
+        result = self._call_http(http_method, path, params, timeout)
+        self.transport = 'http'
+        return result
+
+    def _call_unix(self, rpc_method: str, params: Dict[str, Any], timeout: float) -> Any:
+        import json
+        import socket
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(timeout)
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+            self._buffer = b''
+            self._identified = False
+        # The timeout bounds the whole call, not each recv(), so an answer
+        # trickling in byte by byte cannot hold the reactor indefinitely
+        deadline = time.monotonic() + timeout
+        self._sock.settimeout(timeout)
+        self._request_id += 1
+        request_id = self._request_id
+        self._sock.sendall(json.dumps({'jsonrpc': '2.0', 'method': rpc_method,
+                                       'params': params, 'id': request_id}).encode() + b'\x03')
+        try:
+            return self._read_answer(request_id, deadline)
+        except socket.timeout as e:
+            self.close()
+            raise MoonrakerApiError(f"Moonraker socket timed out after {timeout}s") from e
+        except ValueError as e:
+            self.close()
+            raise MoonrakerApiError(f"Invalid answer on the Moonraker socket: {str(e)}") from e
+        except OSError as e:
+            # The request may have been handled: report it instead of sending it again over HTTP
+            # La requête a pu être traitée : erreur plutôt qu'un nouvel envoi en HTTP
+            self.close()
+            raise MoonrakerApiError(f"Moonraker socket failed after the request was sent: {str(e)}") from e
+
+    def _read_answer(self, request_id: int, deadline: float) -> Any:
+        import json
+        import socket
+        while True:
+            while b'\x03' not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.:
+                    raise socket.timeout("timed out")
+                self._sock.settimeout(remaining)
+                chunk = self._sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("Moonraker closed the socket")
+                self._buffer += chunk
+            raw, _, self._buffer = self._buffer.partition(b'\x03')
+            message = json.loads(raw)
+            if message.get('id') != request_id:
+                continue  # Notification or stale answer / Notification ou réponse périmée
+            if 'error' in message:
+                error = message['error']
+                if isinstance(error, dict):
+                    raise MoonrakerApiError(f"Moonraker API error: {error.get('message', error)}", error.get('code'))
+                raise MoonrakerApiError(f"Moonraker API error: {error}")
+            return message.get('result')
+
+    def _call_http(self, http_method: str, path: str, params: Dict[str, Any], timeout: float) -> Any:
+        import json
+        import subprocess
+        from urllib.parse import urlencode
+        url = f"{self.url}{path}"
+        command = ['curl', '-s', '--max-time', str(timeout), '-X', http_method]
+        if http_method == 'GET':
+            if params:
+                url = f"{url}?{urlencode(params)}"
+        else:
+            command += ['-H', 'Content-Type: application/json', '-d', json.dumps(params)]
+        command.append(url)
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=timeout + 1)
+        except subprocess.TimeoutExpired as e:
+            raise MoonrakerApiError("Curl command timed out / Délai d'attente expiré pour curl") from e
+        except OSError as e:
+            raise MoonrakerApiError(f"Error executing curl command: {str(e)}") from e
+        if result.returncode != 0:
+            raise MoonrakerApiError(f"Curl command failed (code {result.returncode}): {result.stderr}")
+        try:
+            data = json.loads(result.stdout)
+        except json.JSONDecodeError as e:
+            raise MoonrakerApiError(f"Invalid JSON from Moonraker ({len(result.stdout)} bytes): {str(e)}") from e
+        if isinstance(data, dict):
+            if 'error' in data:
+                error = data['error']
+                raise MoonrakerApiError(f"Moonraker API error: {error}",
+                                        error.get('code') if isinstance(error, dict) else None)
+            return data.get('result', data)
+        return data
+
+    def send_event(self, event: str, data: Dict[str, Any], version: str = "unknown",
+                   timeout: float = 1.0) -> bool:
+        """
+        Broadcast an event to Moonraker's clients as notify_agent_event.
+        
+        Agents need a persistent connection, so this only works over the
+        Unix socket. The connection identifies itself as the
+        'auto_power_off' agent the first time.
+        
+        Args:
+            event: Event name, e.g. 'armed'
+            data: JSON payload
+            version: Version reported when identifying
+            timeout: Timeout in seconds of each call
+            
+        Returns:
+            bool: False if the socket is not available, True once sent
+            
+        Raises:
+            MoonrakerApiError: If Moonraker cannot be reached or returns an error
+        """
+        if not (self.socket_path and os.path.exists(self.socket_path)):
+            return False
+        try:
+            if self._sock is None or not self._identified:
+                self._call_unix('server.connection.identify', {
+                    'client_name': 'auto_power_off', 'version': version, 'type': 'agent',
+                    'url': 'https://github.com/JayceeB1/Klipper-Auto-Power-Off'}, timeout)
+                self._identified = True
+            self._call_unix('connection.send_event', {'event': event, 'data': data}, timeout)
+        except MoonrakerApiError:
+            raise
+        except (OSError, ValueError) as e:
+            self.close()
+            raise MoonrakerApiError(f"Moonraker socket unusable for events: {str(e)}") from e
+        return True
+
+    def close(self) -> None:
+        """Close the persistent socket connection / Ferme la connexion au socket"""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._identified = False
+
+
+class MoonrakerEventSender:
+    """
+    Forwards events to Moonraker clients from a worker thread.
+    Relaie les événements aux clients Moonraker depuis un thread.
+
+    The reactor only queues the event. The worker owns its own agent
+    connection, so identify and send_event round trips never block
+    Klipper, and reports each outcome back through register_async_callback.
+    At most MAX_PENDING events wait; while Moonraker is slow the oldest
+    ones are dropped.
+    """
+    MAX_PENDING = 32
+
+    def __init__(self, reactor, client: MoonrakerClient,
+                 on_result: Callable[[float, Optional[bool], Optional[str]], None]):
+        """
+        Args:
+            reactor: Klipper reactor
+            client: Moonraker client used only by the worker thread
+            on_result: Called in the reactor as on_result(eventtime, sent, error):
+                sent is False without the Unix socket, error is None on success
+        """
+        self.reactor = reactor
+        self.client = client
+        self.on_result = on_result
+        self._pending: Deque[Tuple[str, Dict[str, Any], str]] = deque(maxlen=self.MAX_PENDING)
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def send(self, event: str, data: Dict[str, Any], version: str) -> None:
+        """Queue an event, starting the worker on first use / Met un événement en file"""
+        with self._cond:
+            if self._stopping:
+                return
+            self._pending.append((event, data, version))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="auto_power_off-moonraker-events",
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopping)
+                if self._stopping:
+                    break
+                event, data, version = self._pending.popleft()
+            sent, error = None, None
+            try:
+                sent = self.client.send_event(event, data, version)
+            except MoonrakerApiError as e:
+                error = str(e)
+            except Exception as e:
+                error = f"Moonraker event error: {str(e)}"
+            self.reactor.register_async_callback(
+                lambda eventtime, sent=sent, error=error: self.on_result(eventtime, sent, error))
+        self.client.close()
+
+    def close(self) -> None:
+        """Stop the worker and drop the events still queued / Arrête le thread"""
+        with self._cond:
+            self._stopping = True
+            self._pending.clear()
+            self._cond.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(self.client.timeout)
+        else:
+            self.client.close()
+
+
+class DecisionJournal:
+    """
+    Append-only journal of the power off decisions, as JSON Lines.
+    Journal des décisions d'extinction en ajout seul, au format JSON Lines.
+
+    Entries are kept in a bounded in-memory ring for OPTION=HISTORY and
+    written to disk in batches: when batch_size entries are pending, when
+    the flush timer fires, or right away with flush=True. Once the file
+    exceeds max_bytes it is compressed to <file>.1.gz and older archives are
+    shifted, keeping at most `backups` of them. Each line is a standalone
+    JSON object, so external tools can read the file with any JSON parser.
+    """
+    def __init__(self, reactor, path: Optional[str], max_bytes: int = 1048576,
+                 backups: int = 3, memory_entries: int = 200,
+                 batch_size: int = 32, flush_interval: float = 30.):
+        self.reactor = reactor
+        self.path = os.path.expanduser(path) if path else None
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.entries = deque(maxlen=memory_entries)
+        self._pending: List[str] = []
+        self._timer = None
+
+    def record(self, decision: Decision, flush: bool = False, **fields) -> Dict[str, Any]:
+        """
+        Append a decision.
+        
+        Args:
+            decision: The verdict
+            flush: Write the pending batch to disk immediately
+            **fields: Context of the decision (temperatures, outcome, ...)
+            
+        Returns:
+            dict: The recorded entry
+        """
+        import json
+        entry = {'time': round(time.time(), 1), 'decision': decision.value}
+        entry.update(fields)
+        self.entries.append(entry)
+        if self.path is None:
+            return entry
+        self._pending.append(json.dumps(entry, separators=(',', ':')))
+        if flush or len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.reactor.register_timer(
+                self._handle_flush_timer, self.reactor.monotonic() + self.flush_interval)
+        else:
+            self.reactor.update_timer(self._timer, self.reactor.monotonic() + self.flush_interval)
+        return entry
+
+    def _handle_flush_timer(self, eventtime: float) -> float:
+        self.flush()
+        return self.reactor.NEVER
+
+    def flush(self) -> None:
+        """Write pending entries and rotate if needed / Écrit les entrées en attente"""
+        if not self._pending or self.path is None:
+            return
+        lines, self._pending = self._pending, []
+        try:
+            with open(self.path, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+                size = f.tell()
+            if size > self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            logging.getLogger('auto_power_off').warning(
+                f"Decision journal disabled, cannot write {self.path}: {str(e)} / Journal des décisions désactivé")
+            self.path = None
+
+    def _rotate(self) -> None:
+        import gzip
+        import shutil
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}.gz"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}.gz")
+        if self.backups > 0:
+            with open(self.path, 'rb') as src, gzip.open(f"{self.path}.1.gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+
+    def query(self, count: int = 10, decision: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get the latest entries from memory.
+        
+        Args:
+            count: Maximum number of entries
+            decision: Only return entries with this verdict
+            
+        Returns:
+            list: Entries, oldest first
+        """
+        entries = [e for e in self.entries if decision is None or e['decision'] == decision]
+        return entries[-count:] if count > 0 else []
+
+
+class StateFile:
+    """
+    Small JSON document kept across Klipper restarts.
+    Petit document JSON conservé entre les redémarrages de Klipper.
+
+    The file is read on first access and written atomically (temporary file
+    synced to disk, then renamed), so a power cut while saving never leaves
+    it truncated.
+    """
+    def __init__(self, path: Optional[str]):
+        self.path = os.path.expanduser(path) if path else None
+        self._data: Optional[Dict[str, Any]] = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = {}
+            if self.path and os.path.exists(self.path):
+                import json
+                try:
+                    with open(self.path, 'r') as f:
+                        data = json.load(f)
+                    if isinstance(data, dict):
+                        self._data = data
+                except (OSError, ValueError) as e:
+                    logging.getLogger('auto_power_off').warning(
+                        f"Ignoring unreadable state file {self.path}: {str(e)} / Fichier d'état illisible ignoré")
+        return self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._load().get(key, default)
+
+    def set(self, key: str, value: Any, save: bool = True) -> None:
+        data = self._load()
+        if value is None:
+            data.pop(key, None)
+        else:
+            data[key] = value
+        if save:
+            self.save()
+
+    def save(self) -> bool:
+        """
+        Write the document to disk.
+        
+        Returns:
+            bool: True if the file was written
+        """
+        if not self.path:
+            return False
+        import json
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._load(), f, separators=(',', ':'))
+                # The data must be on disk before the rename / Données sur disque avant le renommage
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logging.getLogger('auto_power_off').warning(
+                f"Could not save state file {self.path}: {str(e)} / Impossible d'enregistrer le fichier d'état")
+            return False
+
+
+class IdleGapLearner:
+    """
+    Learns an idle timeout from the gaps between the end of a print and the
+    start of the next one. / Apprend un délai d'inactivité à partir des
+    intervalles entre la fin d'une impression et le début de la suivante.
+
+    The day is split into time-of-day buckets. Each bucket holds a histogram
+    of gap durations on log-spaced bins, and older samples decay each time a
+    new one arrives, so memory stays constant and recent habits win. For each
+    bucket the timeout T minimizing the expected cost is kept:
+
+        cost(T) = sum over gaps g <= T of g  +  sum over gaps g > T of (T + C)
+
+    where C (power_cycle_cost) is what one power cycle (PSU start, MCU
+    reconnect, homing, reheating) is worth in seconds of idle time. This is
+    recomputed only for the bucket that received the sample.
+    """
+    MIN_GAP = 30.
+    MAX_GAP = 86400.
+    BINS = 32
+
+    def __init__(self, buckets: int = 6, power_cycle_cost: float = 600.,
+                 min_samples: float = 5., decay: float = 0.95):
+        self.power_cycle_cost = power_cycle_cost
+        self.min_samples = min_samples
+        self.decay = decay
+        self._log_ratio = math.log(self.MAX_GAP / self.MIN_GAP) / (self.BINS - 1)
+        self.edges = [self.MIN_GAP * math.exp(self._log_ratio * i) for i in range(self.BINS)]
+        self.weights = [[0.] * self.BINS for _ in range(buckets)]
+        self.samples = [0] * buckets
+        self.suggestions: List[Optional[float]] = [None] * buckets
+        # Hour of the last suggestion() and its bucket / Heure de la dernière suggestion et son créneau
+        self._hour_start = self._hour_end = 0.
+        self._hour_bucket = 0
+
+    def bucket_for(self, wall_time: float) -> int:
+        return time.localtime(wall_time).tm_hour * len(self.weights) // 24
+
+    def add_gap(self, gap: float, started_at: float) -> None:
+        """
+        Record a gap.
+        
+        Args:
+            gap: Seconds between the end of a print and the start of the next
+            started_at: Wall clock time at which the gap started (print end)
+        """
+        bucket = self.bucket_for(started_at)
+        index = math.ceil(math.log(min(max(gap, self.MIN_GAP), self.MAX_GAP) / self.MIN_GAP) / self._log_ratio)
+        weights = self.weights[bucket]
+        for i in range(self.BINS):
+            weights[i] *= self.decay
+        weights[min(index, self.BINS - 1)] += 1.
+        self.samples[bucket] += 1
+        self.suggestions[bucket] = self._solve(weights, self.samples[bucket])
+
+    def _solve(self, weights: List[float], samples: int) -> Optional[float]:
+        if samples < self.min_samples:
+            return None
+        total = sum(weights)
+        best_cost, best = None, None
+        covered_weight = covered_idle = 0.
+        for k, edge in enumerate(self.edges):
+            covered_weight += weights[k]
+            covered_idle += weights[k] * edge
+            cost = covered_idle + (total - covered_weight) * (edge + self.power_cycle_cost)
+            if best_cost is None or cost < best_cost:
+                best_cost, best = cost, edge
+        return best
+
+    def suggestion(self, wall_time: float) -> Optional[float]:
+        # Called on every status query: time.localtime() only runs once an hour
+        # Appelée à chaque requête d'état : time.localtime() une fois par heure
+        if not self._hour_start <= wall_time < self._hour_end:
+            local = time.localtime(wall_time)
+            self._hour_start = wall_time - local.tm_min * 60 - local.tm_sec - wall_time % 1.
+            self._hour_end = self._hour_start + 3600.
+            self._hour_bucket = local.tm_hour * len(self.weights) // 24
+        return self.suggestions[self._hour_bucket]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'weights': [[round(w, 4) for w in bucket] for bucket in self.weights],
+                'samples': list(self.samples)}
+
+    def load(self, data: Optional[Dict[str, Any]]) -> None:
+        """Restore saved histograms, ignoring a different layout / Restaure les histogrammes"""
+        weights = (data or {}).get('weights')
+        samples = (data or {}).get('samples')
+        if (not isinstance(weights, list) or len(weights) != len(self.weights)
+                or any(len(bucket) != self.BINS for bucket in weights)
+                or not isinstance(samples, list) or len(samples) != len(self.weights)):
+            return
+        self.weights = [[float(w) for w in bucket] for bucket in weights]
+        self.samples = [int(n) for n in samples]
+        self.suggestions = [self._solve(bucket, n) for bucket, n in zip(self.weights, self.samples)]
+
+
+def parse_history_tiers(value: str) -> List[Tuple[float, float]]:
+    """
+    Parse temp_history, e.g. "1:600, 10:7200, 60:86400" (step:span in seconds).
+    Analyse temp_history (pas:durée en secondes).
+    
+    Raises:
+        ValueError: If a tier is malformed, or steps are not increasing
+    """
+    tiers: List[Tuple[float, float]] = []
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        try:
+            step, span = (float(part) for part in item.split(':'))
+        except ValueError:
+            raise ValueError(f"'{item.strip()}' is not step:span")
+        if step <= 0. or span < step:
+            raise ValueError(f"'{item.strip()}': step must be positive and span at least one step")
+        if tiers and step <= tiers[-1][0]:
+            raise ValueError("temp_history steps must be increasing")
+        tiers.append((step, span))
+    return tiers
+
+
+class HistoryTier:
+    """
+    One resolution of the temperature history: a ring of averages over step seconds.
+    Une résolution de l'historique : un anneau de moyennes sur step secondes.
+    """
+    __slots__ = ('step', 'size', 'times', 'values', 'sums', 'counts', 'bucket', 'head', 'length')
+
+    def __init__(self, step: float, span: float, sensors: int):
+        self.step = step
+        self.size = int(span // step)
+        self.times = array('d', bytes(8 * self.size))
+        self.values = [array('d', bytes(8 * self.size)) for _ in range(sensors)]
+        self.sums = array('d', bytes(8 * sensors))
+        self.counts = array('l', bytes(array('l').itemsize * sensors))
+        self.bucket: Optional[int] = None
+        self.head = 0
+        self.length = 0
+
+    def add(self, eventtime: float, values: Tuple[float, ...]) -> None:
+        bucket = int(eventtime // self.step)
+        if bucket != self.bucket:
+            if self.bucket is not None:
+                self._close()
+            self.bucket = bucket
+        sums, counts = self.sums, self.counts
+        for i in range(len(values)):
+            value = values[i]
+            if value == value:  # NaN: sensor not read / capteur non lu
+                sums[i] += value
+                counts[i] += 1
+
+    def _close(self) -> None:
+        """Store the average of the finished bucket / Enregistre la moyenne du créneau terminé"""
+        head = self.head
+        self.times[head] = self.bucket * self.step
+        sums, counts = self.sums, self.counts
+        for i in range(len(self.values)):
+            self.values[i][head] = sums[i] / counts[i] if counts[i] else math.nan
+            sums[i] = 0.
+            counts[i] = 0
+        self.head = (head + 1) % self.size
+        if self.length < self.size:
+            self.length += 1
+
+
+class TemperatureHistory:
+    """
+    Fixed-memory temperature history at several resolutions.
+    Historique des températures à mémoire fixe, sur plusieurs résolutions.
+
+    Every sample is averaged into each tier (e.g. 1 s over 10 min, 10 s over
+    2 h, 1 min over 24 h). The ring buffers are allocated once at startup, so
+    memory does not depend on uptime and adding a sample allocates nothing.
+    A query walks a single tier back from its newest point, so it costs
+    O(points returned). Times are reactor event times.
+    """
+    SENSORS = ('hotend', 'bed', 'chamber')
+
+    def __init__(self, tiers: List[Tuple[float, float]]):
+        self.tiers = [HistoryTier(step, span, len(self.SENSORS)) for step, span in tiers]
+
+    def add(self, eventtime: float, *values: float) -> None:
+        """
+        Record one reading per sensor, in SENSORS order (NaN when not read).
+        """
+        for tier in self.tiers:
+            tier.add(eventtime, values)
+
+    def select(self, eventtime: float, resolution: Optional[float] = None,
+               since: Optional[float] = None) -> HistoryTier:
+        """
+        Pick the tier to answer a query from.
+        
+        With a resolution, the finest tier at least that coarse; otherwise the
+        finest tier reaching back to since. The coarsest tier when none fits.
+        """
+        for tier in self.tiers:
+            if resolution is not None:
+                if tier.step >= resolution:
+                    return tier
+            elif since is None or tier.size * tier.step >= eventtime - since:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, eventtime: float, resolution: Optional[float] = None,
+              since: Optional[float] = None, count: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Get the newest points of one tier, oldest first.
+        
+        Args:
+            eventtime: Current event time
+            resolution: Wanted seconds between points
+            since: Oldest event time to return
+            count: Maximum number of points
+            
+        Returns:
+            dict: step, time (event times) and temps (one list per sensor
+            that has readings, None where a bucket had none)
+        """
+        tier = self.select(eventtime, resolution, since)
+        limit = tier.length if count is None else min(count, tier.length)
+        times: List[float] = []
+        columns: List[List[Optional[float]]] = [[] for _ in self.SENSORS]
+        index = tier.head
+        while len(times) < limit:
+            index = (index - 1) % tier.size
+            stamp = tier.times[index]
+            if since is not None and stamp < since:
+                break
+            times.append(stamp)
+            for column, values in zip(columns, tier.values):
+                value = values[index]
+                column.append(round(value, 2) if value == value else None)
+        times.reverse()
+        temps = {}
+        for name, column in zip(self.SENSORS, columns):
+            if any(value is not None for value in column):
+                column.reverse()
+                temps[name] = column
+        return {'step': tier.step, 'time': times, 'temps': temps}
+
+
+class EventPayload:
+    """
+    Payload of the auto_power_off:* events / Contenu des événements auto_power_off:*.
+
+    Handlers registered with printer.register_event_handler() receive it as
+    their only argument. deadline is the Unix time of the next check (None
+    once stopped), reason the Decision value or command behind a postpone or
+    cancel, method the power off method. temps is shared with the status and
+    must not be modified.
+    """
+    __slots__ = ('event', 'time', 'deadline', 'reason', 'method', 'dry_run', 'temps')
+
+    def __init__(self, event: PowerOffEvent, time: float, deadline: Optional[float],
+                 reason: Optional[str], method: Optional[str], dry_run: bool, temps: Dict[str, float]):
+        self.event = event
+        self.time = time
+        self.deadline = deadline
+        self.reason = reason
+        self.method = method
+        self.dry_run = dry_run
+        self.temps = temps
+
+    def as_dict(self) -> Dict[str, Any]:
+        """JSON form sent to Moonraker clients / Forme JSON envoyée aux clients Moonraker"""
+        return {'event': self.event.value, 'time': self.time, 'deadline': self.deadline,
+                'reason': self.reason, 'method': self.method, 'dry_run': self.dry_run,
+                'temps': dict(self.temps)}
+
+
+class Veto:
+    """
+    Why a condition keeps the printer on / Raison pour laquelle une condition garde l'imprimante allumée.
+
+    A veto with cancel=True stops the countdown (a print started); otherwise
+    the power off is postponed and checked again later.
+    """
+    __slots__ = ('decision', 'message', 'cancel', 'fields')
+
+    def __init__(self, decision: Decision, message: str, cancel: bool = False, **fields):
+        self.decision = decision
+        self.message = message
+        self.cancel = cancel
+        self.fields = fields
+
+
+class PowerOffCondition(ABC):
+    """
+    Base class of the checks that must pass before a power off.
+    Classe de base des vérifications préalables à l'extinction.
+
+    check() returns None to allow the power off, or a Veto. The pipeline
+    runs conditions from the cheapest to the most expensive and stops at the
+    first veto, so remote queries only run once every local check passed.
+    `cost` starts at the declared estimate and then follows the measured
+    evaluation time (seconds); a result is reused for `ttl` seconds.
+    Conditions of a lower `tier` always run first, whatever their cost:
+    print_state is in tier 0, so a print cancels the countdown instead of
+    being hidden behind a cheaper veto that only postpones it.
+    Other Klipper extras add their own with AutoPowerOff.register_condition().
+    """
+    name: str = "condition"
+    cost: float = 0.0001
+    ttl: float = 0.
+    tier: int = 1
+
+    def __init__(self):
+        self.expires = -1.
+        self.result: Optional[Veto] = None
+        self.evaluations = 0
+
+    @abstractmethod
+    def check(self, eventtime: float) -> Optional[Veto]:
+        """
+        Evaluate the condition.
+        
+        Args:
+            eventtime: Current event time from Klipper
+            
+        Returns:
+            Veto or None: None when the power off may go ahead
+        """
+
+
+class PrintStateCondition(PowerOffCondition):
+    """Klipper's print_stats and gcode_move: a print cancels the countdown"""
+    name = "print_state"
+    tier = 0
+
+    def __init__(self, owner: 'AutoPowerOff'):
+        super().__init__()
+        self.owner = owner
+
+    def check(self, eventtime: float) -> Optional[Veto]:
+        owner = self.owner
+        if not owner._is_mcu_connected():
+            return Veto(Decision.NOT_IDLE, owner.get_text("printer_not_idle"), state='unknown')
+        try:
+            print_stats = owner.printer.lookup_object('print_stats', None)
+            if print_stats:
+                state = print_stats.get_status(eventtime)['state']
+                if state in ('printing', 'paused'):
+                    return Veto(Decision.PRINTING, owner.get_text("print_in_progress"), cancel=True, state=state)
+        except Exception as e:
+            owner._diagnostic_log("Error checking print_stats: %s", e, level="warning")
+        try:
+            gcode_move = owner.printer.lookup_object('gcode_move')
+            if gcode_move and gcode_move.get_status(eventtime).get('is_printing', False):
+                return Veto(Decision.PRINTING, owner.get_text("print_in_progress"), cancel=True, state='printing')
+        except Exception as e:
+            owner._diagnostic_log("Error checking gcode_move: %s", e, level="warning")
+        return None
+
+
+class IdleCondition(PowerOffCondition):
+    """Klipper's idle_timeout must report Idle"""
+    name = "idle"
+
+    def __init__(self, owner: 'AutoPowerOff'):
+        super().__init__()
+        self.owner = owner
+
+    def check(self, eventtime: float) -> Optional[Veto]:
+        state = PrinterState.UNKNOWN
+        try:
+            idle_state = self.owner.printer.lookup_object('idle_timeout').get_status(eventtime)['state']
+            state = PrinterState.IDLE if idle_state == 'Idle' else PrinterState.BUSY
+        except Exception as e:
+            self.owner._diagnostic_log("Error checking idle_timeout: %s", e, level="warning")
+        if state == PrinterState.IDLE:
+            return None
+        return Veto(Decision.NOT_IDLE, self.owner.get_text("printer_not_idle"), state=state.name.lower())
+
+
+class TemperatureCondition(PowerOffCondition):
+    """Monitored temperatures must be below temp_threshold"""
+    name = "temperature"
+    cost = 0.0002
+
+    def __init__(self, owner: 'AutoPowerOff'):
+        super().__init__()
+        self.owner = owner
+
+    def check(self, eventtime: float) -> Optional[Veto]:
+        owner = self.owner
+        temps = owner._monitored_temps(eventtime)
+        published = owner._status_temps(temps)
+        if published != owner.runtime.temps:
+            owner.runtime.temps = published
+        max_temp = max(temps.values(), default=0.)
+        if max_temp <= owner.temp_threshold:
+            return None
+        temp_msg = ", ".join(f"{key}: {value:.1f}°C" for key, value in temps.items())
+        return Veto(Decision.TEMPERATURE,
+                    owner.get_text("temperatures_too_high_custom", temp_msg=temp_msg, max_temp=max_temp),
+                    temps=owner._rounded_temps(temps), threshold=owner.temp_threshold)
+
+
+class StatusFieldCondition(PowerOffCondition):
+    """
+    A field of a Klipper object keeps the printer on while it has a given
+    value, e.g. `gcode_button door.state = PRESSED` or
+    `gcode_macro KEEP_ON.active = True` (keep_on_when).
+    """
+    def __init__(self, owner: 'AutoPowerOff', object_name: str, field: str, value: str):
+        super().__init__()
+        self.owner = owner
+        self.object_name = object_name
+        self.field = field
+        self.value = value.lower()
+        self.name = f"{object_name}.{field}"
+
+    @classmethod
+    def parse(cls, owner: 'AutoPowerOff', line: str) -> 'StatusFieldCondition':
+        """
+        Build a condition from an `<object>.<field> = <value>` line.
+        
+        Raises:
+            ValueError: If the line is malformed
+        """
+        target, sep, value = line.partition('=')
+        object_name, dot, field = target.strip().rpartition('.')
+        if not sep or not dot or not object_name or not field or not value.strip():
+            raise ValueError(f"'{line.strip()}' is not <object>.<field> = <value>")
+        return cls(owner, object_name.strip(), field.strip(), value.strip())
+
+    def check(self, eventtime: float) -> Optional[Veto]:
+        obj = self.owner.printer.lookup_object(self.object_name, None)
+        if obj is None or not hasattr(obj, 'get_status'):
+            return None
+        actual = obj.get_status(eventtime).get(self.field)
+        if actual is None or str(actual).lower() != self.value:
+            return None
+        return Veto(Decision.CONDITION,
+                    self.owner.get_text("condition_keeps_on", condition=self.name, value=actual),
+                    condition=self.name, value=actual)
+
+
+class MoonrakerPrintCondition(PowerOffCondition):
+    """Print state seen by Moonraker: a print cancels the countdown"""
+    name = "moonraker_print_state"
+    cost = 0.05
+    ttl = 10.
+
+    def __init__(self, owner: 'AutoPowerOff'):
+        super().__init__()
+        self.owner = owner
+
+    def check(self, eventtime: float) -> Optional[Veto]:
+        try:
+            state = self.owner._check_print_status_via_moonraker()
+        except MoonrakerApiError as e:
+            self.owner._diagnostic_log("Error checking Moonraker: %s", e, level="warning")
+            return None
+        if state in ('printing', 'paused'):
+            return Veto(Decision.PRINTING, self.owner.get_text("print_in_progress"), cancel=True, state=state)
+        return None
+
+
+class JobQueueCondition(PowerOffCondition):
+    """Jobs waiting in Moonraker's queue keep the printer on"""
+    name = "job_queue"
+    cost = 0.05
+    ttl = 30.
+
+    def __init__(self, owner: 'AutoPowerOff'):
+        super().__init__()
+        self.owner = owner
+
+    def check(self, eventtime: float) -> Optional[Veto]:
+        runtime = self.owner.runtime
+        runtime.queued_jobs = self.owner._check_job_queue()
+        if not runtime.queued_jobs:
+            return None
+        return Veto(Decision.JOBS_QUEUED, self.owner.get_text("jobs_queued", count=runtime.queued_jobs),
+                    queued_jobs=runtime.queued_jobs)
+
+
+class ConditionPipeline:
+    """
+    Runs the power off conditions cheapest first, stopping at the first veto.
+    Exécute les conditions de la moins coûteuse à la plus coûteuse.
+
+    The order is by tier, then by measured cost within a tier, so timing
+    noise never decides whether a veto cancels or postpones.
+    """
+    # Weight of the latest measure in the cost average / Poids de la dernière mesure
+    COST_SMOOTHING = 0.2
+
+    def __init__(self):
+        self.conditions: List[PowerOffCondition] = []
+
+    def register(self, condition: PowerOffCondition) -> None:
+        if any(c.name == condition.name for c in self.conditions):
+            raise ValueError(f"Condition '{condition.name}' is already registered")
+        self.conditions.append(condition)
+
+    def evaluate(self, eventtime: float) -> Optional[Veto]:
+        """
+        Run the conditions until one vetoes.
+        
+        Args:
+            eventtime: Current event time from Klipper
+            
+        Returns:
+            Veto or None: The first veto, None when every condition passed
+        """
+        self.conditions.sort(key=self._order)
+        for condition in self.conditions:
+            if eventtime >= condition.expires:
+                start = time.perf_counter()
+                condition.result = condition.check(eventtime)
+                elapsed = time.perf_counter() - start
+                condition.cost = (elapsed if condition.evaluations == 0 else
+                                  condition.cost + self.COST_SMOOTHING * (elapsed - condition.cost))
+                condition.evaluations += 1
+                condition.expires = eventtime + condition.ttl
+            if condition.result is not None:
+                return condition.result
+        return None
+
+    def invalidate(self) -> None:
+        """Forget cached results, e.g. after a settings change / Oublie les résultats en cache"""
+        for condition in self.conditions:
+            condition.expires = -1.
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Conditions in evaluation order with their cost / Conditions dans l'ordre d'évaluation"""
+        return [{'name': c.name, 'cost_ms': round(c.cost * 1000., 3), 'ttl': c.ttl,
+                 'evaluations': c.evaluations,
+                 'veto': c.result.decision.value if c.result is not None else None}
+                for c in sorted(self.conditions, key=self._order)]
+
+    @staticmethod
+    def _order(condition: PowerOffCondition) -> Tuple[int, float]:
+        return condition.tier, condition.cost
+
+
+class DryRunRecorder:
+    """
+    Timeline of a simulated shutdown / Chronologie d'une extinction simulée.
+
+    The real shutdown sequence runs against mock backends; the recorder keeps
+    the wall time spent in each phase, plus the simulated time: delays that
+    were not slept and the latency measured for each backend beforehand.
+    Their sum predicts how long a real shutdown would take.
+    """
+    BACKENDS = ('plug', 'mqtt', 'moonraker', 'direct')
+    PROBE_BUDGET = 1.0  # Real seconds all the probes may take together / Durée réelle totale des sondes
+
+    def __init__(self, failures: Optional[Set[str]] = None):
+        self.failures = set(failures or ())
+        self.latencies: Dict[str, float] = {}
+        self.unavailable: Dict[str, str] = {}
+        self.network_result = 0  # connect_ex() result of the network device probe / Résultat de la sonde réseau
+        self.phases: List[List[Any]] = []  # [name, wall seconds, simulated seconds]
+        self.calls: List[str] = []
+        self.notifications: List[str] = []
+        self.simulated = 0.
+        self.succeeded: Optional[str] = None  # Backend whose command went through / Backend dont la commande a abouti
+        self._mark: Optional[float] = None
+
+    def phase(self, name: str) -> None:
+        """Close the current phase and start a new one / Termine la phase en cours et en commence une autre"""
+        now = time.perf_counter()
+        if self.phases and self._mark is not None:
+            self.phases[-1][1] += now - self._mark
+        self.phases.append([name, 0., 0.])
+        self._mark = now
+
+    def finish(self) -> None:
+        if self.phases and self._mark is not None:
+            self.phases[-1][1] += time.perf_counter() - self._mark
+        self._mark = None
+
+    def wait(self, seconds: float) -> None:
+        """Count a delay instead of sleeping / Compte un délai au lieu de l'attendre"""
+        self.simulated += seconds
+        if self.phases:
+            self.phases[-1][2] += seconds
+
+    def call(self, backend: str, action: str, error_type: Type[Exception] = PowerOffError) -> None:
+        """
+        Record a backend command and add its measured latency.
+        
+        Raises:
+            error_type: If the backend is in failures or was unreachable when probed
+        """
+        self.calls.append(f"{backend} {action}")
+        self.wait(self.latencies.get(backend, 0.))
+        if backend in self.failures:
+            raise error_type(f"{backend} failure injected by dry run")
+        if backend in self.unavailable:
+            raise error_type(f"{backend} unreachable: {self.unavailable[backend]}")
+        if backend in self.BACKENDS:
+            self.succeeded = backend
+
+    def report(self, outcome: str) -> Dict[str, Any]:
+        phases = [{'name': name, 'wall_ms': round(wall * 1000., 1), 'simulated_ms': round(simulated * 1000., 1)}
+                  for name, wall, simulated in self.phases]
+        predicted = sum(wall + simulated for _, wall, simulated in self.phases)
+        return {'outcome': outcome, 'predicted_latency': round(predicted, 3), 'phases': phases,
+                'calls': list(self.calls), 'failures': sorted(self.failures),
+                'unreachable': dict(self.unavailable), 'notifications': list(self.notifications)}
+
+
+class DryRunPlug:
+    """Smart plug stand-in reporting the plug switched / Prise simulée"""
+    def __init__(self, real: PlugDriver, recorder: DryRunRecorder):
+        self.method = real.method
+        self.recorder = recorder
+
+    def set_power(self, on: bool) -> bool:
+        self.recorder.call('plug', 'on' if on else 'off', NetworkDeviceError)
+        return on
+
+
+class DryRunMqtt:
+    """MQTT stand-in confirming commands synchronously / MQTT simulé, confirmation immédiate"""
+    def __init__(self, real: 'MqttPowerClient', recorder: DryRunRecorder, reactor):
+        self.method = real.method
+        self.recorder = recorder
+        self.reactor = reactor
+
+    def set_power(self, on: bool) -> None:
+        self.recorder.call('mqtt', 'on' if on else 'off', NetworkDeviceError)
+
+    def request_power(self, on: bool, callback: Callable[[float, Optional[str]], None]) -> None:
+        try:
+            self.set_power(on)
+            error = None
+        except NetworkDeviceError as e:
+            error = str(e)
+        callback(self.reactor.monotonic(), error)
+
+
+class DryRunMoonraker:
+    """Moonraker stand-in answering device commands with the requested state / Moonraker simulé"""
+    def __init__(self, real: 'MoonrakerClient', recorder: DryRunRecorder):
+        self.transport = real.transport
+        self.socket_path = real.socket_path
+        self.recorder = recorder
+
+    def call(self, rpc_method: str, http_method: str, path: str,
+             params: Optional[Dict[str, Any]] = None, timeout: float = 5.) -> Any:
+        params = params or {}
+        self.recorder.call('moonraker', f"{rpc_method.rsplit('.', 1)[-1]} {params.get('action', '')}".strip(),
+                           MoonrakerApiError)
+        if 'device' in params:
+            return {params['device']: params.get('action', 'off')}
+        return {}
+
+
+class DryRunPowerObject:
+    """Klipper power object stand-in / Objet d'alimentation Klipper simulé"""
+    def __init__(self, recorder: DryRunRecorder):
+        self.recorder = recorder
+
+    def set_power(self, value: int) -> None:
+        self.recorder.call('direct', f"set_power({value})")
+
+    def turn_off(self) -> None:
+        self.recorder.call('direct', "turn_off()")
+
+    def power_off(self) -> None:
+        self.recorder.call('direct', "power_off()")
+
+
+def parse_bool(value: Any) -> bool:
+    """Parse 1/0, true/false, yes/no, on/off / Analyse une valeur booléenne"""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"'{value}' is not a boolean")
+
+
+# Settings that AUTO_POWEROFF_SET can change without a restart:
+# name -> (parser, check, description of the valid range)
+# Réglages modifiables sans redémarrage : nom -> (analyse, contrôle, plage valide)
+RUNTIME_SETTINGS: Dict[str, Tuple[Callable[[Any], Any], Callable[[Any], bool], str]] = {
+    'idle_timeout': (float, lambda v: v > 0., "a number of seconds above 0"),
+    'temp_threshold': (float, lambda v: 0. <= v <= 300., "between 0 and 300"),
+    'power_device': (str, lambda v: bool(v.strip()), "a device name"),
+    'monitor_hotend': (parse_bool, lambda v: True, "0 or 1"),
+    'monitor_bed': (parse_bool, lambda v: True, "0 or 1"),
+    'monitor_chamber': (parse_bool, lambda v: True, "0 or 1"),
+    'power_off_retries': (int, lambda v: v >= 1, "an integer of at least 1"),
+    'power_off_retry_delay': (int, lambda v: v >= 0, "an integer of at least 0"),
+}
+
+
+class StatusExport:
+    """
+    Fixed-layout status record in a memory-mapped file, for local readers.
+    Enregistrement d'état à format fixe dans un fichier mappé en mémoire.
+
+    Displays and scripts on the same host (KlipperScreen, status LEDs, a
+    shell loop) map the file and read the countdown without going through
+    Moonraker. The record is rewritten in place under a sequence counter
+    (seqlock): the counter is odd while a write is in progress, so a reader
+    copies the record and retries when the counter was odd or changed
+    during its copy. Readers never take a lock and never slow klippy down.
+
+    Layout, little endian, 96 bytes / Format, petit boutiste, 96 octets:
+        0   magic b'APO1', version (H), size (H)
+        8   seq (Q), odd while a write is in progress
+        16  state (16s, NUL padded)
+        32  enabled, active, cooldown_active, dry_run_mode (B each)
+        40  deadline, server_time, hotend, bed, temp_threshold, updated (d,
+            Unix times, NaN when unknown)
+        88  queued_jobs (I)
+    """
+    MAGIC = b'APO1'
+    VERSION = 1
+    HEADER = '<4sHHQ'
+    BODY = '<16sBBBB4xddddddI4x'
+    SEQ_OFFSET = 8
+    BODY_OFFSET = 16
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._body = struct.Struct(self.BODY)
+        self._seq = struct.Struct('<Q')
+        self.size = self.BODY_OFFSET + self._body.size
+        self.seq = 0
+        self._map = None
+
+    def _open(self) -> None:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, self.size)
+            self._map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        struct.pack_into(self.HEADER, self._map, 0, self.MAGIC, self.VERSION, self.size, self.seq)
+
+    def write(self, status: Dict[str, Any]) -> None:
+        """
+        Rewrite the record from a get_status() dict.
+        Réécrit l'enregistrement à partir d'un dict de get_status().
+        """
+        if self.path is None:
+            return
+        try:
+            if self._map is None:
+                self._open()
+            temps = status['current_temps']
+            deadline = status['deadline']
+            hotend = temps.get('hotend')
+            bed = temps.get('bed')
+            self.seq += 1
+            self._seq.pack_into(self._map, self.SEQ_OFFSET, self.seq)
+            self._body.pack_into(
+                self._map, self.BODY_OFFSET,
+                status['state'].encode()[:16],
+                status['enabled'], status['active'], status['cooldown_active'], status['dry_run_mode'],
+                math.nan if deadline is None else deadline,
+                status['server_time'],
+                math.nan if hotend is None else hotend,
+                math.nan if bed is None else bed,
+                status['temp_threshold'],
+                time.time(),
+                status['queued_jobs'])
+            self.seq += 1
+            self._seq.pack_into(self._map, self.SEQ_OFFSET, self.seq)
+        except (OSError, ValueError) as e:
+            logging.getLogger('auto_power_off').warning(
+                f"Status export disabled, cannot write {self.path}: {str(e)} / Export d'état désactivé")
+            self.close()
+            self.path = None
+
+    def close(self) -> None:
+        """Unmap the file, leaving the last record for readers / Libère le mappage"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    @classmethod
+    def read(cls, path: str, retries: int = 100) -> Optional[Dict[str, Any]]:
+        """
+        Take a consistent copy of a status record, as an external reader would.
+        Lit une copie cohérente d'un enregistrement, comme un lecteur externe.
+        
+        Args:
+            path: Path of the export file
+            retries: Attempts before giving up on a record being rewritten
+            
+        Returns:
+            dict: Decoded fields, or None if the file is missing, not a
+            status record, or was being rewritten on every attempt
+        """
+        try:
+            with open(os.path.expanduser(path), 'rb') as f:
+                view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        body = struct.Struct(cls.BODY)
+        header = struct.Struct(cls.HEADER)
+        if len(view) < header.size:
+            view.close()
+            return None
+        magic, version, size, _ = header.unpack_from(view)
+        if magic != cls.MAGIC or version != cls.VERSION or len(view) < size:
+            view.close()
+            return None
+        try:
+            for _ in range(retries):
+                seq = struct.unpack_from('<Q', view, cls.SEQ_OFFSET)[0]
+                if seq & 1:
+                    continue
+                record = body.unpack_from(view, cls.BODY_OFFSET)
+                if struct.unpack_from('<Q', view, cls.SEQ_OFFSET)[0] != seq:
+                    continue
+                fields = ('state', 'enabled', 'active', 'cooldown_active', 'dry_run_mode', 'deadline',
+                          'server_time', 'hotend', 'bed', 'temp_threshold', 'updated', 'queued_jobs')
+                result = dict(zip(fields, record))
+                result['state'] = result['state'].rstrip(b'\0').decode()
+                for key in ('enabled', 'active', 'cooldown_active', 'dry_run_mode'):
+                    result[key] = bool(result[key])
+                result['seq'] = seq
+                return result
+            return None
+        finally:
+            view.close()
+
+
+class ModuleProfiler:
+    """
+    On-demand cProfile and tracemalloc capture of the module's callbacks.
+    Capture cProfile et tracemalloc à la demande des callbacks du module.
+
+    While stopped nothing is wrapped, so there is no overhead. start() swaps
+    the callbacks of the module's reactor timers and its get_status methods
+    for profiled wrappers, and takes a tracemalloc snapshot. stop() restores
+    the originals and writes the statistics, the allocation diff and a
+    .prof file (for snakeviz or pstats) to profile_dir.
+    """
+    # Methods run by the reactor or by status queries / Méthodes appelées par le réacteur
+    CALLBACKS = ('_check_conditions', '_update_temps', '_verify_device_state',
+                 '_track_print_gaps', '_flush_notifications', '_check_cooldown',
+                 '_power_on_switched', '_power_on_restart', '_retry_power_on', '_watch_job_queue',
+                 '_export_status', 'get_status')
+    TIMERS = ('shutdown_timer', '_temps_timer', '_verify_timer', '_gap_timer', '_notify_timer',
+              '_cooldown_timer', '_power_on_timer', '_queue_watch_timer')
+
+    def __init__(self, owner: 'AutoPowerOff', directory: str):
+        self.owner = owner
+        self.directory = os.path.expanduser(directory)
+        self.profile = None
+        self.started_at: Optional[float] = None
+        self._snapshot = None
+        self._started_tracing = False
+        self._in_call = False
+
+    @property
+    def running(self) -> bool:
+        return self.profile is not None
+
+    def _wrap(self, func: Callable) -> Callable:
+        def profiled(*args, **kwargs):
+            if self._in_call or self.profile is None:
+                return func(*args, **kwargs)
+            self._in_call = True
+            try:
+                return self.profile.runcall(func, *args, **kwargs)
+            finally:
+                self._in_call = False
+        profiled.__wrapped__ = func
+        profiled.__name__ = func.__name__
+        return profiled
+
+    def start(self) -> None:
+        """Start profiling / Démarre le profilage"""
+        import cProfile
+        import tracemalloc
+        owner = self.owner
+        self.profile = cProfile.Profile()
+        self.started_at = time.time()
+        for name in self.CALLBACKS:
+            setattr(owner, name, self._wrap(getattr(owner, name)))
+        owner.info.get_status = self._wrap(owner.info.get_status)
+        for name in self.TIMERS:
+            timer = getattr(owner, name, None)
+            callback = getattr(timer, 'callback', None)
+            if callback is not None and getattr(callback, '__name__', None) in self.CALLBACKS:
+                timer.callback = getattr(owner, callback.__name__)
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(10)
+        self._snapshot = tracemalloc.take_snapshot()
+
+    def _restore(self) -> None:
+        owner = self.owner
+        for name in self.TIMERS:
+            timer = getattr(owner, name, None)
+            callback = getattr(timer, 'callback', None)
+            if callback is not None and hasattr(callback, '__wrapped__'):
+                timer.callback = callback.__wrapped__
+        for name in self.CALLBACKS:
+            owner.__dict__.pop(name, None)
+        owner.info.__dict__.pop('get_status', None)
+
+    def stop(self, top: int = 10) -> Tuple[Optional[str], List[str]]:
+        """
+        Stop profiling and write the report.
+        
+        Args:
+            top: Number of entries summarized for the console
+            
+        Returns:
+            tuple: (report path or None if it could not be written, console summary lines)
+        """
+        import io
+        import pstats
+        import tracemalloc
+        self._restore()
+        profile, self.profile = self.profile, None
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),))
+        if self._started_tracing:
+            tracemalloc.stop()
+        allocations = [stat for stat in snapshot.compare_to(self._snapshot, 'lineno') if stat.size_diff]
+        allocations.sort(key=lambda stat: abs(stat.size_diff), reverse=True)
+        self._snapshot = None
+        elapsed = time.time() - (self.started_at or time.time())
+        
+        stream = io.StringIO()
+        profile.create_stats()
+        stats = pstats.Stats(profile, stream=stream) if profile.stats else None
+        entries = []
+        if stats is not None:
+            stats.sort_stats('cumulative').print_stats(40)
+            entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        
+        summary = [f"Profiled {elapsed:.0f}s, {stats.total_calls if stats else 0} calls, "
+                   f"{stats.total_tt * 1000. if stats else 0.:.1f} ms / Profilage de {elapsed:.0f}s"]
+        for (filename, line, function), (cc, nc, tt, ct, callers) in entries[:top]:
+            summary.append(f"{ct * 1000.:9.2f} ms {nc:7d}x {function} ({os.path.basename(filename)}:{line})")
+        for stat in allocations[:min(top, 5)]:
+            frame = stat.traceback[0]
+            summary.append(f"{stat.size_diff / 1024.:+9.1f} KiB {stat.count_diff:+7d} blocks "
+                           f"{os.path.basename(frame.filename)}:{frame.lineno}")
+        
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        base = os.path.join(self.directory, f"auto_power_off_profile_{stamp}")
+        try:
+            with open(base + ".txt", 'w') as f:
+                f.write("\n".join(summary) + "\n\n")
+                f.write(stream.getvalue())
+                f.write("\nAllocation diff since start (tracemalloc) / Différence d'allocations depuis le début\n")
+                for stat in allocations[:50]:
+                    f.write(f"{stat}\n")
+            if stats is not None:
+                stats.dump_stats(base + ".prof")
+        except OSError as e:
+            logging.getLogger('auto_power_off').warning(f"Could not write profile to {base}: {str(e)}")
+            return None, summary
+        return base + ".txt", summary
+
+
+class RuntimeState:
+    """
+    Mutable runtime state of the module / État d'exécution du module.
+
+    The fields live in __slots__: no per-instance __dict__, and the periodic
+    timers only rebind existing slots, so an idle printer does not allocate.
+    temps and status are replaced (never mutated) when a value changes,
+    because Klipper's webhooks detect changes by comparing against the
+    objects returned previously.
+    """
+    __slots__ = ('state', 'countdown_start', 'countdown_end', 'deadline', 'server_time', 'last_activity',
+                 'shutdown_in_progress', 'shutdown_start_time', 'queued_jobs',
+                 'print_active', 'last_print_end', 'temps', 'cooldown_start',
+                 'time_to_threshold', 'last_power_on', 'status', 'breakers',
+                 'sample_interval', 'last_status_query')
+
+    def __init__(self):
+        self.state: str = "init"  # init, on, off, error
+        self.countdown_start: float = 0.  # When the countdown was (re)armed / Début du compte à rebours
+        self.countdown_end: float = 0.  # Reactor time the countdown timer fires / Échéance du minuteur (horloge du réacteur)
+        self.deadline: Optional[float] = None  # Same deadline as a Unix time, None when inactive / Même échéance en temps Unix
+        self.server_time: float = time.time()  # Unix time the deadline was last set / Heure de la dernière modification
+        self.last_activity: float = 0.  # Last G-code activity, written by the dispatch hook / Dernière activité G-code
+        self.shutdown_in_progress: bool = False
+        self.shutdown_start_time: Optional[float] = None
+        self.queued_jobs: int = 0  # Jobs waiting in Moonraker's job queue / Travaux dans la file Moonraker
+        self.print_active: bool = False
+        self.last_print_end: Optional[float] = None  # Wall clock end of the last print / Fin de la dernière impression
+        self.temps: Dict[str, float] = {'hotend': 0., 'bed': 0.}
+        self.cooldown_start: Optional[float] = None  # Reactor time the cooldown assist started / Début du refroidissement assisté
+        self.time_to_threshold: Optional[float] = None  # Seconds the last cooldown took / Durée du dernier refroidissement
+        self.last_power_on: Optional[Dict[str, Any]] = None  # Step timings of the last power on / Durées des étapes du dernier allumage
+        self.status: Optional[Dict[str, Any]] = None  # Last get_status() payload / Dernier statut publié
+        self.breakers: Optional[Dict[str, str]] = None
+        self.sample_interval: float = 1.  # Current period of _update_temps / Période actuelle de _update_temps
+        self.last_status_query: float = 0.  # Last get_status() from Klipper's webhooks / Dernière requête de statut
+
+
+class AutoPowerOffInfo:
+    """
+    Rarely changing module information, published as printer['auto_power_off_info'].
+    Informations du module qui changent rarement, publiées dans printer['auto_power_off_info'].
+
+    UIs read this object once (and again after a restart) while the hot
+    printer['auto_power_off'] object only carries fields that change often.
+    The payload is built once and cached until invalidate() is called.
+    """
+    def __init__(self, owner: 'AutoPowerOff'):
+        self.owner = owner
+        self._status: Optional[Dict[str, Any]] = None
+
+    def invalidate(self) -> None:
+        """Drop the cached payload so the next query rebuilds it / Invalide le cache"""
+        self._status = None
+
+    def get_status(self, eventtime: float) -> Dict[str, Any]:
+        """
+        Get static information for Fluidd/Mainsail API.
+
+        Args:
+            eventtime: Current event time from Klipper
+
+        Returns:
+            dict: Static information for the UI
+        """
+        if self._status is None:
+            owner = self.owner
+            self._status = {
+                'version': owner.get_git_version(),
+                'language': owner.lang,
+                'idle_timeout': int(owner.idle_timeout),
+                'adaptive_idle_timeout': owner.adaptive_idle_timeout,
+                'optimal_method': owner.optimal_method.name if owner.optimal_method else None,
+                'device_capabilities': dict(owner.device_capabilities),
+            }
+        return self._status
+
+
+class AutoPowerOff:
+    def __init__(self, config):
+        # Device state / État du périphérique
+        self.device_state: DeviceState = DeviceState.UNAVAILABLE
+        self.device_capabilities: Dict[str, bool] = {}
+        self.optimal_method: Optional[PowerOffMethod] = None
+        self.force_direct: bool = False
+
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+
+        # Static status object / Objet de statut statique
+        self.info = AutoPowerOffInfo(self)
+
+        # Mutable runtime state / État d'exécution
+        self.runtime = RuntimeState()
+
+        # Set up logging first / Configuration du logging en premier
+        self.logger = logging.getLogger('auto_power_off')
+        self.logger.setLevel(logging.INFO)
+
+        # Language configuration, resolved lazily on first use so that klippy
+        # startup does no filesystem work / Configuration de la langue, résolue
+        # à la première utilisation pour ne pas solliciter le disque au démarrage
+        self._configured_lang: Optional[str] = config.get('language', None)
+        self._lang: Optional[str] = None
+        self.translations: Optional[Dict[str, str]] = None
+
+        # Configuration parameters / Configuration des paramètres
+        self.idle_timeout: float = config.getfloat('idle_timeout', 600.0)  # Idle time in seconds (10 min default) / Temps d'inactivité en secondes (10 min par défaut)
+        self.temp_threshold: float = config.getfloat('temp_threshold', 40.0)  # Temperature threshold in °C / Seuil de température en °C
+        self.power_device: str = config.get('power_device', 'psu_control')  # Name of your power device / Nom du périphérique d'alimentation
+        self.enabled: bool = config.getboolean('auto_poweroff_enabled', False)  # Default enabled/disabled state / État activé/désactivé par défaut
+        self.moonraker_integration: bool = config.getboolean('moonraker_integration', True)  # Moonraker integration / Intégration avec Moonraker
+        self.moonraker_url: str = config.get('moonraker_url', "http://localhost:7125")  # Moonraker URL / URL de Moonraker
+        self.job_queue_aware: bool = config.getboolean('job_queue_aware', True)  # Postpone while Moonraker's job queue has jobs / Reporter tant que la file Moonraker contient des travaux
+        self._job_queue_missing = False  # Moonraker runs without [job_queue] / Moonraker sans [job_queue]
+        self.moonraker_events: bool = config.getboolean('moonraker_events', False)  # Forward the auto_power_off:* events to Moonraker clients / Relayer les événements aux clients Moonraker
+        moonraker_socket = config.get('moonraker_socket', "~/printer_data/comms/moonraker.sock")  # Local Unix socket, preferred over HTTP when present / Socket Unix local, préféré à HTTP s'il existe
+        self.moonraker = MoonrakerClient(self.moonraker_url, moonraker_socket or None)
+        self.moonraker_event_sender = MoonrakerEventSender(
+            self.reactor, MoonrakerClient(self.moonraker_url, moonraker_socket or None, timeout=1.),
+            self._handle_moonraker_event_result)
+
+        # Diagnostic mode parameters / Paramètres du mode diagnostique
+        self.diagnostic_mode: bool = config.getboolean('diagnostic_mode', False)  # Enable diagnostic logging / Activer la journalisation de diagnostic
+        self.power_off_retries: int = config.getint('power_off_retries', 3)  # Number of retry attempts / Nombre de tentatives
+        self.power_off_retry_delay: int = config.getint('power_off_retry_delay', 2)  # Delay between retries in seconds / Délai entre les tentatives en secondes
+
+        # Dry run mode / Mode simulation
+        self.dry_run_mode: bool = config.getboolean('dry_run_mode', False)  # Default is real power off / Par défaut, extinction réelle
+        self.dry_run_failures: Set[str] = set()  # Backends failing on purpose in dry runs / Backends mis en échec pendant les simulations
+        self.last_dry_run: Optional[Dict[str, Any]] = None
+        self._dry_run: Optional[DryRunRecorder] = None
+
+        # Network device settings / Paramètres des périphériques réseau
+        self.network_device: bool = config.getboolean('network_device', False)  # Is this a network power device / Est-ce un périphérique d'alimentation réseau
+        self.device_address: Optional[str] = config.get('device_address', None)  # IP address or hostname / Adresse IP ou nom d'hôte
+        self.network_test_attempts: int = config.getint('network_test_attempts', 3)  # Number of attempts to test connectivity / Nombre de tentatives pour tester la connectivité
+        self.network_test_interval: float = config.getfloat('network_test_interval', 1.0)  # Interval between tests in seconds / Intervalle entre les tests en secondes
+
+        # Circuit breakers for remote backends / Disjoncteurs des backends distants
+        self.power_off_retry_budget: float = config.getfloat('power_off_retry_budget', 15.0, minval=0.)  # Max seconds spent retrying per call / Durée max de nouvelles tentatives par appel
+        circuit_failure_threshold = config.getint('circuit_failure_threshold', 3, minval=1)
+        circuit_reset_timeout = config.getfloat('circuit_reset_timeout', 30.0, above=0.)
+        circuit_max_reset_timeout = config.getfloat('circuit_max_reset_timeout', 600.0, above=0.)
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {
+            name: CircuitBreaker(name, self.reactor, circuit_failure_threshold,
+                                 circuit_reset_timeout, circuit_max_reset_timeout)
+            for name in ('moonraker', 'network', 'plug', 'mqtt')
+        }
+
+        # Direct smart plug driver / Pilote direct de prise connectée
+        plug_type = config.getchoice('plug_type', {name: name for name in ['none'] + list(PLUG_DRIVERS)}, 'none')
+        plug_port = config.getint('plug_port', 0, minval=0)
+        plug_output = config.getint('plug_output', 0, minval=0)
+        plug_password = config.get('plug_password', None)
+        plug_token = config.get('plug_token', None)
+        plug_entity_id = config.get('plug_entity_id', f"switch.{self.power_device}")
+        plug_timeout = config.getfloat('plug_timeout', 2.0, above=0.)
+        self.plug_driver: Optional[PlugDriver] = None
+        if plug_type != 'none':
+            if not self.device_address:
+                raise config.error(f"device_address is required when plug_type is '{plug_type}'")
+            self.plug_driver = PLUG_DRIVERS[plug_type](
+                self.device_address, plug_port or None, plug_timeout, plug_output,
+                plug_password, plug_token, plug_entity_id)
+
+        # MQTT backend / Backend MQTT
+        mqtt_broker = config.get('mqtt_broker', None)  # Broker host, enables the backend / Hôte du broker, active le backend
+        self.mqtt_client: Optional[MqttPowerClient] = None
+        if mqtt_broker:
+            mqtt_command_topic = config.get('mqtt_command_topic', None)
+            if not mqtt_command_topic:
+                raise config.error("mqtt_command_topic is required when mqtt_broker is set")
+            mqtt_payload_off = config.get('mqtt_payload_off', "OFF")
+            mqtt_payload_on = config.get('mqtt_payload_on', "ON")
+            self.mqtt_client = MqttPowerClient(
+                self.reactor, mqtt_broker,
+                port=config.getint('mqtt_port', 1883, minval=1, maxval=65535),
+                client_id=config.get('mqtt_client_id', f"auto_power_off_{self.power_device}"),
+                command_topic=mqtt_command_topic,
+                state_topic=config.get('mqtt_state_topic', None),
+                payload_on=mqtt_payload_on,
+                payload_off=mqtt_payload_off,
+                state_on=config.get('mqtt_state_on', mqtt_payload_on),
+                state_off=config.get('mqtt_state_off', mqtt_payload_off),
+                username=config.get('mqtt_username', None),
+                password=config.get('mqtt_password', None),
+                keepalive=config.getint('mqtt_keepalive', 60, minval=0),
+                timeout=config.getfloat('mqtt_timeout', 5.0, above=0.))
+
+        # State kept across restarts / État conservé entre les redémarrages
+        self.state_file = StateFile(config.get('state_file', "~/printer_data/config/auto_power_off_state.json") or None)
+
+        # Idle timeout learned from the gaps between prints / Délai appris des intervalles entre impressions
+        self.adaptive_idle_timeout: str = config.getchoice(
+            'adaptive_idle_timeout', {'off': 'off', 'suggest': 'suggest', 'apply': 'apply'}, 'suggest')
+        learn_buckets = config.getint('learn_buckets', 6, minval=1, maxval=24)
+        if 24 % learn_buckets:
+            raise config.error("learn_buckets must divide 24 (1, 2, 3, 4, 6, 8, 12 or 24)")
+        self.gap_learner = IdleGapLearner(
+            learn_buckets,
+            power_cycle_cost=config.getfloat('power_cycle_cost', 600.0, minval=0.),
+            min_samples=config.getint('learn_min_samples', 5, minval=1))
+
+        # Decision journal / Journal des décisions
+        self.journal = DecisionJournal(
+            self.reactor,
+            config.get('journal_file', "~/printer_data/logs/auto_power_off_journal.jsonl") or None,  # Empty disables the file / Vide pour désactiver le fichier
+            max_bytes=config.getint('journal_max_size', 1048576, minval=4096),
+            backups=config.getint('journal_backups', 3, minval=0),
+            memory_entries=config.getint('journal_memory_entries', 200, minval=1))
+
+        # Temperature history for cooldown charts, step:span in seconds / Historique des températures, pas:durée en secondes
+        try:
+            history_tiers = parse_history_tiers(config.get('temp_history', "1:600, 10:7200, 60:86400"))
+        except ValueError as e:
+            raise config.error(f"Invalid temp_history: {str(e)}")
+        self.temp_history = TemperatureHistory(history_tiers)
+
+        # Memory-mapped status record for local readers / Enregistrement d'état mappé en mémoire pour les lecteurs locaux
+        status_export = config.get('status_export', "")  # Empty disables the export, e.g. /dev/shm/auto_power_off / Vide pour désactiver
+        self.status_export: Optional[StatusExport] = StatusExport(status_export) if status_export else None
+        self._exported_status: Optional[Dict[str, Any]] = None
+
+        # User notification settings / Paramètres des notifications utilisateur
+        self.notify_dedup_window: float = config.getfloat('notify_dedup_window', 300.0, minval=0.)  # Longer than the 60 s recheck, so a repeated veto is announced once / Plus long que la revérification de 60 s
+        self.notify_coalesce_delay: float = config.getfloat('notify_coalesce_delay', 0.5, minval=0.)  # Bursts within this delay become one console line / Rafales regroupées en une seule ligne
+
+        # Register for events / Enregistrement pour les événements
+        self.printer.register_event_handler("klippy:ready", self._handle_ready)
+        self.printer.register_event_handler("klippy:disconnect", self._handle_disconnect)
+        self.printer.register_event_handler("print_stats:complete", self._handle_print_complete)
+
+        # Monitored components configuration / Configuration des composants à surveiller
+        self.monitor_hotend: bool = config.getboolean('monitor_hotend', True)
+        self.monitor_bed: bool = config.getboolean('monitor_bed', True)
+        self.monitor_chamber: bool = config.getboolean('monitor_chamber', False)
+
+        # G-code activity restarts the idle countdown / L'activité G-code relance le compte à rebours
+        self.reset_on_activity: bool = config.getboolean('reset_on_activity', True)
+
+        # Temperature sampling, slowed down while nothing depends on it / Échantillonnage ralenti quand rien n'en dépend
+        self.idle_sample_interval: float = config.getfloat('idle_sample_interval', 10.0, minval=1.)
+
+        # Cooldown assist / Refroidissement assisté
+        self.cooldown_assist: bool = config.getboolean('cooldown_assist', False)  # Heaters off and fans on when the countdown starts / Chauffages coupés et ventilateurs allumés au début du compte à rebours
+        self.cooldown_fan_speed: float = config.getfloat('cooldown_fan_speed', 1.0, minval=0., maxval=1.)
+        self.cooldown_fans: List[str] = [name.strip() for name in config.get('cooldown_fans', "fan").split(',') if name.strip()]
+        for name in self.cooldown_fans:
+            if name != 'fan' and not name.startswith('fan_generic '):
+                raise config.error(
+                    f"cooldown_fans: '{name}' is not a [fan] or [fan_generic] section "
+                    "(heater_fan and controller_fan are driven by Klipper)")
+        self._cooldown_timer = None
+
+        # Power on flow / Procédure d'allumage
+        self.power_on_macro: Optional[str] = config.get('power_on_macro', None)  # G-code run once the MCU is back / G-code lancé au retour du MCU
+        self.power_on_delay: float = config.getfloat('power_on_delay', 2.0, minval=0.)  # Base delay before FIRMWARE_RESTART / Délai de base avant FIRMWARE_RESTART
+        self.power_on_timeout: float = config.getfloat('power_on_timeout', 120.0, above=0.)
+        self.power_on_mcu_serial: Optional[str] = config.get('power_on_mcu_serial', None)
+        if self.power_on_mcu_serial is None and hasattr(config, 'has_section') and config.has_section('mcu'):
+            self.power_on_mcu_serial = config.getsection('mcu').get('serial', None)
+        self.power_on_when_queued: bool = config.getboolean('power_on_when_queued', False)  # Power on when Moonraker queues a job / Allumer quand Moonraker met un travail en file
+        self.power_on_poll_interval: float = config.getfloat('power_on_poll_interval', 30.0, above=0.)
+        self._klippy_ready: bool = False
+        self._power_on_timer = None
+        self._power_on_worker: Optional[threading.Thread] = None  # Network backends being tried / Moyens réseau en cours d'essai
+        self._queue_watch_timer = None
+        self.reactor.register_callback(self._resume_power_on)
+
+        # Countdown timer, None while inactive / Minuteur du compte à rebours, None s'il est inactif
+        self.shutdown_timer = None
+
+        # Notification queue / File des notifications
+        self._notify_pending: List[str] = []
+        self._notify_last_sent: Dict[str, float] = {}
+        self._notify_timer = None
+
+        # Periodic timers, kept so the profiler can wrap them / Minuteurs périodiques
+        self._temps_timer = None
+        self._verify_timer = None
+        self._gap_timer = None
+        self.profiler = ModuleProfiler(self, config.get('profile_dir', "~/printer_data/logs"))
+
+        # Power off conditions, run cheapest first / Conditions d'extinction, les moins coûteuses d'abord
+        self.conditions = ConditionPipeline()
+        for condition_class in (PrintStateCondition, IdleCondition, TemperatureCondition):
+            self.conditions.register(condition_class(self))
+        if self.moonraker_integration:
+            self.conditions.register(MoonrakerPrintCondition(self))
+            if self.job_queue_aware:
+                self.conditions.register(JobQueueCondition(self))
+        for line in (config.get('keep_on_when', '') or '').split('\n'):
+            if line.strip():
+                try:
+                    self.conditions.register(StatusFieldCondition.parse(self, line))
+                except ValueError as e:
+                    raise config.error(f"Invalid keep_on_when: {str(e)}")
+
+        # Register gcode commands / Enregistrement des commandes GCODE
+        gcode = self.printer.lookup_object('gcode')
+        gcode.register_command('AUTO_POWEROFF', self.cmd_AUTO_POWEROFF,
+                               desc=self.cmd_AUTO_POWEROFF_help)
+
+        gcode.register_command('AUTO_POWEROFF_SET', self.cmd_AUTO_POWEROFF_SET,
+                               desc=self.cmd_AUTO_POWEROFF_SET_help)
+        # Also available while the MCU is off / Disponible aussi MCU éteint
+        gcode.register_command('AUTO_POWEROFF_POWER_ON', self.cmd_AUTO_POWEROFF_POWER_ON, when_not_ready=True,
+                               desc=self.cmd_AUTO_POWEROFF_POWER_ON_help)
+        gcode.register_command('AUTO_POWEROFF_PROFILE', self.cmd_AUTO_POWEROFF_PROFILE,
+                               desc=self.cmd_AUTO_POWEROFF_PROFILE_help)
+        # JSON control plane for UIs and fleet tooling / Interface JSON pour les UI et outils de parc
+        webhooks = self.printer.lookup_object('webhooks')
+        webhooks.register_endpoint("auto_power_off/status", self._handle_status_request)
+        webhooks.register_endpoint("auto_power_off/arm", self._handle_arm_request)
+        webhooks.register_endpoint("auto_power_off/cancel", self._handle_cancel_request)
+        webhooks.register_endpoint("auto_power_off/history", self._handle_history_request)
+        webhooks.register_endpoint("auto_power_off/temperature_history", self._handle_temperature_history_request)
+        webhooks.register_endpoint("auto_power_off/conditions", self._handle_conditions_request)
+        webhooks.register_endpoint("auto_power_off/dry_run", self._handle_dry_run_request)
+        webhooks.register_endpoint("auto_power_off/set", self._handle_set_request)
+        webhooks.register_endpoint("auto_power_off/power_on", self._handle_power_on_request)
+
+        # Convenience sub-commands so users can type e.g.
+        # AUTO_POWEROFF_DIAGNOSTIC VALUE=1 directly (Klipper's parser rejects
+        # bare tokens like `AUTO_POWEROFF DIAGNOSTIC`, see issue #14).
+        # Only register aliases that don't collide with existing gcode_macros
+        # shipped in ui/fluidd/*.cfg and ui/mainsail/*.cfg.
+        for _sub in ('DIAGNOSTIC', 'DRYRUN', 'VERSION', 'RESET'):
+            _alias = f'AUTO_POWEROFF_{_sub}'
+            try:
+                gcode.register_command(
+                    _alias,
+                    self._make_alias_handler(_sub.lower()),
+                    desc=self.cmd_AUTO_POWEROFF_help,
+                )
+            except Exception as e:
+                self.logger.warning(f"Could not register {_alias}: {e}")
+
+        # Register for Fluidd/Mainsail status API / Enregistrement pour l'API de status Fluidd/Mainsail
+        self.printer.register_event_handler("klippy:connect", self._handle_connect)
+
+    def get_git_version(self) -> str:
+        """
+        Récupère la version à partir de Git si disponible.
+        Évite les problèmes de 'inferred version'.
+        
+        Returns:
+            str: Numéro de version Git ou version par défaut
+        """
+        try:
+            # Vérifier si nous sommes dans un dépôt Git
+            repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+            git_dir = os.path.join(repo_dir, ".git")
+            
+            if os.path.isdir(git_dir):
+                # Essayer d'obtenir la version depuis le tag Git
+                try:
+                    with open(os.path.join(git_dir, "HEAD"), 'r') as f:
+                        head_ref = f.read().strip()
+                    
+                    # Si le HEAD pointe vers une référence
+                    if head_ref.startswith("ref:"):
+                        ref_path = head_ref[5:].strip()
+                        ref_file = os.path.join(git_dir, ref_path)
+                        
+                        if os.path.isfile(ref_file):
+                            with open(ref_file, 'r') as f:
+                                return f"v{__version__}-{f.read().strip()[:7]}"
+                except:
+                    pass
+            
+            return f"v{__version__}"
+        except:
+            return f"v{__version__}"
+
+    @property
+    def lang(self) -> str:
+        """Active language code, detected on first access / Langue active, détectée au premier accès"""
+        if self._lang is None:
+            self._configure_language()
+        return self._lang
+
+    @lang.setter
+    def lang(self, value: str) -> None:
+        self._lang = value
+
+    def _configure_language(self) -> None:
+        """
+        Configure language settings using multiple sources.
+        
+        This method determines the language to use by checking in this order:
+        1. Explicit config parameter 'language'
+        2. Persistent language file
+        3. Environment variables (LANG, LANGUAGE, LC_ALL)
+        4. Klipper configuration files
+        5. Default to English if none of the above are available
+        
+        It is called lazily the first time the language is needed, never
+        from __init__, so that loading the module costs no filesystem access.
+        
+        Returns:
+            None
+        """
+        configured_lang = self._configured_lang
+        if configured_lang == 'auto':
+            configured_lang = None
+
+        persistent_lang = self._get_persistent_language()
+
+        env_lang = None
+        try:
+            for env_var in ['LANG', 'LANGUAGE', 'LC_ALL']:
+                if env_var in os.environ and os.environ[env_var]:
+                    env_value = os.environ[env_var].split('.')[0].lower()
+                    if env_value.startswith('fr'):
+                        env_lang = 'fr'
+                        break
+                    elif env_value.startswith('en'):
+                        env_lang = 'en'
+                        break
+        except Exception as e:
+            self.logger.warning(f"Error checking environment language: {str(e)}")
+
+        klipper_lang = self._check_klipper_language_settings()
+        self.lang = configured_lang or persistent_lang or env_lang or klipper_lang or 'en'
+        
+        # Validate language against available languages
+        if self.lang.lower() not in [lang.value for lang in Language]:
+            self.logger.warning(f"Unsupported language '{self.lang}'. Defaulting to English.")
+            self.lang = Language.ENGLISH.value
+        else:
+            self.lang = self.lang.lower()
+
+        if configured_lang and configured_lang != persistent_lang:
+            self._save_persistent_language(self.lang)
+
+        self.logger.info(f"Language detection: config={configured_lang}, persistent={persistent_lang}, env={env_lang}, klipper={klipper_lang}, final={self.lang}")
+
+    def _check_klipper_language_settings(self) -> Optional[str]:
+        """
+        Check for language preference in Klipper configuration files.
+        
+        This method looks for French configuration files in common paths
+        to determine if French should be used.
+        
+        Returns:
+            str or None: 'fr' if French configuration is detected, None otherwise
+        """
+        try:
+            config_paths = [
+                "~/printer_data/config/mainsail/auto_power_off_fr.cfg",
+                "~/printer_data/config/fluidd/auto_power_off_fr.cfg",
+                "~/klipper_config/mainsail/auto_power_off_fr.cfg",
+                "~/klipper_config/fluidd/auto_power_off_fr.cfg"
+            ]
+            for path in config_paths:
+                expanded_path = os.path.expanduser(path)
+                if os.path.exists(expanded_path):
+                    return Language.FRENCH.value
+        except Exception as e:
+            self.logger.warning(f"Error checking Klipper config: {str(e)}")
+        return None
+
+    def _get_persistent_language(self) -> Optional[str]:
+        """
+        Get saved language from persistence file.
+        
+        Returns:
+            str or None: The language code if found in persistence file, None otherwise
+        """
+        try:
+            persistence_file = os.path.expanduser("~/printer_data/config/auto_power_off_language.conf")
+            if os.path.exists(persistence_file):
+                with open(persistence_file, 'r') as f:
+                    saved_lang = f.read().strip()
+                    return saved_lang if saved_lang in [lang.value for lang in Language] else None
+        except Exception as e:
+            self.logger.warning(f"Error reading persistent language: {str(e)}")
+        return None
+
+    def _save_persistent_language(self, language: str) -> None:
+        """
+        Save language preference to persistence file.
+        
+        Args:
+            language: The language code to save
+            
+        Returns:
+            None
+        """
+        try:
+            persistence_dir = os.path.expanduser("~/printer_data/config")
+            if not os.path.exists(persistence_dir):
+                persistence_dir = os.path.expanduser("~/klipper_config")
                 if not os.path.exists(persistence_dir):
                     self.logger.warning("Could not find config directory for language persistence / Répertoire de config introuvable pour la persistance de la langue")
                     return
@@ -320,323 +2658,1259 @@ class AutoPowerOff:
                 f.write(language)
             self.logger.info(f"Language preference saved to {persistence_file}")
         except Exception as e:
-            self.logger.warning(f"Error saving language preference: {str(e)}")
+            self.logger.warning(f"Error saving language preference: {str(e)}")
+
+    def _check_device_capabilities(self) -> bool:
+        """
+        Check and discover the capabilities of the power device.
+        
+        This method determines the available methods that can be used to power off
+        the device and selects the optimal method.
+        
+        Returns:
+            bool: True if device capabilities were successfully checked, False otherwise
+            
+        Raises:
+            PowerDeviceError: If there's an error checking device capabilities
+        """
+        if not self.device_state == DeviceState.AVAILABLE:
+            self._diagnostic_log("Cannot check capabilities, device not available / Impossible de vérifier les capacités, périphérique indisponible", level="warning")
+            return False
+
+        previous = self.optimal_method
+        capabilities = {
+            'direct_plug': self.plug_driver is not None,
+            'mqtt': self.mqtt_client is not None,
+            'set_power': False,
+            'turn_off': False,
+            'power_off': False,
+            'cmd_off': False,
+            'moonraker_available': self.moonraker_integration
+        }
+        try:
+            device_name = 'power ' + self.power_device
+            if self.plug_driver is not None or self.mqtt_client is not None:
+                # The Klipper power object is optional with a direct plug driver or MQTT
+                power_device = self.printer.lookup_object(device_name, None)
+            else:
+                power_device = self.printer.lookup_object(device_name)
+            capabilities['set_power'] = hasattr(power_device, 'set_power')
+            capabilities['turn_off'] = hasattr(power_device, 'turn_off')
+            capabilities['power_off'] = hasattr(power_device, 'power_off')
+            try:
+                gcode = self.printer.lookup_object('gcode')
+                handler = gcode.get_command_handler().get("POWER_OFF")
+                capabilities['cmd_off'] = handler is not None
+            except Exception as e:
+                self._diagnostic_log(f"Error checking GCODE capabilities: {str(e)}", level="warning")
+            
+            self._diagnostic_log("Device capabilities: %s", capabilities, level="info")
+            
+            # Determine optimal power off method based on available capabilities
+            if capabilities['direct_plug']:
+                self.optimal_method = self.plug_driver.method
+            elif capabilities['mqtt']:
+                self.optimal_method = PowerOffMethod.MQTT
+            elif capabilities['set_power']:
+                self.optimal_method = PowerOffMethod.SET_POWER
+            elif capabilities['turn_off']:
+                self.optimal_method = PowerOffMethod.TURN_OFF
+            elif capabilities['power_off']:
+                self.optimal_method = PowerOffMethod.POWER_OFF
+            elif capabilities['cmd_off']:
+                self.optimal_method = PowerOffMethod.CMD_OFF
+            elif capabilities['moonraker_available']:
+                self.optimal_method = PowerOffMethod.MOONRAKER
+            else:
+                self.optimal_method = PowerOffMethod.UNKNOWN
+                self._diagnostic_log("No viable power off method detected! / Aucune méthode d'extinction viable détectée!", level="error")
+            
+            # Keep the previous dict when nothing changed, so the periodic
+            # check does not churn / Conserve le dict précédent si rien n'a changé
+            if capabilities != self.device_capabilities or self.optimal_method != previous:
+                self.device_capabilities = capabilities
+                self.info.invalidate()
+            return True
+        except Exception as e:
+            error_msg = f"Error checking device capabilities: {str(e)}"
+            self.logger.error(self.get_text("error_checking_capabilities", error=str(e)))
+            self._diagnostic_log(error_msg, level="error", data=e)
+            raise PowerDeviceError(error_msg) from e
+
+    def _verify_power_device(self) -> bool:
+        """
+        Verify that the configured power device exists and is available.
+        
+        This method checks if the power device exists in Klipper or if 
+        Moonraker integration is enabled, and sets the device state accordingly.
+        
+        Returns:
+            bool: True if device is available, False otherwise
+            
+        Raises:
+            PowerDeviceNotFoundError: If the device is not found
+            PowerDeviceError: For other device-related errors
+        """
+        self.device_state = DeviceState.UNAVAILABLE
+        
+        # A direct plug driver or MQTT does not need a Klipper power object
+        remote = self.plug_driver or self.mqtt_client
+        if remote is not None:
+            self._diagnostic_log("Using device '%s' via direct %s driver / Utilisation du pilote direct", self.power_device, remote.method.name, level="info")
+            self.device_state = DeviceState.AVAILABLE
+            self._check_device_capabilities()
+            return True
+        
+        # If Moonraker integration is enabled, assume device is available
+        if self.moonraker_integration:
+            self._diagnostic_log("Using device '%s' via Moonraker integration / Utilisation du périphérique via l'intégration Moonraker", self.power_device, level="info")
+            self.device_state = DeviceState.AVAILABLE
+            return True
+        
+        try:
+            power_device = self.printer.lookup_object('power ' + self.power_device, None)
+            
+            if power_device is None:
+                error_msg = f"Power device '{self.power_device}' not found"
+                self.logger.error(self.get_text("power_device_not_found", device=self.power_device))
+                self._notify_user("power_device_not_found", device=self.power_device)
+                raise PowerDeviceNotFoundError(error_msg)
+            
+            self.device_state = DeviceState.AVAILABLE
+            self._check_device_capabilities()
+            self._diagnostic_log("Power device '%s' found / Périphérique d'alimentation trouvé", self.power_device, level="info")
+            return True
+        except PowerDeviceNotFoundError:
+            # Re-raise device not found error
+            raise
+        except Exception as e:
+            error_msg = f"Error verifying device '{self.power_device}': {str(e)}"
+            self.logger.error(self.get_text("error_verifying_device", error=str(e), device=self.power_device))
+            self._diagnostic_log(error_msg, level="error", data=e)
+            raise PowerDeviceError(error_msg) from e
+
+    def _power_off_dry_run(self, force_direct: bool = False, diagnostic_mode: Optional[bool] = None,
+                           failures: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """
+        Run the whole shutdown sequence against mock backends.
+        
+        State checks, network test, preflight, backend selection, retries,
+        fallback and confirmation run as in a real power off; only the
+        commands themselves go to stand-ins. Each backend is first probed
+        with a read-only request: a stand-in fails like its backend would,
+        and the measured latency is added to the simulated time. Delays are
+        counted instead of slept, and circuit breakers are copied so the
+        simulation leaves them untouched.
+        
+        Args:
+            force_direct: Force direct Klipper method instead of Moonraker API
+            diagnostic_mode: Override global diagnostic mode setting
+            failures: Backends that fail on purpose (default: dry_run_failures)
+            
+        Returns:
+            dict: Timing report, also kept in last_dry_run
+        """
+        self.logger.info(self.get_text("dry_run_power_off"))
+        recorder = DryRunRecorder(self.dry_run_failures if failures is None else failures)
+        self._probe_backends(recorder)
+        
+        saved = (self.plug_driver, self.mqtt_client, self.moonraker, self.circuit_breakers, self.runtime.state)
+        if self.plug_driver is not None:
+            self.plug_driver = DryRunPlug(self.plug_driver, recorder)
+        if self.mqtt_client is not None:
+            self.mqtt_client = DryRunMqtt(self.mqtt_client, recorder, self.reactor)
+        self.moonraker = DryRunMoonraker(self.moonraker, recorder)
+        self.circuit_breakers = {name: copy.copy(breaker) for name, breaker in self.circuit_breakers.items()}
+        self._dry_run = recorder
+        error = None
+        try:
+            self._shutdown_sequence(force_direct, diagnostic_mode)
+        except Exception as e:
+            error = str(e)
+        finally:
+            recorder.finish()
+            self._dry_run = None
+            self.plug_driver, self.mqtt_client, self.moonraker, self.circuit_breakers, self.runtime.state = saved
+            self._reset_shutdown_state()
+        
+        if error is not None:
+            outcome = f"failed: {error}"
+        else:
+            outcome = recorder.succeeded or "no command sent"
+        report = recorder.report(outcome)
+        self.last_dry_run = report
+        
+        lines = [self.get_text("dry_run_report", latency=f"{report['predicted_latency']:.2f}", outcome=outcome)]
+        for phase in report['phases']:
+            simulated = f" (+{phase['simulated_ms']:.0f} ms simulated)" if phase['simulated_ms'] else ""
+            lines.append(f"  {phase['name']}: {phase['wall_ms']:.1f} ms{simulated}")
+        if report['calls']:
+            lines.append("  calls: " + ", ".join(report['calls']))
+        for backend, reason in report['unreachable'].items():
+            lines.append(f"  {backend} unreachable: {reason}")
+        message = "\n".join(lines)
+        self.logger.info(message)
+        self.printer.lookup_object('gcode').respond_info(message)
+        return report
+
+    def _probe_backends(self, recorder: DryRunRecorder) -> None:
+        """
+        Measure the latency of each configured backend with a read-only request.
+        Mesure la latence de chaque backend configuré par une requête en lecture seule.
+        
+        The probes run in the reactor, so together they get at most
+        DryRunRecorder.PROBE_BUDGET seconds: each one's timeout is what is
+        left of it, and a backend not probed in time counts as unreachable.
+        The network device is connected to once here; the network test of
+        the simulated sequence replays that result.
+        
+        Args:
+            recorder: Dry run receiving the latencies and the unreachable backends
+        """
+        deadline = time.perf_counter() + recorder.PROBE_BUDGET
+        spent = f"not probed, {recorder.PROBE_BUDGET:g}s probe budget spent"
+        
+        if self.network_device and self.device_address:
+            start = time.perf_counter()
+            try:
+                recorder.network_result = self._connect_device(recorder.PROBE_BUDGET)
+                error = f"connect error {recorder.network_result}" if recorder.network_result else None
+            except OSError as e:
+                recorder.network_result, error = -1, str(e)
+            if error is None:
+                recorder.latencies['network'] = time.perf_counter() - start
+            else:
+                recorder.unavailable['network'] = error
+        
+        if self.plug_driver is not None:
+            start = time.perf_counter()
+            timeout = self.plug_driver.timeout
+            # Reconnect with the probe timeout, then again with the configured one
+            # Reconnexion avec le délai de la sonde, puis avec celui configuré
+            self.plug_driver.close()
+            self.plug_driver.timeout = min(timeout, deadline - start)
+            try:
+                if self.plug_driver.timeout <= 0.:
+                    recorder.unavailable['plug'] = spent
+                else:
+                    self.plug_driver.get_state()
+                    recorder.latencies['plug'] = time.perf_counter() - start
+            except Exception as e:
+                recorder.unavailable['plug'] = str(e)
+            finally:
+                self.plug_driver.close()
+                self.plug_driver.timeout = timeout
+        
+        if self.mqtt_client is not None and not self.mqtt_client.connected.is_set():
+            recorder.unavailable['mqtt'] = "broker not connected"
+        
+        if self.moonraker_integration:
+            start = time.perf_counter()
+            if deadline <= start:
+                recorder.unavailable['moonraker'] = spent
+            else:
+                try:
+                    self.moonraker.call('machine.device_power.get_device', 'GET', '/machine/device_power/device',
+                                        {'device': self.power_device}, timeout=min(5., deadline - start))
+                    recorder.latencies['moonraker'] = time.perf_counter() - start
+                except MoonrakerApiError as e:
+                    recorder.unavailable['moonraker'] = str(e)
+
+    def _connect_device(self, timeout: float) -> int:
+        """
+        Open a TCP connection to the network device's port 80.
+        Ouvre une connexion TCP vers le port 80 du périphérique réseau.
+        
+        Args:
+            timeout: Connection timeout in seconds
+            
+        Returns:
+            int: connect_ex() result, 0 if the device accepted the connection
+        """
+        import socket
+        port = 80  # Commonly open port / Port couramment ouvert
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            return sock.connect_ex((self.device_address, port))
+        finally:
+            sock.close()
+
+
+    def _test_network_device(self) -> bool:
+        """
+        Test if a network device is reachable.
+        
+        For network devices, this method attempts to connect to check
+        if the device is reachable before trying to power it off.
+        
+        Returns:
+            bool: True if device is reachable, False otherwise
+            
+        Raises:
+            NetworkDeviceUnreachableError: If the network device is unreachable
+        """
+        if not self.network_device or not self.device_address:
+            return True
+        
+        import socket
+        
+        breaker = self.circuit_breakers['network']
+        if not breaker.allow():
+            error_msg = f"Network device '{self.device_address}' circuit is open, skipping connectivity test"
+            self._diagnostic_log(error_msg, level="warning")
+            raise NetworkDeviceUnreachableError(error_msg)
+        
+        self._diagnostic_log(f"Testing connectivity to network device: {self.device_address}", level="info")
+        
+        for attempt in range(self.network_test_attempts):
+            try:
+                self._diagnostic_log(f"Attempt {attempt+1}/{self.network_test_attempts}: Connecting to {self.device_address}:80", level="debug")
+                if self._dry_run is not None:
+                    # Probed once, within the probe budget / Sondé une seule fois, dans le budget des sondes
+                    result = self._dry_run.network_result
+                    self._dry_run.wait(self._dry_run.latencies.get('network', 0.))
+                else:
+                    result = self._connect_device(2.0)
+                
+                if result == 0:
+                    self._diagnostic_log(f"Successfully connected to {self.device_address} / Connexion réussie", level="info")
+                    breaker.record_success()
+                    return True
+                else:
+                    self._diagnostic_log(f"Failed to connect to {self.device_address}, error code: {result}", level="warning")
+            
+            except socket.error as e:
+                self._diagnostic_log(f"Socket error connecting to {self.device_address}: {str(e)}", level="warning")
+            
+            if attempt < self.network_test_attempts - 1:
+                delay = jittered_backoff(self.network_test_interval, attempt, 4 * self.network_test_interval)
+                self._diagnostic_log(f"Waiting {delay:.1f}s before next attempt / Attente de {delay:.1f}s avant prochaine tentative", level="debug")
+                self._sleep(delay)
+        
+        breaker.record_failure()
+        error_msg = f"Network device '{self.device_address}' is unreachable after {self.network_test_attempts} attempts"
+        self.logger.error(self.get_text("network_device_unreachable", device=self.device_address, attempts=self.network_test_attempts))
+        self._notify_user("network_device_unreachable", device=self.device_address, attempts=self.network_test_attempts)
+        raise NetworkDeviceUnreachableError(error_msg)
+
+    def _load_translations(self) -> None:
+        """
+        Load language strings from translation files.
+        
+        This method attempts to load translations from the language files
+        based on the configured language. If the file is not found, it falls
+        back to English.
+        
+        Returns:
+            None
+            
+        Raises:
+            TranslationError: If there's an error loading translations
+        """
+        import json
+        
+        self.translations = {}
+        lang_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'auto_power_off_langs')
+        
+        try:
+            lang_file = os.path.join(lang_dir, f"{self.lang}.json")
+            
+            if not os.path.exists(lang_file):
+                self.logger.warning(f"Translation file {lang_file} not found, falling back to English / Fichier de traduction introuvable, utilisation de l'anglais par défaut")
+                lang_file = os.path.join(lang_dir, f"{Language.ENGLISH.value}.json")
+            
+            with open(lang_file, 'r', encoding='utf-8') as f:
+                self.translations = json.load(f)
+            
+            self.logger.info(f"Loaded {len(self.translations)} translations from {lang_file}")
+        
+        except Exception as e:
+            error_msg = f"Error loading translations: {str(e)}"
+            self.logger.error(f"{error_msg}. Using hardcoded English strings / Erreur lors du chargement des traductions : {str(e)}. Utilisation des chaînes anglaises codées en dur.")
+            raise TranslationError(error_msg) from e
 
-    def _check_device_capabilities(self) -> bool:
+    def get_text(self, key: str, **kwargs) -> str:
+        """
+        Get translated text by key, with optional formatting parameters.
+        
+        Args:
+            key: The translation key to look up
+            **kwargs: Format parameters for the translation string
+            
+        Returns:
+            str: The translated and formatted text
+        """
+        if self.translations is None:
+            try:
+                self._load_translations()
+            except TranslationError:
+                pass  # Fallback strings below / Chaînes de repli ci-dessous
+        
+        if key in self.translations:
+            text = self.translations[key]
+            if kwargs:
+                try:
+                    return text.format(**kwargs)
+                except Exception as e:
+                    self.logger.warning(f"Error formatting translation key '{key}': {str(e)}")
+                    return text
+            return text
+        
+        self.logger.warning(f"Missing translation key: {key}")
+        
+        # Fallback dictionary for critical messages
+        fallbacks = {
+            "module_initialized": "Auto Power Off: Module initialized / Extinction auto : Module initialisé",
+            "print_complete_disabled": "Print complete, but auto power off is disabled / Impression terminée, extinction auto désactivée",
+            "print_complete_starting_timer": "Print complete, starting power-off timer / Impression terminée, démarrage du minuteur d'extinction",
+            "print_in_progress": "Print in progress or resumed, canceling shutdown / Impression en cours ou reprise, annulation de l'extinction",
+            "printer_not_idle": "Printer not idle, postponing shutdown / Imprimante non inoccupée, extinction reportée",
+            "temperatures_too_high": "Temperatures too high (Hotend: {hotend_temp:.1f}, Bed: {bed_temp:.1f}), postponing shutdown / Températures trop élevées (Buse: {hotend_temp:.1f}, Lit: {bed_temp:.1f}), extinction reportée",
+            "temperatures_too_high_custom": "Temperatures too high ({temp_msg}), maximum is {max_temp:.1f}°C / Températures trop élevées ({temp_msg}), maximum autorisé {max_temp:.1f}°C",
+            "conditions_met": "Conditions met, powering off the printer / Conditions remplies, extinction de l'imprimante",
+            "powered_off_moonraker": "Printer powered off successfully via Moonraker API / Imprimante éteinte avec succès via l'API Moonraker",
+            "error_powering_off": "Error during power off: {error} / Erreur lors de l'extinction : {error}",
+            "powered_off_set_power": "Printer powered off successfully (set_power method) / Imprimante éteinte avec succès (méthode set_power)",
+            "powered_off_turn_off": "Printer powered off successfully (turn_off method) / Imprimante éteinte avec succès (méthode turn_off)",
+            "powered_off_power_off": "Printer powered off successfully (power_off method) / Imprimante éteinte avec succès (méthode power_off)",
+            "powered_off_gcode": "Printer powered off successfully via GCODE / Imprimante éteinte avec succès via GCODE",
+            "power_device_not_found": "Power device '{device}' not found / Périphérique d'alimentation '{device}' introuvable",
+            "error_checking_capabilities": "Error checking device capabilities: {error} / Erreur lors de la vérification des capacités : {error}",
+            "error_verifying_device": "Error verifying device '{device}': {error} / Erreur lors de la vérification du périphérique '{device}' : {error}",
+            "dry_run_power_off": "Dry run: Power off simulated / Simulation : Extinction simulée",
+            "network_device_unreachable": "Network device '{device}' unreachable after {attempts} attempts / Périphérique réseau '{device}' injoignable après {attempts} tentatives",
+            "power_device_not_available_for_poweroff": "Power device '{device}' not available for power off / Périphérique '{device}' non disponible pour l'extinction",
+            "error_moonraker_all_retries_failed": "All Moonraker retries failed (retries: {retries}, error: {error}) / Toutes les tentatives via Moonraker ont échoué (tentatives : {retries}, erreur : {error})",
+            "falling_back_to_direct": "Falling back to direct power off method / Repli sur la méthode directe d'extinction",
+            "power_off_success": "Power off command issued successfully / Commande d'extinction émise avec succès",
+            "no_power_off_method": "No power off method available / Aucune méthode d'extinction disponible",
+            "shutdown_in_progress": "Shutdown already in progress / Extinction déjà en cours",
+            "printer_already_shutdown": "Printer already shutdown / Imprimante déjà éteinte",
+            "error_disabling_heaters": "Error disabling heaters: {error} / Erreur lors de la désactivation des chauffages : {error}",
+            "error_preparing_shutdown": "Error preparing for shutdown: {error} / Erreur lors de la préparation à l'extinction : {error}",
+            "auto_power_off_enabled": "Auto power off globally enabled / Extinction automatique activée globalement",
+            "auto_power_off_disabled": "Auto power off globally disabled / Extinction automatique désactivée globalement",
+            "timer_started": "Idle timer started / Minuteur d'inactivité démarré",
+            "timer_already_active": "Idle timer already active / Minuteur d'inactivité déjà actif",
+            "timer_canceled": "Idle timer canceled / Minuteur d'inactivité annulé",
+            "no_active_timer": "No active timer to cancel / Aucun minuteur actif à annuler",
+            "status_template": "Status: {enabled_status}, Timer: {timer_status}, Countdown: {countdown}, Temps: {temps}, Temp Threshold: {temp_threshold}°C, Idle Timeout: {idle_timeout} minutes / Statut : {enabled_status}, Minuteur : {timer_status}, Compte à rebours : {countdown}, Températures : {temps}, Seuil de Temp : {temp_threshold}°C, Temps inactivité : {idle_timeout} minutes",
+            "powering_off": "Powering off the printer / Extinction de l'imprimante en cours",
+            "option_not_recognized": "Option not recognized / Option non reconnue",
+            "print_in_progress_moonraker": "Print in progress via Moonraker (state: {state}) / Impression en cours via Moonraker (état : {state})",
+            "enabled_status": "Enabled / Activé",
+            "disabled_status": "Disabled / Désactivé"
+        }
+        
+        if key in fallbacks:
+            text = fallbacks[key]
+            if kwargs:
+                try:
+                    return text.format(**kwargs)
+                except Exception:
+                    return text
+            return text
+        
+        return f"[{key}]"
+
+    def _handle_connect(self) -> None:
+        """
+        Called on initial connection to register the object.
+        
+        This method registers the auto_power_off object with the printer
+        if it doesn't already exist.
+        
+        Returns:
+            None
+        """
+        try:
+            self.printer.lookup_object("auto_power_off")
+        except self.printer.config_error:
+            self.printer.add_object("auto_power_off", self)
+        try:
+            self.printer.lookup_object("auto_power_off_info")
+        except self.printer.config_error:
+            self.printer.add_object("auto_power_off_info", self.info)
+
+    def _handle_ready(self) -> None:
+        """
+        Called when Klipper is ready to set up the module.
+        
+        This method only resets the shutdown state and registers the periodic
+        timers. Everything that touches the filesystem (language detection,
+        translations) is deferred to _handle_ready_deferred, which runs from
+        the reactor once the klippy:ready handlers have all returned.
+        
+        Returns:
+            None
+        """
+        # S'assurer que l'état d'extinction est réinitialisé
+        self._reset_shutdown_state()
+        self._klippy_ready = True
+        
+        # The MCU is back: a power on retry must not restart the firmware again
+        # Le MCU est revenu : plus de nouveau FIRMWARE_RESTART
+        if self._power_on_timer is not None:
+            self.reactor.unregister_timer(self._power_on_timer)
+            self._power_on_timer = None
+        
+        # Set up periodic temperature checker
+        self._temps_timer = self.reactor.register_timer(self._update_temps, self.reactor.monotonic() + 1)
+        
+        # Set up periodic device state checker
+        self._verify_timer = self.reactor.register_timer(self._verify_device_state, self.reactor.monotonic() + 10)
+        
+        if self.reset_on_activity:
+            self._install_activity_hook()
+        
+        self.reactor.register_callback(self._handle_ready_deferred)
+
+    def _install_activity_hook(self) -> None:
+        """
+        Track G-code activity so that jogging or running macros during the
+        countdown pushes the power off back.
+        
+        The G-code dispatcher's _process_commands is wrapped with a closure
+        that only writes a timestamp; the new deadline is computed lazily by
+        _check_conditions when the timer fires. Every G-code source (console,
+        macros, virtual SD card, Moonraker scripts) goes through this method.
+        
+        Returns:
+            None
+        """
+        gcode = self.printer.lookup_object('gcode')
+        process_commands = getattr(gcode, '_process_commands', None)
+        if process_commands is None or getattr(process_commands, 'auto_power_off_hook', False):
+            self._diagnostic_log("G-code activity hook not installed / Suivi de l'activité G-code non installé", level="warning")
+            return
+        
+        monotonic = self.reactor.monotonic
+        runtime = self.runtime
+        
+        def _tracked_process_commands(commands, need_ack=True):
+            runtime.last_activity = monotonic()
+            return process_commands(commands, need_ack)
+        _tracked_process_commands.auto_power_off_hook = True
+        gcode._process_commands = _tracked_process_commands
+
+    def _run_own_script(self, script: str, from_command: bool = True) -> None:
+        """
+        Run a G-code script issued by this module.
+        
+        The script is not counted as user activity, so it does not push the
+        countdown back.
+        
+        Args:
+            script: The G-code script to run
+            from_command: False when not called from a G-code command handler;
+                the script then goes through gcode.run_script, which takes
+                the G-code mutex instead of interleaving with a running stream
+            
+        Returns:
+            None
+        """
+        if self._dry_run is not None:
+            self._dry_run.call('direct' if script.startswith('POWER_OFF') else 'gcode', script)
+            return
+        last_activity = self.runtime.last_activity
+        gcode = self.printer.lookup_object('gcode')
+        try:
+            if from_command:
+                gcode.run_script_from_command(script)
+            else:
+                gcode.run_script(script)
+        finally:
+            self.runtime.last_activity = last_activity
+
+    def _arm_timer(self) -> None:
+        """
+        Start (or restart) the idle countdown.
+        
+        Returns:
+            None
+        """
+        if self.shutdown_timer is not None:
+            self.reactor.unregister_timer(self.shutdown_timer)
+        
+        now = self.reactor.monotonic()
+        self.runtime.countdown_start = now
+        self.conditions.invalidate()
+        self.shutdown_timer = self.reactor.register_timer(
+            self._check_conditions, self._set_deadline(now + self._effective_idle_timeout()))
+        if self.cooldown_assist:
+            # Also armed from webhooks: the G-code runs from a reactor callback
+            # Aussi armé par les webhooks : le G-code part d'un rappel du réacteur
+            self.reactor.register_callback(self._start_cooldown)
+        if self.runtime.sample_interval > 1.:
+            self._sample_now()
+        self._emit(PowerOffEvent.ARMED)
+
+    def _set_deadline(self, waketime: float) -> float:
+        """
+        Record the next wake up of the countdown timer.
+        
+        The deadline is published as a Unix time together with the server
+        time at which it was set, so clients count down on their own and the
+        status only changes when the countdown is armed, postponed or
+        canceled.
+        
+        Args:
+            waketime: Reactor time of the next check, reactor.NEVER when stopped
+            
+        Returns:
+            float: waketime, to be returned by the timer callback
+        """
+        runtime = self.runtime
+        runtime.countdown_end = waketime
+        runtime.server_time = round(time.time(), 3)
+        if waketime >= self.reactor.NEVER:
+            runtime.deadline = None
+        else:
+            runtime.deadline = round(runtime.server_time + waketime - self.reactor.monotonic(), 3)
+        if self.status_export is not None:
+            # Once the caller has updated the timer / Une fois le minuteur mis à jour par l'appelant
+            self.reactor.register_callback(self._export_status)
+        return waketime
+
+    def _export_status(self, eventtime: float) -> None:
+        """
+        Rewrite the memory-mapped status record if the status changed.
+        Réécrit l'enregistrement mappé en mémoire si l'état a changé.
+        
+        get_status() returns the same dict while nothing changed, so this
+        costs one comparison per call on an idle printer.
+        
+        Args:
+            eventtime: Current event time from Klipper
+            
+        Returns:
+            None
+        """
+        if self.status_export is None:
+            return
+        status = self.get_status(eventtime, query=False)
+        if status is not self._exported_status:
+            self._exported_status = status
+            self.status_export.write(status)
+
+    def _emit(self, event: PowerOffEvent, reason: Optional[str] = None) -> None:
+        """
+        Send an auto_power_off:* event to Klipper modules and, with
+        moonraker_events, to Moonraker clients.
+        
+        Handlers run synchronously; an error in one of them is logged and
+        does not stop the countdown. Moonraker events are queued for
+        MoonrakerEventSender's worker thread, never sent from the reactor.
+        
+        Args:
+            event: Event to send
+            reason: Decision value or command behind the event
+            
+        Returns:
+            None
+        """
+        method = None
+        if event in (PowerOffEvent.POWERING_OFF, PowerOffEvent.POWERED_OFF) and self.optimal_method:
+            method = self.optimal_method.name
+        payload = EventPayload(event, round(time.time(), 3), self.runtime.deadline, reason, method,
+                               self.dry_run_mode, self.runtime.temps)
+        try:
+            self.printer.send_event(event.value, payload)
+        except Exception as e:
+            self.logger.error(f"Error in a {event.value} event handler: {str(e)}")
+        
+        if not (self.moonraker_events and self.moonraker_integration):
+            return
+        if not self.circuit_breakers['moonraker'].allow():
+            return
+        version = self.info.get_status(self.reactor.monotonic())['version']
+        self.moonraker_event_sender.send(event.name.lower(), payload.as_dict(), version)
+
+    def _handle_moonraker_event_result(self, eventtime: float, sent: Optional[bool], error: Optional[str]) -> None:
         """
-        Check and discover the capabilities of the power device.
-        
-        This method determines the available methods that can be used to power off
-        the device and selects the optimal method.
+        Record the outcome of an event sent to Moonraker by the worker thread.
         
-        Returns:
-            bool: True if device capabilities were successfully checked, False otherwise
+        Args:
+            eventtime: Current event time from Klipper
+            sent: False if the Unix socket is not available
+            error: None on success, otherwise the error message
             
-        Raises:
-            PowerDeviceError: If there's an error checking device capabilities
+        Returns:
+            None
         """
-        if not self.device_state == DeviceState.AVAILABLE:
-            self._diagnostic_log("Cannot check capabilities, device not available / Impossible de vérifier les capacités, périphérique indisponible", level="warning")
-            return False
+        breaker = self.circuit_breakers['moonraker']
+        if error is not None:
+            breaker.record_failure()
+            self._diagnostic_log(f"Error sending an event to Moonraker: {error}", level="warning")
+        elif sent:
+            breaker.record_success()
+        else:
+            self._diagnostic_log("Moonraker events need the Unix socket / Les événements Moonraker nécessitent le socket Unix", level="debug")
 
-        self.device_capabilities = {
-            'set_power': False,
-            'turn_off': False,
-            'power_off': False,
-            'cmd_off': False,
-            'moonraker_available': self.moonraker_integration
-        }
-        try:
-            device_name = f'power {self.power_device}'
-            power_device = self.printer.lookup_object(device_name)
-            self.device_capabilities['set_power'] = hasattr(power_device, 'set_power')
-            self.device_capabilities['turn_off'] = hasattr(power_device, 'turn_off')
-            self.device_capabilities['power_off'] = hasattr(power_device, 'power_off')
-            try:
-                gcode = self.printer.lookup_object('gcode')
-                handler = gcode.get_command_handler().get("POWER_OFF")
-                self.device_capabilities['cmd_off'] = handler is not None
-            except Exception as e:
-                self._diagnostic_log(f"Error checking GCODE capabilities: {str(e)}", level="warning")
-            
-            self._diagnostic_log(f"Device capabilities: {self.device_capabilities}", level="info")
+    def _cancel_timer(self, reason: Optional[str] = "command") -> float:
+        """
+        Stop the countdown, also from its own callback.
+        
+        Args:
+            reason: Reason sent with auto_power_off:canceled, None to send no event
             
-            # Determine optimal power off method based on available capabilities
-            if self.device_capabilities['set_power']:
-                self.optimal_method = PowerOffMethod.SET_POWER
-            elif self.device_capabilities['turn_off']:
-                self.optimal_method = PowerOffMethod.TURN_OFF
-            elif self.device_capabilities['power_off']:
-                self.optimal_method = PowerOffMethod.POWER_OFF
-            elif self.device_capabilities['cmd_off']:
-                self.optimal_method = PowerOffMethod.CMD_OFF
-            elif self.device_capabilities['moonraker_available']:
-                self.optimal_method = PowerOffMethod.MOONRAKER
+        Returns:
+            float: reactor.NEVER
+        """
+        canceled = self.shutdown_timer is not None
+        if canceled:
+            self.reactor.unregister_timer(self.shutdown_timer)
+            self.shutdown_timer = None
+        self._stop_cooldown(stop_fans=False)
+        waketime = self._set_deadline(self.reactor.NEVER)
+        if canceled and reason is not None:
+            self._emit(PowerOffEvent.CANCELED, reason)
+        return waketime
+
+    def _set_cooldown_fans(self, speed: float) -> None:
+        """
+        Set every cooldown fan to speed (0 to 1), from a reactor callback or
+        timer only.
+        Règle les ventilateurs de refroidissement, hors commande G-code.
+        """
+        commands = []
+        for name in self.cooldown_fans:
+            if name == 'fan':
+                commands.append(f"M106 S{int(round(speed * 255))}" if speed else "M107")
             else:
-                self.optimal_method = PowerOffMethod.UNKNOWN
-                self._diagnostic_log("No viable power off method detected! / Aucune méthode d'extinction viable détectée!", level="error")
+                commands.append(f"SET_FAN_SPEED FAN={name.split(None, 1)[1]} SPEED={speed:.2f}")
+        try:
+            self._run_own_script("\n".join(commands), from_command=False)
+        except Exception as e:
+            self.logger.warning(f"Cooldown assist: could not set fans: {str(e)}")
+
+    def _start_cooldown(self, eventtime: float) -> None:
+        """
+        Reactor callback registered by _arm_timer: start the cooldown assist,
+        heaters off and fans on until the monitored temperatures are below
+        temp_threshold.
+        
+        Args:
+            eventtime: Current event time from Klipper
             
-            return True
+        Returns:
+            None
+        """
+        self._stop_cooldown(stop_fans=False)
+        if self.shutdown_timer is None:
+            return  # Canceled before the callback ran / Annulé avant le rappel
+        try:
+            self._run_own_script("TURN_OFF_HEATERS", from_command=False)
+            temps = self._monitored_temps(eventtime)
         except Exception as e:
-            error_msg = f"Error checking device capabilities: {str(e)}"
-            self.logger.error(self.get_text("error_checking_capabilities", error=str(e)))
-            self._diagnostic_log(error_msg, level="error", data=e)
-            raise PowerDeviceError(error_msg) from e
+            self.logger.warning(self.get_text("error_disabling_heaters", error=str(e)))
+            return
+        if max(temps.values(), default=0.) <= self.temp_threshold:
+            self.runtime.time_to_threshold = 0.
+            return
+        self._set_cooldown_fans(self.cooldown_fan_speed)
+        self.runtime.cooldown_start = eventtime
+        self.logger.info(self.get_text("cooldown_started", speed=int(round(self.cooldown_fan_speed * 100))))
+        self._cooldown_timer = self.reactor.register_timer(self._check_cooldown, eventtime + 2.)
 
-    def _verify_power_device(self) -> bool:
+    def _check_cooldown(self, eventtime: float) -> float:
         """
-        Verify that the configured power device exists and is available.
+        Stop the fans and record the time to threshold once cool enough.
         
-        This method checks if the power device exists in Klipper or if 
-        Moonraker integration is enabled, and sets the device state accordingly.
+        Args:
+            eventtime: Current event time from Klipper
+            
+        Returns:
+            float: Time for next check or NEVER once below the threshold
+        """
+        try:
+            temps = self._monitored_temps(eventtime)
+        except Exception as e:
+            self.logger.warning(f"Cooldown assist: could not read temperatures: {str(e)}")
+            temps = {}
+        # Fans keep running until the threshold is crossed or the countdown ends
+        if not temps or max(temps.values()) > self.temp_threshold:
+            return eventtime + 2.
+        elapsed = round(eventtime - self.runtime.cooldown_start, 1)
+        self._stop_cooldown()
+        self.runtime.time_to_threshold = elapsed
+        self.logger.info(self.get_text("cooldown_done", threshold=self.temp_threshold, seconds=int(elapsed)))
+        return self.reactor.NEVER
+
+    def _stop_cooldown(self, stop_fans: bool = True) -> None:
+        """
+        End a running cooldown assist.
         
+        Args:
+            stop_fans: Turn the fans off; False when a print or the power
+                off takes over
+            
         Returns:
-            bool: True if device is available, False otherwise
+            None
+        """
+        if self._cooldown_timer is not None:
+            self.reactor.unregister_timer(self._cooldown_timer)
+            self._cooldown_timer = None
+        if self.runtime.cooldown_start is None:
+            return
+        self.runtime.cooldown_start = None
+        if stop_fans:
+            # Also called from commands and webhooks / Aussi appelé par les commandes et webhooks
+            self.reactor.register_callback(lambda eventtime: self._set_cooldown_fans(0.))
+
+    def _power_on_network(self, moonraker: Optional[MoonrakerClient]) -> Tuple[Optional[str], List[str]]:
+        """
+        Switch the power device on through the network backends.
+        
+        Runs in the worker thread started by _request_power_on, never in the
+        reactor. The backends are tried in the order used to power off:
+        direct smart plug, MQTT, then Moonraker. A backend that accepts the
+        command but reports the device still off is a failure. Moonraker
+        calls use the power_off_retries and power_off_retry_delay settings.
+        
+        Args:
+            moonraker: Moonraker client owned by the worker thread, None
+                without moonraker_integration
             
-        Raises:
-            PowerDeviceNotFoundError: If the device is not found
-            PowerDeviceError: For other device-related errors
+        Returns:
+            Tuple: Name of the backend that switched the device on (None if
+                none did) and the errors met
         """
-        self.device_state = DeviceState.UNAVAILABLE
+        errors = []
+        if self.plug_driver is not None:
+            method = self.plug_driver.method.name
+            try:
+                if self.plug_driver.set_power(True):
+                    return method, errors
+                errors.append(f"{method}: plug is still off")
+            except Exception as e:
+                errors.append(f"{method}: {str(e)}")
         
-        # If Moonraker integration is enabled, assume device is available
-        if self.moonraker_integration:
-            self._diagnostic_log(f"Using device '{self.power_device}' via Moonraker integration / Utilisation du périphérique via l'intégration Moonraker", level="info")
-            self.device_state = DeviceState.AVAILABLE
-            return True
+        if self.mqtt_client is not None:
+            try:
+                self.mqtt_client.set_power(True)
+                return PowerOffMethod.MQTT.name, errors
+            except NetworkDeviceError as e:
+                errors.append(f"MQTT: {str(e)}")
         
-        try:
-            device_name = f'power {self.power_device}'
-            power_device = self.printer.lookup_object(device_name, None)
+        if moonraker is not None:
+            try:
+                result = self._moonraker_call_with_retry(
+                    'machine.device_power.post_device', 'POST', '/machine/device_power/device',
+                    {'device': self.power_device, 'action': 'on'},
+                    self.power_off_retries, self.power_off_retry_delay, timeout=10, client=moonraker)
+                device_state = result.get(self.power_device) if isinstance(result, dict) else None
+                if device_state in (None, 'on'):
+                    return "MOONRAKER", errors
+                errors.append(f"Moonraker: device '{self.power_device}' is still {device_state}")
+            except MoonrakerApiError as e:
+                errors.append(f"Moonraker: {str(e)}")
+        return None, errors
+
+    def _power_on_direct(self, errors: List[str]) -> str:
+        """
+        Switch the power device on through the Klipper power object.
+        
+        This is the last backend, tried in the reactor once the network
+        backends failed.
+        
+        Args:
+            errors: Errors met by the network backends
             
-            if power_device is None:
-                error_msg = f"Power device '{self.power_device}' not found"
-                self.logger.error(self.get_text("power_device_not_found", device=self.power_device))
-                self._notify_user("power_device_not_found", device=self.power_device)
-                raise PowerDeviceNotFoundError(error_msg)
+        Returns:
+            str: Name of the backend that switched the device on
             
-            self.device_state = DeviceState.AVAILABLE
-            self._check_device_capabilities()
-            self._diagnostic_log(f"Power device '{self.power_device}' found / Périphérique d'alimentation trouvé", level="info")
-            return True
-        except PowerDeviceNotFoundError:
-            # Re-raise device not found error
-            raise
-        except Exception as e:
-            error_msg = f"Error verifying device '{self.power_device}': {str(e)}"
-            self.logger.error(self.get_text("error_verifying_device", error=str(e), device=self.power_device))
-            self._diagnostic_log(error_msg, level="error", data=e)
-            raise PowerDeviceError(error_msg) from e
+        Raises:
+            PowerOnError: If the power object is missing or failed too
+        """
+        power_device = self.printer.lookup_object(f'power {self.power_device}', None)
+        if power_device is not None and hasattr(power_device, 'set_power'):
+            try:
+                power_device.set_power(1)
+                return PowerOffMethod.SET_POWER.name
+            except Exception as e:
+                errors.append(f"set_power: {str(e)}")
+        
+        raise PowerOnError("Could not switch the power device on: " + "; ".join(errors or ["no backend available"]))
 
-    def _power_off_dry_run(self) -> bool:
+    def _request_power_on(self, source: str, macro: Optional[str] = None) -> bool:
         """
-        Simulate power off for testing purposes without actually powering off.
+        Start the power on flow: switch the device on, then restart the firmware.
         
-        This method logs the power off attempt and notifies the user,
-        but does not actually power off the device.
+        The flow survives the FIRMWARE_RESTART, which recreates this module,
+        through a 'power_on' marker in the state file holding the step timings.
+        _resume_power_on picks it up from the new instance.
         
+        Args:
+            source: What asked for the power on (gcode, webhook, job_queue)
+            macro: Warm-up G-code overriding power_on_macro
+            
         Returns:
-            bool: True for successful dry run
+            bool: False if the printer was already on and ready
+            
+        Raises:
+            PowerOnError: If the device could not be switched on
         """
-        self.logger.info(self.get_text("dry_run_power_off"))
+        if self._klippy_ready and self.runtime.state != "off" and self._is_mcu_connected():
+            return False
+        if self._power_on_timer is not None or self._power_on_worker is not None:
+            return True
         
-        if self.moonraker_integration and not self.force_direct:
-            self._diagnostic_log("DRY RUN: Would use Moonraker API for power off / SIMULATION : Utiliserait l'API Moonraker pour éteindre", level="info")
-        else:
-            self._diagnostic_log("DRY RUN: Would use direct Klipper method / SIMULATION : Utiliserait la méthode directe Klipper", level="info")
+        request = {'started': time.time(), 't0': time.monotonic(), 'source': source,
+                   'macro': macro if macro is not None else self.power_on_macro}
+        if self.plug_driver is None and self.mqtt_client is None and not self.moonraker_integration:
+            self._complete_power_on(request, None, [])
+            return True
         
-        if self.optimal_method:
-            self._diagnostic_log(f"DRY RUN: Would use {self.optimal_method.name} method", level="info")
+        # Network backends can block for seconds: they run in a worker thread
+        # and the power on continues in the reactor through _power_on_switched
+        # Les moyens réseau tournent dans un thread, la suite dans le réacteur
+        client = (MoonrakerClient(self.moonraker.url, self.moonraker.socket_path, self.moonraker.timeout)
+                  if self.moonraker_integration else None)
         
-        self._notify_user("dry_run_power_off")
+        def worker():
+            try:
+                method, errors = self._power_on_network(client)
+            except Exception as e:
+                method, errors = None, [f"{type(e).__name__}: {str(e)}"]
+            finally:
+                if client is not None:
+                    client.close()
+            self.reactor.register_async_callback(
+                lambda eventtime: self._power_on_switched(eventtime, request, method, errors))
+        self._power_on_worker = threading.Thread(target=worker, name="auto_power_off-power-on", daemon=True)
+        self._power_on_worker.start()
         return True
 
-    def _test_network_device(self) -> bool:
+    def _power_on_switched(self, eventtime: float, request: Dict[str, Any],
+                           method: Optional[str], errors: List[str]) -> None:
         """
-        Test if a network device is reachable.
+        Reactor callback once the power on worker tried the network backends.
         
-        For network devices, this method attempts to connect to check
-        if the device is reachable before trying to power it off.
+        Args:
+            eventtime: Current event time from Klipper
+            request: Power on request built by _request_power_on
+            method: Backend that switched the device on, None if none did
+            errors: Errors met by the network backends
+            
+        Returns:
+            None
+        """
+        self._power_on_worker = None
+        try:
+            self._complete_power_on(request, method, errors)
+        except PowerOnError:
+            pass  # Already logged and notified / Déjà journalisé et notifié
+
+    def _complete_power_on(self, request: Dict[str, Any], method: Optional[str], errors: List[str]) -> None:
+        """
+        Fall back to the Klipper power object if needed, then schedule the
+        FIRMWARE_RESTART.
         
+        Args:
+            request: Power on request built by _request_power_on
+            method: Backend that switched the device on, None if none did
+            errors: Errors met by the network backends
+            
         Returns:
-            bool: True if device is reachable, False otherwise
+            None
             
         Raises:
-            NetworkDeviceUnreachableError: If the network device is unreachable
+            PowerOnError: If the device could not be switched on
         """
-        if not self.network_device or not self.device_address:
-            return True
+        source = request['source']
+        try:
+            if method is None:
+                method = self._power_on_direct(errors)
+        except PowerOnError as e:
+            self.logger.error(self.get_text("power_on_failed", error=str(e)))
+            self._notify_user("power_on_failed", error=str(e))
+            self.journal.record(Decision.POWER_ON_FAILED, flush=True, source=source, error=str(e))
+            raise
         
-        self._diagnostic_log(f"Testing connectivity to network device: {self.device_address}", level="info")
+        marker = {'started': round(request['started'], 3), 'source': source, 'method': method,
+                  'macro': request['macro'],
+                  'steps': {'switch_on': round(time.monotonic() - request['t0'], 3)},
+                  'attempt': 0, 'polls': 0}
+        self.state_file.set('power_on', marker)
+        self.runtime.state = "starting"
+        self.logger.info(self.get_text("power_on_started", method=method, source=source))
+        self._notify_user("power_on_started", method=method, source=source)
+        self._power_on_timer = self.reactor.register_timer(
+            self._power_on_restart, self.reactor.monotonic() + self.power_on_delay)
+
+    def _power_on_restart(self, eventtime: float) -> float:
+        """
+        Timer callback: wait for the MCU serial port, then run FIRMWARE_RESTART.
         
-        for attempt in range(self.network_test_attempts):
-            try:
-                port = 80  # Commonly open port / Port couramment ouvert
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(2.0)
-                self._diagnostic_log(f"Attempt {attempt+1}/{self.network_test_attempts}: Connecting to {self.device_address}:{port}", level="debug")
-                result = sock.connect_ex((self.device_address, port))
-                sock.close()
-                
-                if result == 0:
-                    self._diagnostic_log(f"Successfully connected to {self.device_address} / Connexion réussie", level="info")
-                    return True
-                else:
-                    self._diagnostic_log(f"Failed to connect to {self.device_address}, error code: {result}", level="warning")
-            
-            except socket.error as e:
-                self._diagnostic_log(f"Socket error connecting to {self.device_address}: {str(e)}", level="warning")
+        The serial port is polled with jittered backoff until it appears or
+        power_on_timeout expires; the restart is requested either way, so a
+        board on a TCP or CAN link without a serial device is still restarted.
+        
+        Args:
+            eventtime: Current event time from Klipper
             
-            if attempt < self.network_test_attempts - 1:
-                self._diagnostic_log(f"Waiting {self.network_test_interval}s before next attempt / Attente de {self.network_test_interval}s avant prochaine tentative", level="debug")
-                time.sleep(self.network_test_interval)
+        Returns:
+            float: Next poll time, or NEVER once the restart is requested
+        """
+        marker = self.state_file.get('power_on')
+        if marker is None:
+            self._power_on_timer = None
+            return self.reactor.NEVER
+        elapsed = time.time() - marker['started']
+        if (self.power_on_mcu_serial and not os.path.exists(self.power_on_mcu_serial)
+                and elapsed < self.power_on_timeout):
+            marker['polls'] += 1
+            return eventtime + jittered_backoff(0.5, marker['polls'], 5.)
         
-        error_msg = f"Network device '{self.device_address}' is unreachable after {self.network_test_attempts} attempts"
-        self.logger.error(self.get_text("network_device_unreachable", device=self.device_address, attempts=self.network_test_attempts))
-        self._notify_user("network_device_unreachable", device=self.device_address, attempts=self.network_test_attempts)
-        raise NetworkDeviceUnreachableError(error_msg)
+        marker['steps']['mcu_port'] = round(elapsed, 3)
+        marker['attempt'] += 1
+        self.state_file.set('power_on', marker)
+        self._power_on_timer = None
+        self.logger.info(self.get_text("power_on_restarting", attempt=marker['attempt']))
+        self.printer.request_exit('firmware_restart')
+        return self.reactor.NEVER
 
-    def _load_translations(self) -> None:
+    def _resume_power_on(self, eventtime: float) -> None:
         """
-        Load language strings from translation files.
+        Callback run once the module is loaded, after every (firmware) restart.
         
-        This method attempts to load translations from the language files
-        based on the configured language. If the file is not found, it falls
-        back to English.
+        Klipper runs it as soon as the reactor starts, usually while the MCU
+        is still connecting, so it does not decide whether the MCU came back:
+        a power on started before the restart gets a _retry_power_on timer,
+        which _handle_ready cancels when klippy:ready arrives first. It also
+        starts the job queue watch.
         
+        Args:
+            eventtime: Current event time from Klipper
+            
         Returns:
             None
-            
-        Raises:
-            TranslationError: If there's an error loading translations
         """
-        self.translations: Dict[str, str] = {}
-        lang_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'auto_power_off_langs')
+        self.runtime.last_power_on = self.state_file.get('last_power_on')
+        if self.power_on_when_queued and self.moonraker_integration and self._queue_watch_timer is None:
+            self._queue_watch_timer = self.reactor.register_timer(
+                self._watch_job_queue, eventtime + self.power_on_poll_interval)
         
-        try:
-            lang_file = os.path.join(lang_dir, f"{self.lang}.json")
+        marker = self.state_file.get('power_on')
+        if marker is None or self._power_on_timer is not None:
+            return
+        if self._klippy_ready:
+            self._finish_power_on(eventtime)
+            return
+        self._power_on_timer = self.reactor.register_timer(
+            self._retry_power_on, eventtime + jittered_backoff(self.power_on_delay, marker['attempt'], 30.))
+
+    def _retry_power_on(self, eventtime: float) -> float:
+        """
+        Timer callback: the MCU did not come back after FIRMWARE_RESTART.
+        
+        Another restart is requested through _power_on_restart, until
+        power_on_timeout gives up. Nothing is done once Klipper is ready, as
+        _finish_power_on then completes the flow.
+        
+        Args:
+            eventtime: Current event time from Klipper
             
-            if not os.path.exists(lang_file):
-                self.logger.warning(f"Translation file {lang_file} not found, falling back to English / Fichier de traduction introuvable, utilisation de l'anglais par défaut")
-                lang_file = os.path.join(lang_dir, f"{Language.ENGLISH.value}.json")
+        Returns:
+            float: Next poll time, or NEVER
+        """
+        marker = self.state_file.get('power_on')
+        if marker is None or self._klippy_ready:
+            self._power_on_timer = None
+            return self.reactor.NEVER
+        elapsed = time.time() - marker['started']
+        if elapsed > self.power_on_timeout:
+            self._power_on_timer = None
+            self.state_file.set('power_on', None)
+            error = f"MCU not ready after {elapsed:.0f}s"
+            self.logger.error(self.get_text("power_on_failed", error=error))
+            self._notify_user("power_on_failed", error=error)
+            self.journal.record(Decision.POWER_ON_FAILED, flush=True, source=marker['source'],
+                                steps=marker['steps'], error=error)
+            return self.reactor.NEVER
+        return self._power_on_restart(eventtime)
+
+    def _finish_power_on(self, eventtime: float) -> None:
+        """
+        Complete a power on once Klipper is ready after the restart: run the
+        warm-up macro and store the step timings.
+        
+        Args:
+            eventtime: Current event time from Klipper
             
-            with open(lang_file, 'r', encoding='utf-8') as f:
-                self.translations = json.load(f)
+        Returns:
+            None
+        """
+        marker = self.state_file.get('power_on')
+        if marker is None:
+            return
+        elapsed = time.time() - marker['started']
+        steps = marker['steps']
+        steps['mcu_ready'] = round(elapsed, 3)
+        if marker.get('macro'):
+            t0 = time.monotonic()
+            try:
+                self.printer.lookup_object('gcode').run_script(marker['macro'])
+            except Exception as e:
+                self.logger.warning(self.get_text("power_on_failed", error=f"warm-up macro: {str(e)}"))
+            steps['warmup'] = round(time.monotonic() - t0, 3)
+        steps['total'] = round(time.time() - marker['started'], 3)
+        
+        last_power_on = {'time': marker['started'], 'source': marker['source'],
+                         'method': marker['method'], 'attempts': marker['attempt'], 'steps': steps}
+        self.runtime.last_power_on = last_power_on
+        self.runtime.state = "on"
+        self.state_file.set('power_on', None, save=False)
+        self.state_file.set('last_power_on', last_power_on)
+        self.journal.record(Decision.POWER_ON, flush=True, source=marker['source'], steps=steps)
+        self.logger.info(self.get_text("power_on_done", seconds=f"{steps['total']:.1f}"))
+        self._notify_user("power_on_done", seconds=f"{steps['total']:.1f}")
+
+    def _watch_job_queue(self, eventtime: float) -> float:
+        """
+        Timer callback: power on when Moonraker's job queue has jobs waiting.
+        
+        Moonraker does not push job queue events to Klipper, so the queue is
+        polled every power_on_poll_interval while the printer is off.
+        
+        Args:
+            eventtime: Current event time from Klipper
             
-            self.logger.info(f"Loaded {len(self.translations)} translations from {lang_file}")
+        Returns:
+            float: Next poll time
+        """
+        powered_off = self.runtime.state == "off" or not self._klippy_ready
+        if (powered_off and self._power_on_timer is None and self._power_on_worker is None
+                and self.state_file.get('power_on') is None):
+            jobs = self._check_job_queue()
+            if jobs > 0:
+                self.logger.info(self.get_text("power_on_queued", count=jobs))
+                try:
+                    self._request_power_on("job_queue")
+                except PowerOnError:
+                    pass
+        return eventtime + self.power_on_poll_interval
+
+    cmd_AUTO_POWEROFF_POWER_ON_help = "Switch the printer on and restart the firmware / Allume l'imprimante et redémarre le firmware"
+
+    def cmd_AUTO_POWEROFF_POWER_ON(self, gcmd) -> None:
+        """
+        GCODE command AUTO_POWEROFF_POWER_ON [MACRO=<gcode>], available while
+        Klipper is not ready.
         
-        except Exception as e:
-            error_msg = f"Error loading translations: {str(e)}"
-            self.logger.error(f"{error_msg}. Using hardcoded English strings / Erreur lors du chargement des traductions : {str(e)}. Utilisation des chaînes anglaises codées en dur.")
-            raise TranslationError(error_msg) from e
+        Args:
+            gcmd: G-code command object
+            
+        Returns:
+            None
+        """
+        try:
+            started = self._request_power_on("gcode", gcmd.get('MACRO', None))
+        except PowerOnError as e:
+            raise gcmd.error(str(e))
+        if started and self._power_on_worker is not None:
+            gcmd.respond_info(self.get_text("power_on_switching", source="gcode"))
+        elif started:
+            gcmd.respond_info(self.get_text("power_on_started", source="gcode",
+                                            method=self.state_file.get('power_on', {}).get('method')))
+        else:
+            gcmd.respond_info(self.get_text("power_on_already"))
 
-    def get_text(self, key: str, **kwargs) -> str:
+    def _handle_power_on_request(self, web_request) -> None:
         """
-        Get translated text by key, with optional formatting parameters.
+        Webhook auto_power_off/power_on, optional argument macro.
         
         Args:
-            key: The translation key to look up
-            **kwargs: Format parameters for the translation string
+            web_request: Klipper web request
             
         Returns:
-            str: The translated and formatted text
+            None
         """
-        if key in self.translations:
-            text = self.translations[key]
-            if kwargs:
-                try:
-                    return text.format(**kwargs)
-                except Exception as e:
-                    self.logger.warning(f"Error formatting translation key '{key}': {str(e)}")
-                    return text
-            return text
-        
-        self.logger.warning(f"Missing translation key: {key}")
-        
-        # Fallback dictionary for critical messages
-        fallbacks = {
-            "module_initialized": "Auto Power Off: Module initialized / Extinction auto : Module initialisé",
-            "print_complete_disabled": "Print complete, but auto power off is disabled / Impression terminée, extinction auto désactivée",
-            "print_complete_starting_timer": "Print complete, starting power-off timer / Impression terminée, démarrage du minuteur d'extinction",
-            "print_in_progress": "Print in progress or resumed, canceling shutdown / Impression en cours ou reprise, annulation de l'extinction",
-            "printer_not_idle": "Printer not idle, postponing shutdown / Imprimante non inoccupée, extinction reportée",
-            "temperatures_too_high": "Temperatures too high (Hotend: {hotend_temp:.1f}, Bed: {bed_temp:.1f}), postponing shutdown / Températures trop élevées (Buse: {hotend_temp:.1f}, Lit: {bed_temp:.1f}), extinction reportée",
-            "temperatures_too_high_custom": "Temperatures too high ({temp_msg}), maximum is {max_temp:.1f}°C / Températures trop élevées ({temp_msg}), maximum autorisé {max_temp:.1f}°C",
-            "conditions_met": "Conditions met, powering off the printer / Conditions remplies, extinction de l'imprimante",
-            "powered_off_moonraker": "Printer powered off successfully via Moonraker API / Imprimante éteinte avec succès via l'API Moonraker",
-            "error_powering_off": "Error during power off: {error} / Erreur lors de l'extinction : {error}",
-            "powered_off_set_power": "Printer powered off successfully (set_power method) / Imprimante éteinte avec succès (méthode set_power)",
-            "powered_off_turn_off": "Printer powered off successfully (turn_off method) / Imprimante éteinte avec succès (méthode turn_off)",
-            "powered_off_power_off": "Printer powered off successfully (power_off method) / Imprimante éteinte avec succès (méthode power_off)",
-            "powered_off_gcode": "Printer powered off successfully via GCODE / Imprimante éteinte avec succès via GCODE",
-            "power_device_not_found": "Power device '{device}' not found / Périphérique d'alimentation '{device}' introuvable",
-            "error_checking_capabilities": "Error checking device capabilities: {error} / Erreur lors de la vérification des capacités : {error}",
-            "error_verifying_device": "Error verifying device '{device}': {error} / Erreur lors de la vérification du périphérique '{device}' : {error}",
-            "dry_run_power_off": "Dry run: Power off simulated / Simulation : Extinction simulée",
-            "network_device_unreachable": "Network device '{device}' unreachable after {attempts} attempts / Périphérique réseau '{device}' injoignable après {attempts} tentatives",
-            "power_device_not_available_for_poweroff": "Power device '{device}' not available for power off / Périphérique '{device}' non disponible pour l'extinction",
-            "error_moonraker_all_retries_failed": "All Moonraker retries failed (retries: {retries}, error: {error}) / Toutes les tentatives via Moonraker ont échoué (tentatives : {retries}, erreur : {error})",
-            "falling_back_to_direct": "Falling back to direct power off method / Repli sur la méthode directe d'extinction",
-            "power_off_success": "Power off command issued successfully / Commande d'extinction émise avec succès",
-            "no_power_off_method": "No power off method available / Aucune méthode d'extinction disponible",
-            "shutdown_in_progress": "Shutdown already in progress / Extinction déjà en cours",
-            "printer_already_shutdown": "Printer already shutdown / Imprimante déjà éteinte",
-            "error_disabling_heaters": "Error disabling heaters: {error} / Erreur lors de la désactivation des chauffages : {error}",
-            "error_preparing_shutdown": "Error preparing for shutdown: {error} / Erreur lors de la préparation à l'extinction : {error}",
-            "auto_power_off_enabled": "Auto power off globally enabled / Extinction automatique activée globalement",
-            "auto_power_off_disabled": "Auto power off globally disabled / Extinction automatique désactivée globalement",
-            "timer_started": "Idle timer started / Minuteur d'inactivité démarré",
-            "timer_already_active": "Idle timer already active / Minuteur d'inactivité déjà actif",
-            "timer_canceled": "Idle timer canceled / Minuteur d'inactivité annulé",
-            "no_active_timer": "No active timer to cancel / Aucun minuteur actif à annuler",
-            "status_template": "Status: {enabled_status}, Timer: {timer_status}, Countdown: {countdown}, Temps: {temps}, Temp Threshold: {temp_threshold}°C, Idle Timeout: {idle_timeout} minutes / Statut : {enabled_status}, Minuteur : {timer_status}, Compte à rebours : {countdown}, Températures : {temps}, Seuil de Temp : {temp_threshold}°C, Temps inactivité : {idle_timeout} minutes",
-            "powering_off": "Powering off the printer / Extinction de l'imprimante en cours",
-            "option_not_recognized": "Option not recognized / Option non reconnue",
-            "print_in_progress_moonraker": "Print in progress via Moonraker (state: {state}) / Impression en cours via Moonraker (état : {state})",
-            "enabled_status": "Enabled / Activé",
-            "disabled_status": "Disabled / Désactivé"
-        }
+        try:
+            started = self._request_power_on("webhook", web_request.get_args().get('macro'))
+        except PowerOnError as e:
+            raise web_request.error(str(e))
+        web_request.send({'started': started, 'power_on': self.state_file.get('power_on')})
+
+    def _effective_idle_timeout(self) -> float:
+        """
+        Get the idle timeout to use now.
         
-        if key in fallbacks:
-            text = fallbacks[key]
-            if kwargs:
-                try:
-                    return text.format(**kwargs)
-                except Exception:
-                    return text
-            return text
+        With adaptive_idle_timeout set to 'apply', the timeout learned for
+        the current time of day is used; the configured idle_timeout always
+        remains the ceiling.
         
-        return f"[{key}]"
+        Returns:
+            float: Idle timeout in seconds
+        """
+        if self.adaptive_idle_timeout == 'apply':
+            learned = self.gap_learner.suggestion(time.time())
+            if learned is not None:
+                return min(learned, self.idle_timeout)
+        return self.idle_timeout
 
-    def _handle_connect(self) -> None:
+    def _track_print_gaps(self, eventtime: float) -> float:
         """
-        Called on initial connection to register the object.
+        Follow print_stats to measure the gaps between prints.
         
-        This method registers the auto_power_off object with the printer
-        if it doesn't already exist.
+        The end of a print is saved to the state file, so a gap spanning a
+        Klipper restart or a host power cycle is still measured.
         
+        Args:
+            eventtime: Current event time from Klipper
+            
         Returns:
-            None
+            float: Time for next check
         """
         try:
-            self.printer.lookup_object("auto_power_off")
-        except self.printer.config_error:
-            self.printer.add_object("auto_power_off", self)
+            state = self.printer.lookup_object('print_stats').get_status(eventtime).get('state')
+        except Exception:
+            return eventtime + 5.
+        printing = state in ('printing', 'paused')
+        if printing == self.runtime.print_active:
+            return eventtime + 5.
+        self.runtime.print_active = printing
+        now = time.time()
+        if printing:
+            if self.runtime.last_print_end is not None:
+                gap = now - self.runtime.last_print_end
+                self.gap_learner.add_gap(gap, self.runtime.last_print_end)
+                self._diagnostic_log("Gap between prints: %.0fs, learned timeout: %s", gap, self.gap_learner.suggestion(self.runtime.last_print_end), level="info")
+                self.runtime.last_print_end = None
+                self.state_file.set('idle_gaps', self.gap_learner.to_dict(), save=False)
+                self.state_file.set('last_print_end', None)
+        else:
+            self.runtime.last_print_end = now
+            self.state_file.set('last_print_end', now)
+        return eventtime + 5.
 
-    def _handle_ready(self) -> None:
+    def _handle_ready_deferred(self, eventtime: float) -> None:
         """
-        Called when Klipper is ready to set up the module.
+        Background step run after klippy:ready.
         
-        This method logs the initialization, verifies the power device,
-        and sets up periodic temperature checking.
+        This method loads the language and translations, logs the
+        initialization and verifies the power device.
         
+        Args:
+            eventtime: Current event time from Klipper
+            
         Returns:
             None
         """
         self.logger.info(self.get_text("module_initialized"))
+        self._finish_power_on(eventtime)
         
-        # S'assurer que l'état d'extinction est réinitialisé
-        self._reset_shutdown_state()
+        if self.mqtt_client is not None:
+            self.mqtt_client.start()
+        
+        self._load_saved_settings()
+        
+        if self.adaptive_idle_timeout != 'off':
+            self.gap_learner.load(self.state_file.get('idle_gaps'))
+            self.runtime.last_print_end = self.state_file.get('last_print_end')
+            self._gap_timer = self.reactor.register_timer(self._track_print_gaps, self.reactor.monotonic() + 5.)
         
         try:
             if self._verify_power_device():
@@ -645,12 +3919,23 @@ class AutoPowerOff:
                 self.logger.warning(self.get_text("power_device_not_available", device=self.power_device))
         except (PowerDeviceNotFoundError, PowerDeviceError) as e:
             self.logger.error(str(e))
+
+    def _handle_disconnect(self) -> None:
+        """
+        Close the connections kept open to remote backends on klippy:disconnect.
         
-        # Set up periodic temperature checker
-        self.reactor.register_timer(self._update_temps, self.reactor.monotonic() + 1)
-        
-        # Set up periodic device state checker
-        self.reactor.register_timer(self._verify_device_state, self.reactor.monotonic() + 10)
+        Returns:
+            None
+        """
+        if self.plug_driver is not None:
+            self.plug_driver.close()
+        if self.mqtt_client is not None:
+            self.mqtt_client.close()
+        self.moonraker.close()
+        self.moonraker_event_sender.close()
+        self.journal.flush()
+        if self.status_export is not None:
+            self.status_export.close()
 
     def _handle_print_complete(self) -> None:
         """
@@ -667,14 +3952,8 @@ class AutoPowerOff:
         
         self.logger.info(self.get_text("print_complete_starting_timer"))
         
-        # Cancel any existing timer
-        if self.shutdown_timer is not None:
-            self.reactor.unregister_timer(self.shutdown_timer)
-        
-        # Start the idle timer
-        waketime = self.reactor.monotonic() + self.idle_timeout
-        self.countdown_end = self.reactor.monotonic() + self.idle_timeout
-        self.shutdown_timer = self.reactor.register_timer(self._check_conditions, waketime)
+        # Start the idle timer, replacing any existing one
+        self._arm_timer()
 
     def _check_print_status_via_moonraker(self) -> Optional[str]:
         """
@@ -692,87 +3971,75 @@ class AutoPowerOff:
         if not self.moonraker_integration:
             return None
         
+        breaker = self.circuit_breakers['moonraker']
+        if not breaker.allow():
+            self._diagnostic_log("Moonraker circuit open, skipping print status check / Circuit Moonraker ouvert, vérification ignorée", level="debug")
+            return None
+        
         try:
-            base_url = self.moonraker_url.rstrip('/')
-            curl_command = f'curl -s "{base_url}/printer/objects/query?print_stats=state"'
-            result = subprocess.run(curl_command, shell=True, capture_output=True, text=True, timeout=5)
-            
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                if 'result' in data and 'status' in data['result']:
-                    state = data['result']['status'].get('print_stats', {}).get('state')
-                    self._diagnostic_log(f"Moonraker print state: {state}", level="info")
-                    return state
+            data = self.moonraker.call('printer.objects.query', 'POST', '/printer/objects/query',
+                                       {'objects': {'print_stats': ['state']}}, timeout=5)
+            breaker.record_success()
+            if isinstance(data, dict) and 'status' in data:
+                state = data['status'].get('print_stats', {}).get('state')
+                self._diagnostic_log(f"Moonraker print state: {state} (via {self.moonraker.transport})", level="info")
+                return state
             
             return None
         except Exception as e:
+            breaker.record_failure()
             error_msg = f"Error checking print status via Moonraker: {str(e)}"
             self._diagnostic_log(error_msg, level="warning")
             raise MoonrakerApiError(error_msg) from e
 
-    def _get_printer_state(self, eventtime: float) -> PrinterState:
+    def _check_job_queue(self) -> int:
         """
-        Get the current state of the printer.
+        Count the jobs that Moonraker's job queue will start on its own.
         
-        This method checks different sources to determine if the printer
-        is printing, idle, etc.
+        A paused queue does not start jobs, so it does not keep the printer
+        on. Errors and an open circuit count as an empty queue: an unreachable
+        Moonraker must not prevent the power off. A Moonraker without
+        [job_queue] answers "method not found": that is remembered and not
+        counted against the Moonraker circuit breaker, which the power off
+        and power on also use.
         
-        Args:
-            eventtime: Current event time from Klipper
-            
         Returns:
-            PrinterState: The current state of the printer
+            int: Number of pending jobs
         """
-        # Check if MCU is connected
-        if not self._is_mcu_connected():
-            return PrinterState.UNKNOWN
-        
-        # Check print_stats
-        try:
-            print_stats = self.printer.lookup_object('print_stats', None)
-            if print_stats:
-                state = print_stats.get_status(eventtime)['state']
-                if state in ['printing', 'paused']:
-                    return PrinterState.PRINTING if state == 'printing' else PrinterState.PAUSED
-        except Exception as e:
-            self._diagnostic_log(f"Error checking print_stats: {str(e)}", level="warning")
-        
-        # Check gcode_move
-        try:
-            gcode_move = self.printer.lookup_object('gcode_move')
-            if gcode_move and gcode_move.get_status(eventtime).get('is_printing', False):
-                return PrinterState.PRINTING
-        except Exception as e:
-            self._diagnostic_log(f"Error checking gcode_move: {str(e)}", level="warning")
+        if not (self.moonraker_integration and self.job_queue_aware) or self._job_queue_missing:
+            return 0
         
-        # Check via Moonraker
-        if self.moonraker_integration:
-            try:
-                moonraker_state = self._check_print_status_via_moonraker()
-                if moonraker_state in ['printing', 'paused']:
-                    return PrinterState.PRINTING if moonraker_state == 'printing' else PrinterState.PAUSED
-            except MoonrakerApiError as e:
-                self._diagnostic_log(f"Error checking Moonraker: {str(e)}", level="warning")
+        breaker = self.circuit_breakers['moonraker']
+        if not breaker.allow():
+            return 0
         
-        # Check if printer is idle
         try:
-            idle_timeout_obj = self.printer.lookup_object('idle_timeout')
-            idle_state = idle_timeout_obj.get_status(eventtime)['state']
-            if idle_state == 'Idle':
-                return PrinterState.IDLE
-            else:
-                return PrinterState.BUSY
-        except Exception as e:
-            self._diagnostic_log(f"Error checking idle_timeout: {str(e)}", level="warning")
+            data = self.moonraker.call('server.job_queue.status', 'GET', '/server/job_queue/status', timeout=2)
+            breaker.record_success()
+        except MoonrakerApiError as e:
+            if e.code in MoonrakerApiError.METHOD_NOT_FOUND:
+                # Moonraker answered: the job queue is just not enabled / File de travaux non activée
+                breaker.record_success()
+                self._job_queue_missing = True
+                self.logger.info(f"Moonraker has no job queue, not checking it: {str(e)} / Moonraker sans file de travaux")
+                return 0
+            breaker.record_failure()
+            self._diagnostic_log(f"Error checking Moonraker job queue: {str(e)}", level="warning")
+            return 0
         
-        return PrinterState.UNKNOWN
+        if not isinstance(data, dict) or data.get('queue_state') == 'paused':
+            return 0
+        count = len(data.get('queued_jobs') or [])
+        self._diagnostic_log(f"Moonraker job queue: state={data.get('queue_state')}, jobs={count}", level="info")
+        return count
 
     def _check_conditions(self, eventtime: float) -> float:
         """
         Check if conditions for power off are met.
         
-        This method checks if the printer is idle and if temperatures
-        are below the threshold. If all conditions are met, it powers off the printer.
+        The conditions of the pipeline run cheapest first and the first veto
+        cancels or postpones the power off. If all conditions are met, it
+        powers off the printer.
         
         Args:
             eventtime: Current event time from Klipper
@@ -780,79 +4047,118 @@ class AutoPowerOff:
         Returns:
             float: Time for next check or NEVER if conditions are met
         """
-        # Get printer state
-        printer_state = self._get_printer_state(eventtime)
-        
-        # If printer is printing or paused, cancel shutdown
-        if printer_state in [PrinterState.PRINTING, PrinterState.PAUSED]:
-            self.logger.info(self.get_text("print_in_progress"))
-            return self.reactor.NEVER
-        
-        # If printer is not idle, postpone shutdown
-        if printer_state != PrinterState.IDLE:
-            self.logger.info(self.get_text("printer_not_idle"))
-            return eventtime + 60.0  # Recheck in 60 seconds
-        
-        # Check temperatures
-        temps: Dict[str, float] = {}
-        max_temp: float = 0.0
+        # G-code activity since the countdown started pushes the deadline back
+        if self.reset_on_activity and self.runtime.last_activity > self.runtime.countdown_start:
+            self.runtime.countdown_start = self.runtime.last_activity
+            deadline = self.runtime.last_activity + self._effective_idle_timeout()
+            if deadline > eventtime:
+                self._diagnostic_log("G-code activity detected, countdown restarted / Activité G-code détectée, compte à rebours relancé", level="info")
+                self.journal.record(Decision.ACTIVITY, next_check=round(deadline - eventtime, 1))
+                return self._postpone(deadline, Decision.ACTIVITY.value)
         
         try:
-            heaters = self.printer.lookup_object('heaters')
-            
-            # Check hotend if enabled
-            if self.monitor_hotend:
-                try:
-                    hotend = self.printer.lookup_object('extruder').get_heater()
-                    hotend_temp = heaters.get_status(eventtime)[hotend.get_name()]['temperature']
-                    temps['hotend'] = hotend_temp
-                    max_temp = max(max_temp, hotend_temp)
-                except Exception as e:
-                    self.logger.warning(f"Unable to get hotend temperature: {str(e)}")
-            
-            # Check bed if enabled
-            if self.monitor_bed:
-                try:
-                    bed = self.printer.lookup_object('heater_bed', None)
-                    if bed is not None:
-                        bed_temp = heaters.get_status(eventtime)[bed.get_heater().get_name()]['temperature']
-                        temps['bed'] = bed_temp
-                        max_temp = max(max_temp, bed_temp)
-                except Exception as e:
-                    self.logger.warning(f"Unable to get bed temperature: {str(e)}")
-            
-            # Check chamber if enabled
-            if self.monitor_chamber:
-                try:
-                    chamber = self.printer.lookup_object('temperature_sensor chamber', None)
-                    if chamber is not None:
-                        chamber_temp = chamber.get_status(eventtime)['temperature']
-                        temps['chamber'] = chamber_temp
-                        max_temp = max(max_temp, chamber_temp)
-                except Exception as e:
-                    self.logger.warning(f"Unable to get chamber temperature: {str(e)}")
+            veto = self.conditions.evaluate(eventtime)
+            if veto is not None:
+                self.logger.info(veto.message)
+                if veto.cancel:
+                    self.journal.record(veto.decision, **veto.fields)
+                    return self._cancel_timer(veto.decision.value)
+                self.journal.record(veto.decision, **veto.fields, next_check=60.0)
+                return self._postpone(eventtime + 60.0, veto.decision.value)  # Recheck in 60 seconds
             
-            # Update last temperatures for status
-            self.last_temps = temps
-            
-            # Check if max temperature is below threshold
-            if max_temp > self.temp_threshold:
-                temp_msg = ", ".join(f"{key}: {value:.1f}°C" for key, value in temps.items())
-                self.logger.info(self.get_text("temperatures_too_high_custom", temp_msg=temp_msg, max_temp=max_temp))
-                return eventtime + 60.0  # Recheck in 60 seconds
-            
-            # All conditions met, power off the printer
+            # All conditions met, power off the printer. Pending entries are
+            # written first in case the host loses power with the printer.
+            temps = self._rounded_temps(self.runtime.temps)
+            self.journal.flush()
             try:
                 self._power_off()
             except (PowerOffError, NetworkDeviceError, MoonrakerApiError) as e:
                 self.logger.error(f"Error during power off: {str(e)}")
-                return eventtime + 60.0  # Retry in 60 seconds
+                self.journal.record(Decision.POWER_OFF_FAILED, flush=True, temps=temps,
+                                    error=str(e), next_check=60.0)
+                return self._postpone(eventtime + 60.0, Decision.POWER_OFF_FAILED.value)  # Retry in 60 seconds
             
-            return self.reactor.NEVER
+            self.journal.record(Decision.POWER_OFF, flush=True, temps=temps,
+                                method=self.optimal_method.name if self.optimal_method else None,
+                                outcome='dry_run' if self.dry_run_mode else self.runtime.state)
+            return self._cancel_timer(None)
         
         except Exception as e:
             self.logger.error(f"Error checking conditions: {str(e)}")
-            return eventtime + 60.0  # Retry in 60 seconds
+            self.journal.record(Decision.ERROR, error=str(e), next_check=60.0)
+            return self._postpone(eventtime + 60.0, Decision.ERROR.value)  # Retry in 60 seconds
+
+    def _postpone(self, waketime: float, reason: str) -> float:
+        """
+        Move the next check of the countdown and send auto_power_off:postponed.
+        
+        Args:
+            waketime: Reactor time of the next check
+            reason: Decision value behind the postpone
+            
+        Returns:
+            float: waketime, to be returned by the timer callback
+        """
+        self._set_deadline(waketime)
+        self._emit(PowerOffEvent.POSTPONED, reason)
+        return waketime
+
+    def _monitored_temps(self, eventtime: float) -> Dict[str, float]:
+        """
+        Read the temperatures selected by monitor_hotend, monitor_bed and
+        monitor_chamber.
+        
+        Args:
+            eventtime: Current event time from Klipper
+            
+        Returns:
+            dict: Temperatures in °C by component
+            
+        Raises:
+            Exception: If Klipper's heaters object is missing
+        """
+        temps: Dict[str, float] = {}
+        heaters = self.printer.lookup_object('heaters')
+        
+        # Check hotend if enabled
+        if self.monitor_hotend:
+            try:
+                hotend = self.printer.lookup_object('extruder').get_heater()
+                hotend_temp = heaters.get_status(eventtime)[hotend.get_name()]['temperature']
+                temps['hotend'] = hotend_temp
+            except Exception as e:
+                self.logger.warning(f"Unable to get hotend temperature: {str(e)}")
+        
+        # Check bed if enabled
+        if self.monitor_bed:
+            try:
+                bed = self.printer.lookup_object('heater_bed', None)
+                if bed is not None:
+                    bed_temp = heaters.get_status(eventtime)[bed.get_heater().get_name()]['temperature']
+                    temps['bed'] = bed_temp
+            except Exception as e:
+                self.logger.warning(f"Unable to get bed temperature: {str(e)}")
+        
+        # Check chamber if enabled
+        if self.monitor_chamber:
+            try:
+                chamber = self.printer.lookup_object('temperature_sensor chamber', None)
+                if chamber is not None:
+                    chamber_temp = chamber.get_status(eventtime)['temperature']
+                    temps['chamber'] = chamber_temp
+            except Exception as e:
+                self.logger.warning(f"Unable to get chamber temperature: {str(e)}")
+        
+        return temps
+
+    @staticmethod
+    def _rounded_temps(temps: Dict[str, float]) -> Dict[str, float]:
+        return {name: round(value, 1) for name, value in temps.items()}
+
+    @staticmethod
+    def _status_temps(temps: Dict[str, float]) -> Dict[str, float]:
+        """Temperatures as published in the status, to 1 °C / Températures publiées, au degré près"""
+        return {name: float(round(value)) for name, value in temps.items()}
 
     def _is_mcu_connected(self) -> bool:
         """
@@ -899,7 +4205,7 @@ class AutoPowerOff:
             PowerOffError: If there's an error preparing for shutdown
         """
         try:
-            if self._shutdown_in_progress:
+            if self.runtime.shutdown_in_progress:
                 self.logger.info(self.get_text("shutdown_in_progress"))
                 return
             
@@ -907,14 +4213,13 @@ class AutoPowerOff:
                 self.logger.warning(self.get_text("printer_already_shutdown"))
                 return
             
-            self._shutdown_in_progress = True
-            self._shutdown_start_time = self.reactor.monotonic()  # Enregistrer le moment du début de l'extinction
+            self.runtime.shutdown_in_progress = True
+            self.runtime.shutdown_start_time = self.reactor.monotonic()  # Enregistrer le moment du début de l'extinction
             self._diagnostic_log("Preparing MCU for shutdown / Préparation du MCU pour l'extinction", level="info")
             
             try:
-                gcode = self.printer.lookup_object('gcode')
-                gcode.run_script_from_command("TURN_OFF_HEATERS")
-                time.sleep(0.5)
+                self._run_own_script("TURN_OFF_HEATERS")
+                self._sleep(0.5)
             except Exception as e:
                 error_msg = f"Error disabling heaters: {str(e)}"
                 self._diagnostic_log(self.get_text("error_disabling_heaters", error=str(e)), level="warning")
@@ -925,67 +4230,78 @@ class AutoPowerOff:
             self._diagnostic_log(self.get_text("error_preparing_shutdown", error=str(e)), level="warning")
             raise PowerOffError(error_msg) from e
 
-    def _execute_curl_with_retry(self, command: str, max_retries: int, retry_delay: int, timeout: int = 10) -> subprocess.CompletedProcess:
+    def _moonraker_call_with_retry(self, rpc_method: str, http_method: str, path: str,
+                                   params: Dict[str, Any], max_retries: int, retry_delay: int,
+                                   timeout: int = 10, client: Optional[MoonrakerClient] = None) -> Any:
         """
-        Execute a curl command with retry logic.
+        Call a Moonraker API method with retry logic.
+        
+        Retries wait an exponentially growing, jittered delay based on
+        retry_delay, and stop once power_off_retry_budget seconds would be
+        exceeded. Every failed attempt is reported to the Moonraker circuit
+        breaker; while the circuit is open the call fails immediately.
         
         Args:
-            command: The curl command to execute
+            rpc_method: JSON-RPC method name used over the Unix socket
+            http_method: HTTP method used over HTTP
+            path: HTTP path used over HTTP
+            params: Method parameters
             max_retries: Maximum number of retry attempts
-            retry_delay: Delay between retries in seconds
-            timeout: Timeout for the curl command in seconds
+            retry_delay: Base delay between retries in seconds
+            timeout: Timeout for each attempt in seconds
+            client: Moonraker client to use instead of the module's, for
+                calls made outside the reactor thread
             
         Returns:
-            subprocess.CompletedProcess: The completed process if successful
+            Any: Moonraker's result if successful
             
         Raises:
-            MoonrakerApiError: If all retries fail
+            MoonrakerApiError: If all retries fail or the circuit is open
         """
+        breaker = self.circuit_breakers['moonraker']
+        client = client if client is not None else self.moonraker
+        start_time = self._clock()
         retry_count = 0
         last_error: Optional[Exception] = None
         
         while retry_count < max_retries:
-            self._diagnostic_log(f"Power off attempt {retry_count + 1}/{max_retries} / Tentative d'extinction {retry_count + 1}/{max_retries}", level="info")
+            if not breaker.allow():
+                error_msg = "Moonraker circuit is open / Circuit Moonraker ouvert"
+                self._diagnostic_log(error_msg, level="warning")
+                last_error = MoonrakerApiError(error_msg)
+                break
+            
+            self._diagnostic_log(f"Moonraker {rpc_method} attempt {retry_count + 1}/{max_retries} / Tentative Moonraker {retry_count + 1}/{max_retries}", level="info")
+            
+            # Never let one attempt outlast the retry budget / Une tentative ne dépasse jamais le budget
+            remaining = self.power_off_retry_budget - (self._clock() - start_time)
+            attempt_timeout = min(timeout, max(1., remaining))
             
             try:
-                result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=timeout)
-                
-                if result.returncode == 0:
-                    try:
-                        response_data = json.loads(result.stdout)
-                        self._diagnostic_log(f"Curl command response: {response_data}", level="info")
-                        
-                        if 'error' in response_data:
-                            error_msg = f"Moonraker API error: {response_data['error']}"
-                            self._diagnostic_log(error_msg, level="error")
-                            last_error = MoonrakerApiError(error_msg)
-                        else:
-                            return result
-                    
-                    except json.JSONDecodeError:
-                        self._diagnostic_log("Non-JSON response but curl successful: " + result.stdout[:200], level="info")
-                        return result
-                
-                else:
-                    error_msg = f"Curl command failed (code {result.returncode}): {result.stderr}"
-                    self._diagnostic_log(error_msg, level="error")
-                    last_error = MoonrakerApiError(error_msg)
+                result = client.call(rpc_method, http_method, path, params, timeout=attempt_timeout)
+                self._diagnostic_log(f"Moonraker response via {client.transport}: {result}", level="info")
+                breaker.record_success()
+                return result
             
-            except subprocess.TimeoutExpired:
-                error_msg = "Curl command timed out / Délai d'attente expiré pour curl"
-                self._diagnostic_log(error_msg, level="error")
-                last_error = MoonrakerApiError(error_msg)
+            except MoonrakerApiError as e:
+                self._diagnostic_log(str(e), level="error")
+                last_error = e
             
             except Exception as e:
-                error_msg = f"Error executing curl command: {str(e)}"
+                error_msg = f"Error calling Moonraker: {str(e)}"
                 self._diagnostic_log(error_msg, level="error")
                 last_error = e
             
+            breaker.record_failure()
             retry_count += 1
             
             if retry_count < max_retries:
-                self._diagnostic_log(f"Retrying in {retry_delay} seconds... / Nouvelle tentative dans {retry_delay} secondes...", level="info")
-                time.sleep(retry_delay)
+                delay = jittered_backoff(retry_delay, retry_count - 1, 8 * retry_delay)
+                if self._clock() - start_time + delay > self.power_off_retry_budget:
+                    self._diagnostic_log("Retry budget exhausted / Budget de tentatives épuisé", level="warning")
+                    break
+                self._diagnostic_log(f"Retrying in {delay:.1f} seconds... / Nouvelle tentative dans {delay:.1f} secondes...", level="info")
+                self._sleep(delay)
         
         # If we get here, all retries failed
         error_msg = f"All {max_retries} retry attempts failed"
@@ -1001,13 +4317,50 @@ class AutoPowerOff:
         Cette méthode est utilisée pour s'assurer que le module est dans un état
         cohérent après un redémarrage ou un changement d'état du périphérique.
         """
-        self._shutdown_in_progress = False
-        if hasattr(self, '_shutdown_start_time'):
-            delattr(self, '_shutdown_start_time')
+        self.runtime.shutdown_in_progress = False
+        self.runtime.shutdown_start_time = None
         self._diagnostic_log("État d'extinction réinitialisé / Shutdown state reset", level="info")
 
+    def _sleep(self, seconds: float) -> None:
+        """Wait during the shutdown sequence; only counted during a dry run / Attente, seulement comptée en simulation"""
+        if self._dry_run is not None:
+            self._dry_run.wait(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _clock(self) -> float:
+        """Monotonic time including the delays simulated by a dry run / Temps monotone incluant les délais simulés"""
+        return time.monotonic() + (self._dry_run.simulated if self._dry_run is not None else 0.)
+
+    def _phase(self, name: str) -> None:
+        """Mark the start of a shutdown phase for the dry run report / Marque le début d'une phase"""
+        if self._dry_run is not None:
+            self._dry_run.phase(name)
+
 
     def _power_off(self, force_direct: bool = False, diagnostic_mode: Optional[bool] = None) -> None:
+        """
+        Power off the printer, or simulate it when dry_run_mode is enabled.
+        
+        Args:
+            force_direct: Force direct Klipper method instead of Moonraker API
+            diagnostic_mode: Override global diagnostic mode setting
+            
+        Returns:
+            None
+        """
+        self._emit(PowerOffEvent.POWERING_OFF)
+        if self.dry_run_mode:
+            report = self._power_off_dry_run(force_direct, diagnostic_mode)
+            if report['outcome'] in DryRunRecorder.BACKENDS:
+                self._emit(PowerOffEvent.POWERED_OFF)
+            return
+        self._shutdown_sequence(force_direct, diagnostic_mode)
+        # An MQTT command is confirmed later by _handle_mqtt_result / Confirmée plus tard pour MQTT
+        if self.runtime.state == "off":
+            self._emit(PowerOffEvent.POWERED_OFF)
+
+    def _shutdown_sequence(self, force_direct: bool = False, diagnostic_mode: Optional[bool] = None) -> None:
         """
         Power off the printer with error handling and retry mechanism.
         
@@ -1025,6 +4378,7 @@ class AutoPowerOff:
             MoonrakerApiError: If there's an error with the Moonraker API
         """
         self._reset_shutdown_state()
+        self._phase('state_checks')
     
         try:
             if self.printer.is_shutdown():
@@ -1040,10 +4394,7 @@ class AutoPowerOff:
                 base_url = self.moonraker_url.rstrip('/')
                 power_status_url = f"{base_url}/printer/objects/query?objects=power_devices"
                 power_off_url = f"{base_url}/machine/device_power/device?device={self.power_device}&action=off"
-                self._diagnostic_log(f"Moonraker URLs: status={power_status_url}, power_off={power_off_url}", level="info")
-            
-            # Indique qu'une extinction est en cours
-            self._shutdown_in_progress = True
+                self._diagnostic_log(f"Moonraker URLs: status={power_status_url}, power_off={power_off_url}, socket={self.moonraker.socket_path}", level="info")
             
             if self.device_state != DeviceState.AVAILABLE:
                 error_msg = f"Power device '{self.power_device}' not available for power off"
@@ -1057,6 +4408,7 @@ class AutoPowerOff:
             
             # For network devices, test connectivity first
             if self.network_device:
+                self._phase('network_test')
                 try:
                     self._test_network_device()
                 except NetworkDeviceUnreachableError as e:
@@ -1065,69 +4417,196 @@ class AutoPowerOff:
                     self._reset_shutdown_state()  # Réinitialisation en cas d'erreur
                     raise
             
-            # If dry run mode is enabled, simulate power off
-            if self.dry_run_mode:
-                self._reset_shutdown_state()  # Réinitialisation après simulation
-                return self._power_off_dry_run()
-            
-            # Prepare the MCU for shutdown
+            # Prepare the MCU for shutdown. This also marks the shutdown as in
+            # progress / Marque aussi l'extinction comme en cours
+            self._phase('preflight')
             try:
                 self._prepare_mcu_for_shutdown()
-                time.sleep(1)
+                self._sleep(1)
             except Exception as e:
                 self._reset_shutdown_state()  # Réinitialisation en cas d'erreur
                 raise
             
-            # Use Moonraker API if enabled and not forced to use direct method
-            if self.moonraker_integration and not force_direct:
-                self._diagnostic_log("Using Moonraker API for power off / Utilisation de l'API Moonraker pour extinction", level="info")
-                
+            # Talk to the smart plug directly first, without the Moonraker hop
+            if self.plug_driver is not None and not force_direct:
+                self._phase('plug')
                 try:
-                    curl_cmd = f'curl -s -X POST "{self.moonraker_url.rstrip("/")}/machine/device_power/device?device={self.power_device}&action=off"'
-                    result = self._execute_curl_with_retry(curl_cmd, self.power_off_retries, self.power_off_retry_delay, timeout=10)
-                    
-                    try:
-                        json.loads(result.stdout)
-                    except json.JSONDecodeError:
-                        pass
-                    
-                    self.logger.info(self.get_text("powered_off_moonraker"))
-                    self._notify_user("power_off_success")
-                    self.state = "off"
-                    # Ne pas réinitialiser _shutdown_in_progress ici, car l'appareil va s'éteindre
+                    self._power_off_plug()
                     return
-                
-                except MoonrakerApiError as e:
-                    self.logger.error(self.get_text("error_moonraker_all_retries_failed", retries=self.power_off_retries, error=str(e)))
-                    self._notify_user("moonraker_retries_failed")
-                    self.logger.info(self.get_text("falling_back_to_direct"))
-                    
-                    try:
-                        self._prepare_mcu_for_shutdown()
-                        time.sleep(1)
-                        self._power_off_direct()
-                    except PowerOffError as direct_error:
-                        self.logger.error(f"Direct method also failed: {str(direct_error)}")
-                        self.state = "error"
-                        self._reset_shutdown_state()  # Réinitialisation en cas d'échec
-                        raise
+                except NetworkDeviceError as e:
+                    self.logger.error(self.get_text("plug_power_off_failed", method=self.plug_driver.method.name, error=str(e)))
+            
+            # MQTT confirms asynchronously; on failure _handle_mqtt_result
+            # resumes the chain / MQTT confirme de façon asynchrone
+            if self.mqtt_client is not None and not force_direct:
+                self._phase('mqtt')
+                if self._power_off_mqtt():
+                    return
+            
+            self._power_off_fallback(force_direct)
+            
+        except (PowerOffError, NetworkDeviceError, MoonrakerApiError) as e:
+            self._reset_shutdown_state()  # Réinitialisation en cas d'erreur spécifique
+            raise
+        
+        except Exception as e:
+            error_msg = f"Unhandled exception during power off: {str(e)}"
+            self.logger.error(error_msg)
+            self._diagnostic_log(error_msg, level="error", data=e)
+            self._reset_shutdown_state()  # Réinitialisation en cas d'erreur générique
+            raise PowerOffError(error_msg) from e
+        
+    def _power_off_fallback(self, force_direct: bool) -> None:
+        """
+        Power off through Moonraker, then through the Klipper power object.
+        
+        This is the end of the power off chain, after the direct plug and
+        MQTT backends.
+        
+        Args:
+            force_direct: Skip Moonraker and use the Klipper power object
+            
+        Returns:
+            None
+            
+        Raises:
+            PowerOffError: If every method failed
+        """
+        # Use Moonraker API if enabled and not forced to use direct method
+        if self.moonraker_integration and not force_direct:
+            self._phase('moonraker')
+            self._diagnostic_log("Using Moonraker API for power off / Utilisation de l'API Moonraker pour extinction", level="info")
+
+            try:
+                result = self._moonraker_call_with_retry(
+                    'machine.device_power.post_device', 'POST', '/machine/device_power/device',
+                    {'device': self.power_device, 'action': 'off'},
+                    self.power_off_retries, self.power_off_retry_delay, timeout=10)
+                # Moonraker answers with the state the device reached. Only an
+                # explicit 'off' counts: a plug that stayed on, or an answer
+                # without the device (proxy error page, truncated body), is a failure
+                # Seul un 'off' explicite compte comme une extinction réussie
+                device_state = result.get(self.power_device) if isinstance(result, dict) else None
+                if device_state != 'off':
+                    raise MoonrakerApiError(
+                        f"Moonraker did not confirm that device '{self.power_device}' is off (state: {device_state})")
+
+                self.logger.info(self.get_text("powered_off_moonraker"))
+                self._notify_user("power_off_success")
+                self.runtime.state = "off"
+                # Ne pas réinitialiser _shutdown_in_progress ici, car l'appareil va s'éteindre
+                return
+
+            except MoonrakerApiError as e:
+                self.logger.error(self.get_text("error_moonraker_all_retries_failed", retries=self.power_off_retries, error=str(e)))
+                self._notify_user("moonraker_retries_failed")
+                self.logger.info(self.get_text("falling_back_to_direct"))
+
+                try:
+                    self._prepare_mcu_for_shutdown()
+                    self._sleep(1)
+                    self._phase('direct')
+                    self._power_off_direct()
+                except PowerOffError as direct_error:
+                    self.logger.error(f"Direct method also failed: {str(direct_error)}")
+                    self.runtime.state = "error"
+                    self._reset_shutdown_state()  # Réinitialisation en cas d'échec
+                    raise
+
+        else:
+            self._phase('direct')
+            method = "direct (forced)" if force_direct else "direct"
+            self._diagnostic_log(f"Using {method} Klipper method for power off / Utilisation de la méthode {method} pour extinction", level="info")
+            self._power_off_direct()
+
+    def _power_off_mqtt(self) -> bool:
+        """
+        Send the power off command over MQTT.
+        
+        The result is delivered to _handle_mqtt_result from the MQTT thread.
+        
+        Returns:
+            bool: True if the command was dispatched, False if the circuit is open
+        """
+        if not self.circuit_breakers['mqtt'].allow():
+            self.logger.error(self.get_text("plug_power_off_failed", method="MQTT",
+                                            error="circuit is open / circuit ouvert"))
+            return False
+        self._diagnostic_log("Using MQTT for power off / Utilisation de MQTT pour extinction", level="info")
+        self.mqtt_client.request_power(False, self._handle_mqtt_result)
+        return True
+
+    def _handle_mqtt_result(self, eventtime: float, error: Optional[str]) -> None:
+        """
+        Finish an MQTT power off, or continue the chain if it failed.
+        
+        Args:
+            eventtime: Current event time from Klipper
+            error: None if the plug confirmed the command, otherwise the error message
             
-            else:
-                method = "direct (forced)" if force_direct else "direct"
-                self._diagnostic_log(f"Using {method} Klipper method for power off / Utilisation de la méthode {method} pour extinction", level="info")
-                self._power_off_direct()
+        Returns:
+            None
+        """
+        breaker = self.circuit_breakers['mqtt']
+        if error is None:
+            breaker.record_success()
+            self.logger.info(self.get_text("powered_off_plug", method="MQTT"))
+            self._notify_user("power_off_success")
+            self.runtime.state = "off"
+            if self._dry_run is None:
+                self._emit(PowerOffEvent.POWERED_OFF)
+            return
+        breaker.record_failure()
+        self.logger.error(self.get_text("plug_power_off_failed", method="MQTT", error=error))
+        try:
+            self._power_off_fallback(self.force_direct)
+            if self._dry_run is None and self.runtime.state == "off":
+                self._emit(PowerOffEvent.POWERED_OFF)
+        except (PowerOffError, MoonrakerApiError) as e:
+            self.logger.error(f"Power off failed after MQTT error: {str(e)}")
+            self._reset_shutdown_state()
+        except Exception as e:
+            self.logger.error(f"Unhandled exception during power off: {str(e)}")
+            self._diagnostic_log(str(e), level="error", data=e)
+            self._reset_shutdown_state()
+
+    def _power_off_plug(self) -> None:
+        """
+        Power off the printer through the direct smart plug driver.
+        
+        The plug's circuit breaker is honoured, and the state reported by the
+        plug after the command must be 'off' for the call to succeed.
+        
+        Returns:
+            None
             
-        except (PowerOffError, NetworkDeviceError, MoonrakerApiError) as e:
-            self._reset_shutdown_state()  # Réinitialisation en cas d'erreur spécifique
-            raise
+        Raises:
+            NetworkDeviceError: If the plug fails, stays on, or its circuit is open
+        """
+        breaker = self.circuit_breakers['plug']
+        method = self.plug_driver.method.name
+        if not breaker.allow():
+            raise NetworkDeviceUnreachableError(f"{method} plug circuit is open / Circuit de la prise {method} ouvert")
         
+        self._diagnostic_log(f"Using direct {method} driver for power off / Utilisation du pilote direct {method}", level="info")
+        try:
+            still_on = self.plug_driver.set_power(False)
+        except NetworkDeviceError:
+            breaker.record_failure()
+            raise
         except Exception as e:
-            error_msg = f"Unhandled exception during power off: {str(e)}"
-            self.logger.error(error_msg)
-            self._diagnostic_log(error_msg, level="error", data=e)
-            self._reset_shutdown_state()  # Réinitialisation en cas d'erreur générique
-            raise PowerOffError(error_msg) from e
+            breaker.record_failure()
+            raise NetworkDeviceError(f"{method} plug error: {str(e)}") from e
+        
+        if still_on:
+            breaker.record_failure()
+            raise NetworkDeviceError(f"{method} plug accepted the command but is still on")
         
+        breaker.record_success()
+        self.logger.info(self.get_text("powered_off_plug", method=method))
+        self._notify_user("power_off_success")
+        self.runtime.state = "off"
+
     def _verify_device_state(self, eventtime: float) -> float:
         """
         Vérifie périodiquement l'état du périphérique d'alimentation et réinitialise
@@ -1141,10 +4620,11 @@ class AutoPowerOff:
         """
         try:
             # Vérifier si un redémarrage est nécessaire
-            if self._shutdown_in_progress:
+            if self.runtime.shutdown_in_progress:
                 # Si l'extinction est en cours depuis plus de 30 secondes, 
                 # considérer qu'il y a eu un problème et réinitialiser
-                if hasattr(self, "_shutdown_start_time") and (self.reactor.monotonic() - self._shutdown_start_time) > 30:
+                start_time = self.runtime.shutdown_start_time
+                if start_time is not None and (self.reactor.monotonic() - start_time) > 30:
                     self._diagnostic_log("Réinitialisation forcée de l'état d'extinction après timeout / Forced reset of shutdown state after timeout", level="warning")
                     self._reset_shutdown_state()
             
@@ -1155,23 +4635,27 @@ class AutoPowerOff:
                 else:
                     # Si le périphérique est disponible et que l'extinction était en cours,
                     # cela signifie qu'il a été rallumé manuellement
-                    if self._shutdown_in_progress:
+                    if self.runtime.shutdown_in_progress:
                         self._diagnostic_log("Périphérique rallumé manuellement, réinitialisation de l'état / Device manually turned on, resetting state", level="info")
                         self._reset_shutdown_state()
             except Exception as e:
-                self._diagnostic_log(f"Erreur lors de la vérification du périphérique: {str(e)} / Error checking device: {str(e)}", level="warning")
+                self._diagnostic_log("Erreur lors de la vérification du périphérique / Error checking device: %s", e, level="warning")
         except Exception as e:
             self.logger.error(f"Erreur non gérée dans _verify_device_state: {str(e)} / Unhandled error in _verify_device_state: {str(e)}")
         
         # Vérifier toutes les 10 secondes
         return eventtime + 10.0
         
-    def _diagnostic_log(self, message: str, level: str = "debug", data: Any = None) -> None:
+    def _diagnostic_log(self, message: str, *args: Any, level: str = "debug", data: Any = None) -> None:
         """
         Log diagnostic information if diagnostic mode is enabled.
         
+        Periodic callers pass %-style args instead of an f-string, so nothing
+        is formatted while diagnostic mode is off.
+        
         Args:
-            message: The message to log
+            message: The message to log, optionally with %-style placeholders
+            args: Values for the placeholders
             level: The log level (debug, info, warning, error)
             data: Additional data to log
             
@@ -1179,16 +4663,34 @@ class AutoPowerOff:
             None
         """
         if level == "error":
-            self.logger.error(message)
+            self.logger.error(message, *args)
             if data:
-                self.logger.error(f"Error details: {data}")
+                self.logger.error("Error details: %s", data)
             return
         
-        if getattr(self, 'diagnostic_mode', False):
+        if self.diagnostic_mode:
             log_method = getattr(self.logger, level, self.logger.info)
-            log_method(f"DIAGNOSTIC: {message}")
+            log_method("DIAGNOSTIC: " + message, *args)
             if data:
-                log_method(f"DIAGNOSTIC DATA: {data}")
+                log_method("DIAGNOSTIC DATA: %s", data)
+
+    def _direct_method(self) -> Optional[PowerOffMethod]:
+        """
+        Get the best Klipper-side power off method.
+        
+        optimal_method may name a direct plug driver; when falling back to
+        Klipper control, the best method offered by the power object is used.
+        
+        Returns:
+            PowerOffMethod or None: The method to use for direct power off
+        """
+        for capability, method in (('set_power', PowerOffMethod.SET_POWER),
+                                   ('turn_off', PowerOffMethod.TURN_OFF),
+                                   ('power_off', PowerOffMethod.POWER_OFF),
+                                   ('cmd_off', PowerOffMethod.CMD_OFF)):
+            if self.device_capabilities.get(capability):
+                return method
+        return self.optimal_method
 
     def _power_off_direct(self) -> None:
         """
@@ -1219,34 +4721,36 @@ class AutoPowerOff:
                 device_name = f'power {self.power_device}'
                 self._diagnostic_log(f"Looking up power device: {device_name} / Recherche du périphérique d'alimentation", level="info")
                 power_device = self.printer.lookup_object(device_name)
+                if self._dry_run is not None:
+                    power_device = DryRunPowerObject(self._dry_run)
                 
                 # Make sure device capabilities have been checked
                 if self.optimal_method is None:
                     self._check_device_capabilities()
                 
-                # Use the optimal method determined during capability check
-                if self.optimal_method == PowerOffMethod.SET_POWER:
+                # Use the best Klipper method determined during capability check
+                method = self._direct_method()
+                if method == PowerOffMethod.SET_POWER:
                     self._diagnostic_log("Using set_power(0) method / Utilisation de la méthode set_power(0)", level="info")
                     power_device.set_power(0)
                     self.logger.info(self.get_text("powered_off_set_power"))
                     self._notify_user("power_off_success")
                 
-                elif self.optimal_method == PowerOffMethod.TURN_OFF:
+                elif method == PowerOffMethod.TURN_OFF:
                     self._diagnostic_log("Using turn_off() method / Utilisation de la méthode turn_off()", level="info")
                     power_device.turn_off()
                     self.logger.info(self.get_text("powered_off_turn_off"))
                     self._notify_user("power_off_success")
                 
-                elif self.optimal_method == PowerOffMethod.POWER_OFF:
+                elif method == PowerOffMethod.POWER_OFF:
                     self._diagnostic_log("Using power_off() method / Utilisation de la méthode power_off()", level="info")
                     power_device.power_off()
                     self.logger.info(self.get_text("powered_off_power_off"))
                     self._notify_user("power_off_success")
                 
-                elif self.optimal_method == PowerOffMethod.CMD_OFF:
+                elif method == PowerOffMethod.CMD_OFF:
                     self._diagnostic_log("Using GCODE POWER_OFF command / Utilisation de la commande GCODE POWER_OFF", level="info")
-                    gcode = self.printer.lookup_object('gcode')
-                    gcode.run_script_from_command(f"POWER_OFF {self.power_device}")
+                    self._run_own_script(f"POWER_OFF {self.power_device}")
                     self.logger.info(self.get_text("powered_off_gcode"))
                     self._notify_user("power_off_success")
                 
@@ -1256,7 +4760,7 @@ class AutoPowerOff:
                     self._notify_user("no_power_off_method")
                     raise PowerOffError(error_msg)
                 
-                self.state = "off"
+                self.runtime.state = "off"
             
             except self.printer.config_error as e:
                 self.logger.warning(f"Power device not found in Klipper: {str(e)} / Périphérique non trouvé dans Klipper")
@@ -1264,19 +4768,18 @@ class AutoPowerOff:
                 
                 # Try using GCODE POWER_OFF as fallback
                 try:
-                    gcode = self.printer.lookup_object('gcode')
                     self._diagnostic_log("Using GCODE POWER_OFF command as fallback / Utilisation de la commande GCODE POWER_OFF en solution de repli", level="info")
-                    gcode.run_script_from_command(f"POWER_OFF {self.power_device}")
+                    self._run_own_script(f"POWER_OFF {self.power_device}")
                     self.logger.info(self.get_text("powered_off_gcode"))
                     self._notify_user("power_off_success")
-                    self.state = "off"
+                    self.runtime.state = "off"
                     return
                 
                 except Exception as gcode_error:
                     error_msg = f"Failed to use GCODE POWER_OFF command: {str(gcode_error)}"
                     self.logger.error(f"{error_msg} / Échec de la commande GCODE POWER_OFF")
                     self._notify_user("power_off_failed", error="Could not find power device in Klipper / Périphérique non trouvé dans Klipper")
-                    self.state = "error"
+                    self.runtime.state = "error"
                     raise PowerOffError(error_msg) from gcode_error
             
             except Exception as e:
@@ -1285,7 +4788,7 @@ class AutoPowerOff:
                 # Check if this is an expected error during shutdown
                 if ("command request" in error_str or "shutdown" in error_str or "disconnected" in error_str):
                     self._diagnostic_log("Normal shutdown with MCU disconnect detected / Extinction normale avec déconnexion MCU détectée", level="info")
-                    self.state = "off"
+                    self.runtime.state = "off"
                     return
                 
                 # Otherwise, it's a real error
@@ -1293,7 +4796,7 @@ class AutoPowerOff:
                 self.logger.error(self.get_text("error_powering_off", error=str(e)))
                 self._diagnostic_log(error_msg, level="error", data=e)
                 self._notify_user("power_off_failed", error=str(e))
-                self.state = "error"
+                self.runtime.state = "error"
                 raise PowerOffError(error_msg) from e
         
         except (PowerDeviceNotAvailableError, PowerOffError):
@@ -1306,18 +4809,27 @@ class AutoPowerOff:
             # Check if this is an expected error during shutdown
             if ("command request" in error_str or "shutdown" in error_str or "disconnected" in error_str):
                 self._diagnostic_log("Normal shutdown with MCU disconnect detected / Extinction normale avec déconnexion MCU détectée", level="info")
-                self.state = "off"
+                self.runtime.state = "off"
                 return
             
             error_msg = f"Unhandled exception during direct power off: {str(e)}"
             self.logger.error(error_msg)
             self._diagnostic_log(error_msg, level="error", data=e)
-            self.state = "error"
+            self.runtime.state = "error"
             raise PowerOffError(error_msg) from e
 
+    # Maximum number of messages kept while the MCU is disconnected
+    NOTIFY_BUFFER_SIZE = 20
+
     def _notify_user(self, message_key: str, **kwargs) -> None:
         """
-        Send notification to user via GCODE response.
+        Queue a notification for the user.
+        
+        Identical messages sent within notify_dedup_window are dropped, and
+        messages queued within notify_coalesce_delay are combined into a single
+        console line by _flush_notifications. While a shutdown is in progress
+        the queue is flushed right away, as there may be no later reactor tick
+        before the power is cut.
         
         Args:
             message_key: The message key for translation
@@ -1326,117 +4838,274 @@ class AutoPowerOff:
         Returns:
             None
         """
-        if not self._is_mcu_connected():
-            message = self.get_text(message_key, **kwargs)
-            self.logger.info(f"User notification (not sent due to MCU state): {message}")
+        message = self.get_text(message_key, **kwargs)
+        if self._dry_run is not None:
+            self._dry_run.notifications.append(message)
+            return
+        now = self.reactor.monotonic()
+        last_sent = self._notify_last_sent.get(message)
+        if message in self._notify_pending or (
+                last_sent is not None and now - last_sent < self.notify_dedup_window):
+            self._diagnostic_log(f"Duplicate notification dropped: {message}", level="debug")
             return
         
+        self.logger.info(f"User notification: {message}")
+        self._notify_pending.append(message)
+        del self._notify_pending[:-self.NOTIFY_BUFFER_SIZE]
+        
+        if self.runtime.shutdown_in_progress:
+            self._flush_notifications(now)
+        elif self._notify_timer is None:
+            self._notify_timer = self.reactor.register_timer(
+                self._flush_notifications, now + self.notify_coalesce_delay)
+
+    def _flush_notifications(self, eventtime: float) -> float:
+        """
+        Send queued notifications to the console and the display.
+        
+        Pending messages are combined into one console line, and the last one
+        is written straight to the display_status object (what M117 does)
+        without going through the G-code parser or mutex. While the MCU is
+        disconnected the messages stay buffered and are retried later.
+        
+        Args:
+            eventtime: Current event time from Klipper
+            
+        Returns:
+            float: Time for next flush or NEVER when the queue is empty
+        """
+        if not self._notify_pending:
+            return self._stop_notify_timer()
+        
+        try:
+            connected = self._is_mcu_connected()
+        except MCUError:
+            connected = False
+        if not connected:
+            if self._notify_timer is None:
+                self._notify_timer = self.reactor.register_timer(
+                    self._flush_notifications, eventtime + 5.0)
+            else:
+                self.reactor.update_timer(self._notify_timer, eventtime + 5.0)
+            return eventtime + 5.0
+        
+        messages = self._notify_pending
+        self._notify_pending = []
+        for message in messages:
+            self._notify_last_sent[message] = eventtime
+        # Forget messages that left the deduplication window
+        for message in [m for m, t in self._notify_last_sent.items()
+                        if eventtime - t >= self.notify_dedup_window]:
+            del self._notify_last_sent[message]
+        
         try:
-            message = self.get_text(message_key, **kwargs)
             gcode = self.printer.lookup_object('gcode')
-            gcode.respond_info(message)
+            gcode.respond_info(" | ".join(messages))
             
             try:
-                display = self.printer.lookup_object('display', None)
-                if display:
+                display_status = self.printer.lookup_object('display_status', None)
+                if display_status is not None:
                     self._diagnostic_log("Sending notification to display / Envoi de notification à l'écran", level="info")
-                    short_msg = message[:40] + "..." if len(message) > 40 else message
-                    gcode.run_script_from_command(f"M117 {short_msg}")
+                    message = messages[-1]
+                    display_status.message = message[:40] + "..." if len(message) > 40 else message
             except Exception as display_err:
                 self._diagnostic_log(f"Could not send to display: {str(display_err)}", level="warning")
         
         except Exception as e:
             self.logger.warning(f"Failed to send notification to user: {str(e)}")
+        
+        return self._stop_notify_timer()
+
+    def _stop_notify_timer(self) -> float:
+        """Unregister the flush timer, if any / Désenregistre le minuteur d'envoi"""
+        if self._notify_timer is not None:
+            self.reactor.unregister_timer(self._notify_timer)
+            self._notify_timer = None
+        return self.reactor.NEVER
+
+    def _read_temp(self, name: str, eventtime: float) -> float:
+        """
+        Read the temperature of a heater object.
+        
+        Args:
+            name: Klipper object name (extruder, heater_bed)
+            eventtime: Current event time from Klipper
+            
+        Returns:
+            float: Temperature in °C, 0 when it cannot be read
+        """
+        try:
+            heater = self.printer.lookup_object(name)
+            if hasattr(heater, 'get_status'):
+                status = heater.get_status(eventtime)
+                if 'temperature' in status:
+                    return status['temperature']
+            stats = heater.stats(eventtime)
+            return stats['temp'] if 'temp' in stats else 0.
+        except Exception as e:
+            self.logger.debug("Error getting %s temp: %s", name, e)
+            return 0.
 
     def _update_temps(self, eventtime: float) -> float:
         """
         Update temperatures for status API.
         
+        The published temperatures are rounded to 1 °C, and the temps dict is
+        only replaced when a rounded value changed. Only the hotend and bed
+        keys belong to this timer: the temperature condition also publishes
+        the chamber, which the new dict keeps. Klipper reports readings
+        to 0.01 °C, so sensor noise alone would otherwise change the status,
+        and send an update to every subscribed client, every second.
+        The temperature history keeps the raw readings.
+        
         Args:
             eventtime: Current event time from Klipper
             
         Returns:
             float: Time for next update
         """
-        temps: Dict[str, float] = {}
-        
         try:
-            # Try to get extruder temperature
-            try:
-                extruder = self.printer.lookup_object('extruder')
-                if extruder and hasattr(extruder, 'get_status'):
-                    status = extruder.get_status(eventtime)
-                    if 'temperature' in status:
-                        temps['hotend'] = status['temperature']
-            except Exception as e:
-                self.logger.debug(f"Error getting extruder temp: {str(e)}")
-            
-            # Try to get bed temperature
-            try:
-                heater_bed = self.printer.lookup_object('heater_bed')
-                if heater_bed and hasattr(heater_bed, 'get_status'):
-                    status = heater_bed.get_status(eventtime)
-                    if 'temperature' in status:
-                        temps['bed'] = status['temperature']
-            except Exception as e:
-                self.logger.debug(f"Error getting bed temp: {str(e)}")
-            
-            # Fallback for extruder temperature
-            if 'hotend' not in temps:
-                try:
-                    stats = self.printer.lookup_object('extruder').stats(eventtime)
-                    if 'temp' in stats:
-                        temps['hotend'] = stats['temp']
-                except:
-                    temps['hotend'] = 0.0
-            
-            # Fallback for bed temperature
-            if 'bed' not in temps:
-                try:
-                    stats = self.printer.lookup_object('heater_bed').stats(eventtime)
-                    if 'temp' in stats:
-                        temps['bed'] = stats['temp']
-                except:
-                    temps['bed'] = 0.0
-            
-            self.last_temps = temps
-        
+            hotend = self._read_temp('extruder', eventtime)
+            bed = self._read_temp('heater_bed', eventtime)
+            temps = self.runtime.temps
+            # round() gives cached small ints, so an unchanged reading allocates nothing
+            # round() renvoie de petits entiers en cache : rien n'est alloué si rien ne change
+            hotend_status = round(hotend)
+            bed_status = round(bed)
+            if temps.get('hotend') != hotend_status or temps.get('bed') != bed_status:
+                # Copied, the status cache compares by identity / Copié, le cache du statut compare l'identité
+                temps = dict(temps)
+                temps['hotend'] = float(hotend_status)
+                temps['bed'] = float(bed_status)
+                self.runtime.temps = temps
+            if self.temp_history.tiers:
+                chamber = math.nan
+                if self.monitor_chamber and self.printer.lookup_object('temperature_sensor chamber', None) is not None:
+                    chamber = self._read_temp('temperature_sensor chamber', eventtime)
+                self.temp_history.add(eventtime, hotend if self.monitor_hotend else math.nan,
+                                      bed if self.monitor_bed else math.nan, chamber)
         except Exception as e:
             self.logger.error(f"Error updating temperatures: {str(e)}")
+        self._export_status(eventtime)
         
-        # Schedule next update in 1 second
-        return eventtime + 1.0
+        self.runtime.sample_interval = interval = self._sample_interval(eventtime)
+        return eventtime + interval
 
-    def get_status(self, eventtime: float) -> Dict[str, Any]:
+    # Seconds a UI stays counted as subscribed after its last status query
+    STATUS_QUERY_WINDOW = 5.0
+
+    def _sample_interval(self, eventtime: float) -> float:
+        """
+        Choose the period of the next temperature reading.
+        
+        Readings are taken every second during a countdown (the printer
+        cools toward temp_threshold and the deadline may come at any time)
+        and while a UI polls the status. Otherwise nothing depends on fresh
+        readings and the period is idle_sample_interval; the temperature
+        history then holds one point per idle_sample_interval in its finest
+        tiers.
+        
+        Args:
+            eventtime: Current event time from Klipper
+            
+        Returns:
+            float: Seconds until the next reading
+        """
+        if self.shutdown_timer is not None or eventtime - self.runtime.last_status_query < self.STATUS_QUERY_WINDOW:
+            return 1.
+        return self.idle_sample_interval
+
+    def _sample_now(self) -> None:
+        """
+        Take the next temperature reading right away and return to full rate.
+        Relève les températures tout de suite et repasse à la cadence complète.
+        """
+        self.runtime.sample_interval = 1.
+        if self._temps_timer is not None:
+            self.reactor.update_timer(self._temps_timer, self.reactor.NOW)
+
+    def get_status(self, eventtime: float, query: bool = True) -> Dict[str, Any]:
         """
         Get status for Fluidd/Mainsail API.
         
+        Only fields that change during operation are returned here. Rarely
+        changing information (version, language, capabilities...) is published
+        by the separate printer['auto_power_off_info'] object.
+        
+        The payload is copy-on-write: the previous dict is returned as long as
+        no field changed, and a new one is built otherwise (Klipper's webhooks
+        compare against the objects they received last time, so a published
+        dict is never modified in place).
+        
+        A query also brings the temperature sampling back to full rate:
+        Klipper's webhooks poll it while a UI is subscribed.
+        
         Args:
             eventtime: Current event time from Klipper
+            query: False for the module's own reads, which are not a UI
             
         Returns:
             dict: Status information for the UI
         """
-        time_left = max(0, self.countdown_end - self.reactor.monotonic()) if self.shutdown_timer is not None else 0
-
-        git_version = self.get_git_version()
-        
-        return {
-            'enabled': self.enabled,
-            'active': self.shutdown_timer is not None,
-            'countdown': int(time_left),
-            'idle_timeout': int(self.idle_timeout),
-            'temp_threshold': self.temp_threshold,
-            'current_temps': self.last_temps,
-            'language': self.lang,
-            'diagnostic_mode': self.diagnostic_mode,
-            'device_available': self.device_state == DeviceState.AVAILABLE,
-            'dry_run_mode': self.dry_run_mode,
-            'optimal_method': self.optimal_method.name if self.optimal_method else None,
-            'device_capabilities': self.device_capabilities,
-            'state': self.state,
-            'version': git_version 
-        }
+        runtime = self.runtime
+        if query:
+            runtime.last_status_query = eventtime
+            if runtime.sample_interval > 1.:
+                self._sample_now()
+        active = self.shutdown_timer is not None
+        cooldown_active = runtime.cooldown_start is not None
+        learned = self._learned_idle_timeout()
+        device_available = self.device_state == DeviceState.AVAILABLE
+        
+        breakers = runtime.breakers
+        for name, breaker in self.circuit_breakers.items():
+            if breakers is None or breakers[name] is not breaker.state:
+                runtime.breakers = breakers = {name: breaker.state for name, breaker in self.circuit_breakers.items()}
+                runtime.status = None
+                break
+        
+        status = runtime.status
+        if (status is None
+                or status['deadline'] != runtime.deadline
+                or status['active'] != active
+                or status['state'] != runtime.state
+                or status['current_temps'] is not runtime.temps
+                or status['queued_jobs'] != runtime.queued_jobs
+                or status['learned_idle_timeout'] != learned
+                or status['enabled'] != self.enabled
+                or status['temp_threshold'] != self.temp_threshold
+                or status['diagnostic_mode'] != self.diagnostic_mode
+                or status['device_available'] != device_available
+                or status['dry_run_mode'] != self.dry_run_mode
+                or status['cooldown_active'] != cooldown_active
+                or status['time_to_threshold'] != runtime.time_to_threshold
+                or status['last_power_on'] is not runtime.last_power_on):
+            runtime.status = status = {
+                'enabled': self.enabled,
+                'active': active,
+                'deadline': runtime.deadline,
+                'server_time': runtime.server_time,
+                'temp_threshold': self.temp_threshold,
+                'current_temps': runtime.temps,
+                'diagnostic_mode': self.diagnostic_mode,
+                'device_available': device_available,
+                'dry_run_mode': self.dry_run_mode,
+                'queued_jobs': runtime.queued_jobs,
+                'cooldown_active': cooldown_active,
+                'time_to_threshold': runtime.time_to_threshold,
+                'last_power_on': runtime.last_power_on,
+                'learned_idle_timeout': learned,
+                'circuit_breakers': {name: state.name.lower() for name, state in breakers.items()},
+                'state': runtime.state
+            }
+        return status
+
+    def _learned_idle_timeout(self) -> Optional[int]:
+        """Timeout learned for the current time of day, capped by idle_timeout / Délai appris, plafonné"""
+        if self.adaptive_idle_timeout == 'off':
+            return None
+        learned = self.gap_learner.suggestion(time.time())
+        return int(min(learned, self.idle_timeout)) if learned is not None else None
 
     def _make_alias_handler(self, option: str) -> Callable:
         """
@@ -1467,6 +5136,331 @@ class AutoPowerOff:
                         params.pop('OPTION', None)
         return _handler
 
+    def _validate_settings(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Parse and check new runtime settings without applying anything.
+        
+        Args:
+            raw: Setting names (any case) and their new values
+            
+        Returns:
+            dict: Parsed values, keyed by attribute name
+            
+        Raises:
+            SettingsError: If a name is unknown or a value is invalid
+        """
+        values: Dict[str, Any] = {}
+        for name, value in raw.items():
+            key = name.lower()
+            if key not in RUNTIME_SETTINGS:
+                raise SettingsError(f"Unknown setting '{name}', expected one of: {', '.join(RUNTIME_SETTINGS)}")
+            parser, check, expected = RUNTIME_SETTINGS[key]
+            try:
+                parsed = parser(value)
+            except (TypeError, ValueError):
+                raise SettingsError(f"Invalid value '{value}' for {key}: expected {expected}")
+            if not check(parsed):
+                raise SettingsError(f"Invalid value '{value}' for {key}: expected {expected}")
+            values[key] = parsed.strip() if isinstance(parsed, str) else parsed
+        
+        device = values.get('power_device')
+        if device is not None and (self.plug_driver is not None or self.mqtt_client is not None):
+            # The plug and MQTT target were set up from printer.cfg / Cible fixée par printer.cfg
+            raise SettingsError("power_device cannot change at runtime with a direct plug or MQTT backend, "
+                                "edit printer.cfg and restart Klipper")
+        if (device is not None and not self.moonraker_integration
+                and self.printer.lookup_object(f'power {device}', None) is None):
+            raise SettingsError(f"Power device '{device}' not found")
+        return values
+
+    def _apply_settings(self, values: Dict[str, Any], save: bool = False) -> None:
+        """
+        Apply validated settings in one step.
+        
+        A running countdown keeps its start time and is moved to the new
+        deadline with update_timer, so shortening the timeout past the
+        elapsed time makes it fire on the next reactor cycle.
+        
+        Args:
+            values: Output of _validate_settings
+            save: Also store the settings in the state file
+            
+        Returns:
+            None
+        """
+        previous_device = self.power_device
+        for key, value in values.items():
+            setattr(self, key, value)
+        
+        if self.power_device != previous_device:
+            try:
+                self._verify_power_device()
+            except PowerDeviceError as e:
+                self.logger.error(str(e))
+        
+        if 'idle_timeout' in values:
+            self.info.invalidate()
+            if self.shutdown_timer is not None:
+                self.reactor.update_timer(self.shutdown_timer, self._postpone(
+                    self.runtime.countdown_start + self._effective_idle_timeout(), "settings"))
+        
+        if save:
+            saved = dict(self.state_file.get('settings') or {})
+            saved.update(values)
+            self.state_file.set('settings', saved)
+        
+        self._diagnostic_log(f"Settings applied: {values} (saved: {save})", level="info")
+
+    def _load_saved_settings(self) -> None:
+        """Apply the settings stored by AUTO_POWEROFF_SET SAVE=1 / Applique les réglages enregistrés"""
+        saved = self.state_file.get('settings')
+        if not saved:
+            return
+        try:
+            self._apply_settings(self._validate_settings(saved))
+            self.logger.info(f"Saved settings applied: {saved} / Réglages enregistrés appliqués")
+        except SettingsError as e:
+            self.logger.warning(f"Ignoring saved settings: {str(e)} / Réglages enregistrés ignorés")
+
+    def _handle_status_request(self, web_request) -> None:
+        """
+        Webhook auto_power_off/status: the status objects as JSON, without
+        going through the G-code mutex or the translations.
+        
+        Args:
+            web_request: Klipper web request
+            
+        Returns:
+            None
+        """
+        eventtime = self.reactor.monotonic()
+        web_request.send({'status': self.get_status(eventtime),
+                          'info': self.info.get_status(eventtime)})
+
+    def _handle_arm_request(self, web_request) -> None:
+        """
+        Webhook auto_power_off/arm: start the countdown, like OPTION=START.
+        
+        Args:
+            web_request: Klipper web request
+            
+        Returns:
+            None
+        """
+        if not self.enabled:
+            raise web_request.error("Auto power off is disabled")
+        if not self._is_mcu_connected():
+            raise web_request.error("MCU is not connected")
+        armed = self.shutdown_timer is None
+        if armed:
+            self._arm_timer()
+        web_request.send({'armed': armed, 'deadline': self.runtime.deadline,
+                          'server_time': self.runtime.server_time})
+
+    def _handle_cancel_request(self, web_request) -> None:
+        """
+        Webhook auto_power_off/cancel: stop the countdown, like OPTION=CANCEL.
+        
+        Args:
+            web_request: Klipper web request
+            
+        Returns:
+            None
+        """
+        canceled = self.shutdown_timer is not None
+        if canceled:
+            self._stop_cooldown()
+            self._cancel_timer("webhook")
+        web_request.send({'canceled': canceled})
+
+    def _handle_history_request(self, web_request) -> None:
+        """
+        Webhook auto_power_off/history: latest journal entries, oldest first.
+        Optional arguments count (default 10) and decision.
+        
+        Args:
+            web_request: Klipper web request
+            
+        Returns:
+            None
+        """
+        args = web_request.get_args()
+        try:
+            count = int(args.get('count', 10))
+        except (TypeError, ValueError):
+            raise web_request.error(f"Invalid count '{args.get('count')}'")
+        if not 1 <= count <= self.journal.entries.maxlen:
+            raise web_request.error(f"count must be between 1 and {self.journal.entries.maxlen}")
+        decision = args.get('decision')
+        web_request.send({'entries': self.journal.query(count, str(decision).lower() if decision else None)})
+
+    def _handle_temperature_history_request(self, web_request) -> None:
+        """
+        Webhook auto_power_off/temperature_history: downsampled temperatures
+        for cooldown charts. Optional arguments resolution (seconds between
+        points), since (Unix time) and count; times are returned as Unix time.
+        
+        Args:
+            web_request: Klipper web request
+            
+        Returns:
+            None
+        """
+        if not self.temp_history.tiers:
+            raise web_request.error("Temperature history is disabled (temp_history is empty)")
+        args = web_request.get_args()
+        try:
+            resolution = float(args['resolution']) if args.get('resolution') is not None else None
+            since = float(args['since']) if args.get('since') is not None else None
+            count = int(args['count']) if args.get('count') is not None else None
+        except (TypeError, ValueError) as e:
+            raise web_request.error(f"Invalid temperature history query: {str(e)}")
+        if count is not None and count < 1:
+            raise web_request.error("count must be at least 1")
+        eventtime = self.reactor.monotonic()
+        offset = time.time() - eventtime
+        result = self.temp_history.query(eventtime, resolution,
+                                         None if since is None else since - offset, count)
+        result['time'] = [round(stamp + offset, 1) for stamp in result['time']]
+        web_request.send(result)
+
+    def _handle_conditions_request(self, web_request) -> None:
+        """
+        Webhook auto_power_off/conditions: the power off conditions in
+        evaluation order, with their measured cost and last veto.
+        
+        Args:
+            web_request: Klipper web request
+            
+        Returns:
+            None
+        """
+        web_request.send({'conditions': self.conditions.report()})
+
+    def register_condition(self, condition: PowerOffCondition) -> None:
+        """
+        Add a power off condition from another Klipper extra.
+        Ajoute une condition d'extinction depuis une autre extension Klipper.
+        
+        Args:
+            condition: PowerOffCondition whose check() returns a Veto to keep the printer on
+            
+        Raises:
+            ValueError: If a condition with the same name is already registered
+        """
+        self.conditions.register(condition)
+
+    @staticmethod
+    def _parse_dry_run_failures(value: Any) -> Set[str]:
+        """
+        Parse the backends to fail in a dry run, e.g. "plug,moonraker".
+        
+        Raises:
+            ValueError: If a backend name is unknown
+        """
+        names = value if isinstance(value, (list, tuple)) else str(value).split(',')
+        failures = {str(name).strip().lower() for name in names if str(name).strip()}
+        unknown = failures - set(DryRunRecorder.BACKENDS)
+        if unknown:
+            raise ValueError(f"Unknown backend(s) {', '.join(sorted(unknown))}, expected {', '.join(DryRunRecorder.BACKENDS)}")
+        return failures
+
+    def _handle_dry_run_request(self, web_request) -> None:
+        """
+        Webhook auto_power_off/dry_run: run the shutdown sequence against mock
+        backends and return the timing report. Optional arguments fail
+        (backends to fail on purpose) and force_direct.
+        
+        Args:
+            web_request: Klipper web request
+            
+        Returns:
+            None
+        """
+        args = web_request.get_args()
+        try:
+            failures = self._parse_dry_run_failures(args['fail']) if args.get('fail') is not None else None
+            force_direct = parse_bool(args.get('force_direct', False))
+        except ValueError as e:
+            raise web_request.error(str(e))
+        web_request.send(self._power_off_dry_run(force_direct, failures=failures))
+
+    def _handle_set_request(self, web_request) -> None:
+        """
+        Webhook auto_power_off/set: same parameters as AUTO_POWEROFF_SET, in lower case.
+        
+        Args:
+            web_request: Klipper web request
+            
+        Returns:
+            None
+        """
+        params = dict(web_request.get_args())
+        try:
+            save = parse_bool(params.pop('save', False))
+            values = self._validate_settings(params)
+        except (SettingsError, ValueError) as e:
+            raise web_request.error(str(e))
+        self._apply_settings(values, save)
+        web_request.send({'applied': values, 'saved': save})
+
+    cmd_AUTO_POWEROFF_PROFILE_help = "Profile the module's callbacks in place / Profile les callbacks du module"
+
+    def cmd_AUTO_POWEROFF_PROFILE(self, gcmd) -> None:
+        """
+        GCODE command starting or stopping the profiler:
+        AUTO_POWEROFF_PROFILE ACTION=START, then AUTO_POWEROFF_PROFILE ACTION=STOP [TOP=10]
+        
+        Args:
+            gcmd: GCODE command object
+            
+        Returns:
+            None
+        """
+        action = gcmd.get('ACTION', 'STATUS').upper()
+        if action == 'START':
+            if self.profiler.running:
+                gcmd.respond_info(self.get_text("profile_already_running"))
+                return
+            self.profiler.start()
+            gcmd.respond_info(self.get_text("profile_started"))
+        elif action == 'STOP':
+            if not self.profiler.running:
+                gcmd.respond_info(self.get_text("profile_not_running"))
+                return
+            path, summary = self.profiler.stop(gcmd.get_int('TOP', 10, minval=1, maxval=50))
+            if path:
+                summary.append(self.get_text("profile_written", path=path))
+            gcmd.respond_info("\n".join(summary))
+        else:
+            gcmd.respond_info(self.get_text("profile_running" if self.profiler.running else "profile_not_running"))
+
+    cmd_AUTO_POWEROFF_SET_help = "Change auto power off settings without a restart / Modifie les réglages sans redémarrage"
+
+    def cmd_AUTO_POWEROFF_SET(self, gcmd) -> None:
+        """
+        GCODE command changing settings at runtime, e.g.
+        AUTO_POWEROFF_SET IDLE_TIMEOUT=900 TEMP_THRESHOLD=45 SAVE=1
+        
+        Args:
+            gcmd: GCODE command object
+            
+        Returns:
+            None
+        """
+        params = dict(gcmd.get_command_parameters())
+        try:
+            save = parse_bool(params.pop('SAVE', False))
+            if not params:
+                raise SettingsError(f"No setting given, expected one of: {', '.join(name.upper() for name in RUNTIME_SETTINGS)}")
+            values = self._validate_settings(params)
+        except (SettingsError, ValueError) as e:
+            raise gcmd.error(str(e))
+        self._apply_settings(values, save)
+        gcmd.respond_info(self.get_text("settings_applied",
+                                        settings=", ".join(f"{k}={v}" for k, v in values.items()))
+                          + (" " + self.get_text("settings_saved") if save else ""))
+
     cmd_AUTO_POWEROFF_help = "Configure or trigger automatic printer power off / Configure ou déclenche l'extinction automatique de l'imprimante"
 
     def cmd_AUTO_POWEROFF(self, gcmd) -> None:
@@ -1482,7 +5476,7 @@ class AutoPowerOff:
         option = gcmd.get('OPTION', 'status').lower()
         
         # Check which options can work without MCU
-        if option in ['language', 'status', 'diagnostic', 'dryrun']:
+        if option in ['language', 'status', 'diagnostic', 'dryrun', 'history']:
             pass
         else:
             if not self._is_mcu_connected() and option in ['now', 'start']:
@@ -1496,6 +5490,7 @@ class AutoPowerOff:
                 self.lang = lang_value
                 self._save_persistent_language(self.lang)
                 self._load_translations()
+                self.info.invalidate()
                 gcmd.respond_info(self.get_text("language_set"))
             else:
                 gcmd.respond_info(self.get_text("language_not_recognized", lang_value=lang_value))
@@ -1508,9 +5503,8 @@ class AutoPowerOff:
         
         elif option == 'off':
             self.enabled = False
-            if self.shutdown_timer is not None:
-                self.reactor.unregister_timer(self.shutdown_timer)
-                self.shutdown_timer = None
+            self._stop_cooldown()
+            self._cancel_timer("disabled")
             gcmd.respond_info(self.get_text("auto_power_off_disabled"))
         
         elif option == 'now':
@@ -1523,31 +5517,31 @@ class AutoPowerOff:
                 return
             
             if self.shutdown_timer is None:
-                waketime = self.reactor.monotonic() + self.idle_timeout
-                self.countdown_end = self.reactor.monotonic() + self.idle_timeout
-                self.shutdown_timer = self.reactor.register_timer(self._check_conditions, waketime)
+                self._arm_timer()
                 gcmd.respond_info(self.get_text("timer_started"))
             else:
                 gcmd.respond_info(self.get_text("timer_already_active"))
         
         elif option == 'cancel':
             if self.shutdown_timer is not None:
-                self.reactor.unregister_timer(self.shutdown_timer)
-                self.shutdown_timer = None
+                self._stop_cooldown()
+                self._cancel_timer()
                 gcmd.respond_info(self.get_text("timer_canceled"))
             else:
                 gcmd.respond_info(self.get_text("no_active_timer"))
         
         elif option == 'status':
+            if self.runtime.sample_interval > 1.:
+                self._sample_now()
             enabled_status = self.get_text("enabled_status") if self.enabled else self.get_text("disabled_status")
             timer_status = self.get_text("timer_active") if self.shutdown_timer is not None else self.get_text("timer_inactive")
             
             if self.lang == Language.FRENCH.value:
-                temps = f"Buse: {self.last_temps.get('hotend', 0):.1f}°C, Lit: {self.last_temps.get('bed', 0):.1f}°C"
+                temps = f"Buse: {self.runtime.temps.get('hotend', 0):.1f}°C, Lit: {self.runtime.temps.get('bed', 0):.1f}°C"
             else:
-                temps = f"Hotend: {self.last_temps.get('hotend', 0):.1f}°C, Bed: {self.last_temps.get('bed', 0):.1f}°C"
+                temps = f"Hotend: {self.runtime.temps.get('hotend', 0):.1f}°C, Bed: {self.runtime.temps.get('bed', 0):.1f}°C"
             
-            time_left = max(0, self.countdown_end - self.reactor.monotonic())
+            time_left = max(0, self.runtime.countdown_end - self.reactor.monotonic())
             countdown = f"{int(time_left / 60)}m {int(time_left % 60)}s" if self.shutdown_timer is not None else "N/A"
             
             gcmd.respond_info(self.get_text("status_template", 
@@ -1578,6 +5572,12 @@ class AutoPowerOff:
         
         elif option == 'dryrun':
             dry_run_value = gcmd.get_int('VALUE', 1, minval=0, maxval=1)
+            fail = gcmd.get('FAIL', None)
+            if fail is not None:
+                try:
+                    self.dry_run_failures = self._parse_dry_run_failures(fail)
+                except ValueError as e:
+                    raise gcmd.error(str(e))
             self.dry_run_mode = bool(dry_run_value)
             
             if self.dry_run_mode:
@@ -1590,6 +5590,21 @@ class AutoPowerOff:
         elif option == 'version':
             gcmd.respond_info(f"Auto Power Off version: {__version__}")
         
+        elif option == 'history':
+            count = gcmd.get_int('COUNT', 10, minval=1, maxval=self.journal.entries.maxlen)
+            decision = gcmd.get('DECISION', None)
+            entries = self.journal.query(count, decision.lower() if decision else None)
+            if not entries:
+                gcmd.respond_info(self.get_text("history_empty"))
+                return
+            lines = [self.get_text("history_header", count=len(entries))]
+            for entry in entries:
+                details = ", ".join(f"{key}={value}" for key, value in entry.items()
+                                    if key not in ('time', 'decision'))
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['time']))
+                lines.append(f"{stamp} {entry['decision']}" + (f" ({details})" if details else ""))
+            gcmd.respond_info("\n".join(lines))
+        
         else:
             gcmd.respond_info(self.get_text("option_not_recognized"))
 
@@ -0,0 +1,358 @@
+# klippy_fakes.py
+# Minimal stand-ins for the Klipper objects used by auto_power_off.py, so the
+# module can be loaded and exercised without a printer / Objets Klipper minimaux
+# permettant de charger et tester le module sans imprimante
+
+import importlib.util
+import os
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE_PATH = os.path.join(REPO_DIR, "src", "auto_power_off.py")
+
+
+def load_module():
+    """Import src/auto_power_off.py as a fresh module object."""
+    spec = importlib.util.spec_from_file_location("auto_power_off", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ConfigError(Exception):
+    pass
+
+
+class CommandError(Exception):
+    pass
+
+
+class FakeTimer:
+    def __init__(self, callback, waketime):
+        self.callback = callback
+        self.waketime = waketime
+
+
+class FakeReactor:
+    """
+    Reactor with a manual clock; timers only run when advance() is called.
+    The wall-clock time each timer or callback blocks the reactor is kept in
+    stalls as (name, seconds).
+    """
+    NOW = 0.
+    NEVER = 9999999999999999.
+
+    def __init__(self):
+        self.clock = 1000.
+        self.timers = []
+        self.callbacks = []
+        self.stalls = []
+
+    def _run(self, callback, eventtime):
+        start = time.perf_counter()
+        try:
+            return callback(eventtime)
+        finally:
+            self.stalls.append((getattr(callback, '__name__', repr(callback)), time.perf_counter() - start))
+
+    def longest_stall(self):
+        """Return (name, seconds) of the callback that blocked the reactor longest."""
+        return max(self.stalls, key=lambda stall: stall[1], default=(None, 0.))
+
+    def monotonic(self):
+        return self.clock
+
+    def register_timer(self, callback, waketime=NEVER):
+        timer = FakeTimer(callback, waketime)
+        self.timers.append(timer)
+        return timer
+
+    def unregister_timer(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+    def update_timer(self, timer, waketime):
+        timer.waketime = waketime
+
+    def register_callback(self, callback, waketime=NOW):
+        self.callbacks.append(callback)
+
+    def register_async_callback(self, callback, waketime=NOW):
+        self.callbacks.append(callback)
+
+    def pause(self, waketime):
+        return self.clock
+
+    def run_callbacks(self):
+        while self.callbacks:
+            self._run(self.callbacks.pop(0), self.clock)
+
+    def advance(self, seconds):
+        """Move the clock forward and run every timer that became due."""
+        end = self.clock + seconds
+        while True:
+            self.run_callbacks()
+            due = [t for t in self.timers if t.waketime <= end]
+            if not due:
+                break
+            timer = min(due, key=lambda t: t.waketime)
+            self.clock = max(self.clock, timer.waketime)
+            timer.waketime = self._run(timer.callback, self.clock)
+        self.clock = end
+        self.run_callbacks()
+
+
+class FakeGCode:
+    def __init__(self):
+        self.commands = {}
+        self.responses = []
+        self.scripts = []
+        self.from_command = []  # Run without taking the G-code mutex
+
+    def register_command(self, cmd, func, when_not_ready=False, desc=None):
+        if cmd in self.commands:
+            raise ConfigError("gcode command %s already registered" % (cmd,))
+        self.commands[cmd] = func
+
+    def get_command_handler(self):
+        return self.commands
+
+    def respond_info(self, msg, log=True):
+        self.responses.append(msg)
+
+    def _process_commands(self, commands, need_ack=True):
+        self.scripts.extend(commands)
+
+    def run_script_from_command(self, script):
+        self.from_command.extend(script.split('\n'))
+        self._process_commands(script.split('\n'), need_ack=False)
+
+    def run_script(self, script):
+        self._process_commands(script.split('\n'), need_ack=False)
+
+
+class FakeGCodeCommand:
+    error = CommandError
+
+    def __init__(self, gcode, params):
+        self.gcode = gcode
+        self._params = {k.upper(): str(v) for k, v in params.items()}
+
+    def get(self, name, default=None):
+        return self._params.get(name, default)
+
+    def get_int(self, name, default=None, minval=None, maxval=None):
+        return int(self._params.get(name, default))
+
+    def get_float(self, name, default=None, minval=None, maxval=None, above=None, below=None):
+        return float(self._params.get(name, default))
+
+    def get_command_parameters(self):
+        return dict(self._params)
+
+    def respond_info(self, msg, log=True):
+        self.gcode.respond_info(msg)
+
+
+class FakeHeater:
+    def __init__(self, name, temp=25.):
+        self.name = name
+        self.temp = temp
+        self._status = {'temperature': temp, 'target': 0.}
+
+    def get_name(self):
+        return self.name
+
+    def get_heater(self):
+        return self
+
+    def get_temp(self, eventtime):
+        return self.temp, 0.
+
+    def get_status(self, eventtime):
+        if self._status['temperature'] != self.temp:
+            self._status = {'temperature': self.temp, 'target': 0.}
+        return self._status
+
+
+class FakeHeaters:
+    def __init__(self, printer):
+        self.printer = printer
+
+    def get_status(self, eventtime):
+        return {name: obj.get_status(eventtime) for name, obj in
+                (('extruder', self.printer.objects.get('extruder')),
+                 ('heater_bed', self.printer.objects.get('heater_bed')))
+                if obj is not None}
+
+
+class FakeStatusObject:
+    def __init__(self, **status):
+        self.status = status
+
+    def get_status(self, eventtime):
+        return self.status
+
+
+class FakePowerDevice:
+    """Klipper-side [power] object offering set_power()."""
+    def __init__(self):
+        self.power_calls = []
+
+    def set_power(self, value):
+        self.power_calls.append(value)
+
+
+class FakeWebRequest:
+    error = CommandError
+
+    def __init__(self, args):
+        self.args = dict(args)
+        self.response = None
+
+    def get_args(self):
+        return self.args
+
+    def send(self, data):
+        self.response = data
+
+
+class FakeWebhooks:
+    def __init__(self):
+        self.endpoints = {}
+
+    def register_endpoint(self, path, callback):
+        if path in self.endpoints:
+            raise ConfigError("Path already registered to an endpoint")
+        self.endpoints[path] = callback
+
+    def call(self, path, **args):
+        """Run an endpoint and return the web request, like a Moonraker client call."""
+        request = FakeWebRequest(args)
+        self.endpoints[path](request)
+        return request
+
+
+class FakeMCU:
+    def is_shutdown(self):
+        return False
+
+
+class FakePrinter:
+    config_error = ConfigError
+    _SENTINEL = object()
+
+    def __init__(self):
+        self.reactor = FakeReactor()
+        self.event_handlers = {}
+        self.events = []
+        self.shutdown = False
+        self.exit_requests = []
+        self.objects = {
+            'gcode': FakeGCode(),
+            'webhooks': FakeWebhooks(),
+            'mcu': FakeMCU(),
+            'extruder': FakeHeater('extruder'),
+            'heater_bed': FakeHeater('heater_bed'),
+            'print_stats': FakeStatusObject(state='complete'),
+            'gcode_move': FakeStatusObject(is_printing=False),
+            'idle_timeout': FakeStatusObject(state='Idle'),
+            'power psu_control': FakePowerDevice(),
+        }
+        self.objects['heaters'] = FakeHeaters(self)
+
+    def get_reactor(self):
+        return self.reactor
+
+    def lookup_object(self, name, default=_SENTINEL):
+        if name in self.objects:
+            return self.objects[name]
+        if default is self._SENTINEL:
+            raise self.config_error("Unknown config object '%s'" % (name,))
+        return default
+
+    def add_object(self, name, obj):
+        self.objects[name] = obj
+
+    def register_event_handler(self, event, callback):
+        self.event_handlers.setdefault(event, []).append(callback)
+
+    def send_event(self, event, *params):
+        self.events.append((event, params))
+        return [cb(*params) for cb in self.event_handlers.get(event, [])]
+
+    def is_shutdown(self):
+        return self.shutdown
+
+    def request_exit(self, result):
+        self.exit_requests.append(result)
+
+
+class FakeConfig:
+    def __init__(self, printer, options=None, name='auto_power_off'):
+        self.printer = printer
+        self.options = dict(options or {})
+        self.name = name
+
+    def get_printer(self):
+        return self.printer
+
+    def get_name(self):
+        return self.name
+
+    def get(self, option, default=None):
+        return self.options.get(option, default)
+
+    def getint(self, option, default=None, minval=None, maxval=None):
+        return int(self.options.get(option, default))
+
+    def getfloat(self, option, default=None, minval=None, maxval=None, above=None, below=None):
+        return float(self.options.get(option, default))
+
+    def getchoice(self, option, choices, default=None):
+        value = self.options.get(option, default)
+        if value not in choices:
+            raise self.error("Choice '%s' for option '%s' is not valid" % (value, option))
+        return choices[value]
+
+    def error(self, msg):
+        return ConfigError(msg)
+
+    def has_section(self, section):
+        return False
+
+    def getsection(self, section):
+        return FakeConfig(self.printer, name=section)
+
+    def getboolean(self, option, default=None):
+        value = self.options.get(option, default)
+        if isinstance(value, str):
+            return value.lower() in ('1', 'true', 'yes', 'on')
+        return bool(value)
+
+
+def make_printer(options=None, module=None, ready=True):
+    """
+    Build a fake printer with an AutoPowerOff instance past klippy:ready, or
+    with ready=False stuck before it, like Klipper when the MCU does not answer.
+    The journal and state files are disabled unless options set them, so the
+    host's saved settings are neither read nor overwritten.
+    """
+    module = module or load_module()
+    printer = FakePrinter()
+    options = dict({'moonraker_integration': False, 'journal_file': '', 'state_file': ''}, **(options or {}))
+    apo = module.load_config(FakeConfig(printer, options))
+    # Like Klipper, callbacks registered while loading run before klippy:ready
+    printer.reactor.run_callbacks()
+    if ready:
+        printer.send_event("klippy:connect")
+        printer.send_event("klippy:ready")
+        printer.reactor.run_callbacks()
+    return printer, apo
+
+
+def wall_clock(func, *args, **kwargs):
+    """Return (result, elapsed seconds) of a blocking call."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
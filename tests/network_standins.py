@@ -0,0 +1,503 @@
+# network_standins.py
+# Local HTTP/TCP stand-ins for the network services auto_power_off.py talks to
+# (smart plugs, ...) / Substituts locaux des services réseau utilisés par le module
+
+import json
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StandInHTTPServer(ThreadingHTTPServer):
+    """
+    HTTP/1.1 keep-alive server on 127.0.0.1 dispatching to
+    route(method, path, query, body, headers), which returns (status, payload)
+    or None to drop the connection. A bytes payload is sent as is, without
+    Content-Length, and the connection is closed after it.
+    """
+    daemon_threads = True
+
+    def __init__(self, route):
+        self.route = route
+        self.connections = 0
+        self.requests = []
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        self.server.requests.append((method, url.path, query))
+        routed = self.server.route(method, url.path, query, body, self.headers)
+        if routed is None:
+            # Drop the connection without answering / Coupe la connexion sans répondre
+            self.close_connection = True
+            return
+        status, payload = routed
+        if isinstance(payload, bytes):
+            # Raw body ending with the connection / Corps brut terminé par la fermeture
+            self.close_connection = True
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+
+class FakeSmartPlug:
+    """
+    Relay emulating the HTTP APIs of Tasmota, Shelly (Gen1 and Gen2) and
+    Home Assistant. With stuck_on=True the plug accepts commands but never
+    switches off.
+    """
+    def __init__(self, kind, stuck_on=False, token='secret', entity_id='switch.printer'):
+        self.kind = kind
+        self.on = True
+        self.stuck_on = stuck_on
+        self.token = token
+        self.entity_id = entity_id
+        self.server = StandInHTTPServer(self.route)
+
+    def _switch(self, on):
+        if on or not self.stuck_on:
+            self.on = on
+
+    def route(self, method, path, query, body, headers):
+        if self.kind == 'tasmota' and path == '/cm':
+            cmnd = query.get('cmnd', '')
+            if cmnd.endswith(' Off'):
+                self._switch(False)
+            elif cmnd.endswith(' On'):
+                self._switch(True)
+            return 200, {'POWER': 'ON' if self.on else 'OFF'}
+        if self.kind == 'shelly1':
+            if path == '/shelly':
+                return 200, {'type': 'SHPLG-S'}
+            if path.startswith('/relay/'):
+                if 'turn' in query:
+                    self._switch(query['turn'] == 'on')
+                return 200, {'ison': self.on}
+        if self.kind == 'shelly2':
+            if path == '/shelly':
+                return 200, {'gen': 2}
+            if path == '/rpc/Switch.Set':
+                was_on = self.on
+                self._switch(query['on'] == 'true')
+                return 200, {'was_on': was_on}
+            if path == '/rpc/Switch.GetStatus':
+                return 200, {'id': 0, 'output': self.on}
+        if self.kind == 'homeassistant':
+            if headers.get('Authorization') != 'Bearer %s' % (self.token,):
+                return 401, {'message': 'Unauthorized'}
+            if path.startswith('/api/services/'):
+                self._switch(path.endswith('/turn_on'))
+                return 200, []
+            if path == '/api/states/%s' % (self.entity_id,):
+                return 200, {'entity_id': self.entity_id, 'state': 'on' if self.on else 'off'}
+        return 404, {'error': 'not found'}
+
+    def stop(self):
+        self.server.stop()
+
+
+def kasa_encrypt(data):
+    key = 171
+    out = bytearray()
+    for byte in data:
+        key ^= byte
+        out.append(key)
+    return len(data).to_bytes(4, 'big') + bytes(out)
+
+
+def kasa_decrypt(data):
+    key = 171
+    out = bytearray()
+    for byte in data:
+        out.append(key ^ byte)
+        key = byte
+    return bytes(out)
+
+
+class FakeKasaPlug(socketserver.ThreadingTCPServer):
+    """TP-Link Kasa plug speaking the XOR-autokey protocol on a persistent TCP connection."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.on = True
+        self.connections = 0
+        super().__init__(('127.0.0.1', 0), _KasaHandler)
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _KasaHandler(socketserver.BaseRequestHandler):
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        self.server.connections += 1
+        while True:
+            header = self._recv_exact(4)
+            if header is None:
+                return
+            request = json.loads(kasa_decrypt(self._recv_exact(int.from_bytes(header, 'big'))))
+            system = request.get('system', {})
+            if 'set_relay_state' in system:
+                self.server.on = bool(system['set_relay_state']['state'])
+                response = {'system': {'set_relay_state': {'err_code': 0}}}
+            else:
+                response = {'system': {'get_sysinfo': {'relay_state': int(self.server.on), 'err_code': 0}}}
+            try:
+                self.request.sendall(kasa_encrypt(json.dumps(response).encode()))
+            except socket.error:
+                return
+
+
+def _mqtt_string(value):
+    data = value.encode()
+    return len(data).to_bytes(2, 'big') + data
+
+
+def _mqtt_packet(header, body=b''):
+    length, encoded = len(body), bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes([header]) + bytes(encoded) + body
+
+
+class FakeMqttBroker(socketserver.ThreadingTCPServer):
+    """
+    In-process MQTT 3.1.1 broker with a plug attached: a message on
+    command_topic switches the plug, which then publishes its retained state
+    on state_topic. With stuck_on=True the plug reports ON whatever it is told.
+    puback_delay holds back each PUBACK, like a broker under load.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, command_topic='cmnd/printer/POWER', state_topic='stat/printer/POWER',
+                 stuck_on=False):
+        self.command_topic = command_topic
+        self.state_topic = state_topic
+        self.stuck_on = stuck_on
+        self.puback_delay = 0.
+        self.on = True
+        self.connections = 0
+        self.client_ids = []
+        self.published = []
+        self.retained = {state_topic: b'ON'}
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), _MqttHandler)
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def publish(self, topic, payload, retain=False):
+        with self.lock:
+            self.published.append((topic, payload))
+            if retain:
+                self.retained[topic] = payload
+            targets = list(self.subscribers.get(topic, ()))
+        for handler in targets:
+            handler.deliver(topic, payload)
+        if topic == self.command_topic:
+            self.on = self.stuck_on or payload.upper() == b'ON'
+            self.publish(self.state_topic, b'ON' if self.on else b'OFF', retain=True)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _MqttHandler(socketserver.BaseRequestHandler):
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _recv_packet(self):
+        header = self._recv_exact(1)
+        if header is None:
+            return None, None
+        length, shift = 0, 0
+        while True:
+            byte = self._recv_exact(1)
+            if byte is None:
+                return None, None
+            length |= (byte[0] & 0x7f) << shift
+            shift += 7
+            if not byte[0] & 0x80:
+                break
+        return header[0], self._recv_exact(length) if length else b''
+
+    def _send(self, data):
+        with self.send_lock:
+            try:
+                self.request.sendall(data)
+            except socket.error:
+                pass
+
+    def deliver(self, topic, payload):
+        self._send(_mqtt_packet(0x30, _mqtt_string(topic) + payload))
+
+    def handle(self):
+        self.send_lock = threading.Lock()
+        self.server.connections += 1
+        topics = []
+        try:
+            while True:
+                header, body = self._recv_packet()
+                if header is None:
+                    return
+                kind = header >> 4
+                if kind == 1:  # CONNECT
+                    pos = 2 + int.from_bytes(body[:2], 'big') + 4
+                    size = int.from_bytes(body[pos:pos + 2], 'big')
+                    self.server.client_ids.append(body[pos + 2:pos + 2 + size].decode())
+                    self._send(_mqtt_packet(0x20, b'\x00\x00'))
+                elif kind == 8:  # SUBSCRIBE
+                    size = int.from_bytes(body[2:4], 'big')
+                    topic = body[4:4 + size].decode()
+                    topics.append(topic)
+                    with self.server.lock:
+                        self.server.subscribers.setdefault(topic, []).append(self)
+                        retained = self.server.retained.get(topic)
+                    self._send(_mqtt_packet(0x90, body[:2] + b'\x00'))
+                    if retained is not None:
+                        self.deliver(topic, retained)
+                elif kind == 3:  # PUBLISH
+                    size = int.from_bytes(body[:2], 'big')
+                    topic = body[2:2 + size].decode()
+                    pos = 2 + size
+                    if (header >> 1) & 3:
+                        time.sleep(self.server.puback_delay)
+                        self._send(_mqtt_packet(0x40, body[pos:pos + 2]))
+                        pos += 2
+                    self.server.publish(topic, body[pos:], retain=bool(header & 1))
+                elif kind == 12:  # PINGREQ
+                    self._send(_mqtt_packet(0xd0))
+                elif kind == 14:  # DISCONNECT
+                    return
+        finally:
+            with self.server.lock:
+                for topic in topics:
+                    self.server.subscribers[topic].remove(self)
+
+
+class MoonrakerApi:
+    """
+    State and scripted faults shared by the Moonraker stand-ins.
+
+    latency delays every answer. errors maps a method to an error message.
+    faults maps a method to one of:
+      'hang'    - never answer
+      'reset'   - drop the connection without answering
+      'partial' - send the first half of the answer, then drop the connection
+                  (over HTTP: a 200 answer with half of the JSON body)
+      'trickle' - send the answer one byte every 0.2 s (the socket only)
+      'html'    - a 200 answer with a proxy error page (HTTP only)
+    A device in stuck_devices accepts the off command but stays on. A method
+    in missing is answered 'Method not found', like a component that is not
+    loaded.
+    """
+    def _init_api(self, print_state):
+        self.print_state = print_state
+        self.queued_jobs = []
+        self.queue_state = 'ready'
+        self.devices = {}
+        self.stuck_devices = set()
+        self.missing = set()
+        self.latency = 0.
+        self.errors = {}
+        self.faults = {}
+        self.calls = []
+        self.stopped = threading.Event()
+
+    def answer(self, method, params):
+        if method in self.errors:
+            return {'error': {'code': 400, 'message': self.errors[method]}}
+        if method in self.missing:
+            return {'error': {'code': 404, 'message': 'Method not found'}}
+        if method == 'printer.objects.query':
+            return {'result': {'eventtime': 1., 'status': {'print_stats': {'state': self.print_state}}}}
+        if method == 'machine.device_power.post_device':
+            device = params['device']
+            if device not in self.stuck_devices:
+                self.devices[device] = params['action']
+            return {'result': {device: self.devices.get(device, 'on')}}
+        if method == 'machine.device_power.get_device':
+            return {'result': {params['device']: self.devices.get(params['device'], 'on')}}
+        if method == 'server.connection.identify':
+            return {'result': {'connection_id': 1}}
+        if method == 'connection.send_event':
+            return {'result': 'ok'}
+        if method == 'server.job_queue.status':
+            return {'result': {'queued_jobs': [{'filename': name, 'job_id': str(i)}
+                                               for i, name in enumerate(self.queued_jobs)],
+                               'queue_state': self.queue_state}}
+        return {'error': {'code': 404, 'message': 'Method not found'}}
+
+    def respond(self, method, params):
+        """Record a call and return (fault, answer) after the scripted latency."""
+        self.calls.append((method, params))
+        if self.latency:
+            self.stopped.wait(self.latency)
+        fault = self.faults.get(method)
+        if fault == 'hang':
+            self.stopped.wait()
+        return fault, self.answer(method, params)
+
+
+class FakeMoonrakerSocket(MoonrakerApi, socketserver.ThreadingUnixStreamServer):
+    """
+    Moonraker's Unix socket API: JSON-RPC 2.0 messages terminated by 0x03.
+    Answers printer.objects.query, machine.device_power.post_device and
+    get_device, server.job_queue.status and the agent methods
+    server.connection.identify and connection.send_event, and
+    sends an unrelated notification before every answer like a busy server.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, print_state='standby'):
+        self.path = path
+        self.connections = 0
+        self._init_api(print_state)
+        super().__init__(path, _MoonrakerSocketHandler)
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    def stop(self):
+        # The socket file is left behind, like after a Moonraker crash
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+class _MoonrakerSocketHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        buffer = b''
+        while True:
+            while b'\x03' not in buffer:
+                chunk = self.request.recv(65536)
+                if not chunk:
+                    return
+                buffer += chunk
+            raw, _, buffer = buffer.partition(b'\x03')
+            request = json.loads(raw)
+            fault, answer = self.server.respond(request['method'], request.get('params') or {})
+            if fault in ('hang', 'reset'):
+                return
+            response = json.dumps(dict(answer, jsonrpc='2.0', id=request['id'])).encode() + b'\x03'
+            notification = {'jsonrpc': '2.0', 'method': 'notify_proc_stat_update', 'params': [{}]}
+            self.request.sendall(json.dumps(notification).encode() + b'\x03')
+            if fault == 'partial':
+                self.request.sendall(response[:len(response) // 2])
+                return
+            if fault == 'trickle':
+                for i in range(len(response)):
+                    if self.server.stopped.wait(0.2):
+                        return
+                    self.request.sendall(response[i:i + 1])
+                continue
+            self.request.sendall(response)
+
+
+class FakeMoonrakerHTTP(MoonrakerApi):
+    """Moonraker's HTTP API for the same methods, with the same scripted faults."""
+    ROUTES = {
+        ('GET', '/printer/objects/query'): 'printer.objects.query',
+        ('POST', '/printer/objects/query'): 'printer.objects.query',
+        ('POST', '/machine/device_power/device'): 'machine.device_power.post_device',
+        ('GET', '/machine/device_power/device'): 'machine.device_power.get_device',
+        ('GET', '/server/job_queue/status'): 'server.job_queue.status',
+    }
+
+    def __init__(self, print_state='standby'):
+        self._init_api(print_state)
+        self.server = StandInHTTPServer(self.route)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % (self.server.port,)
+
+    def route(self, method, path, query, body, headers):
+        rpc_method = self.ROUTES.get((method, path))
+        if rpc_method is None:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        params = json.loads(body) if body else dict(query)
+        fault, answer = self.respond(rpc_method, params)
+        if fault in ('hang', 'reset'):
+            return None
+        if fault == 'partial':
+            data = json.dumps(answer).encode()
+            return 200, data[:len(data) // 2]
+        if fault == 'html':
+            return 200, b'<html><body><h1>502 Bad Gateway</h1></body></html>'
+        if 'error' in answer:
+            return answer['error']['code'], answer
+        return 200, answer
+
+    def stop(self):
+        self.stopped.set()
+        self.server.stop()
@@ -0,0 +1,1610 @@
+#!/usr/bin/env python3
+# Tests for src/auto_power_off.py using the fakes from klippy_fakes.py
+# Run with: python -m pytest -q tests   (or: python -m unittest discover tests)
+
+import builtins
+import gzip
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import klippy_fakes  # noqa: E402
+import network_standins  # noqa: E402
+
+# Budget for AutoPowerOff.__init__ (config parsing and command registration only)
+INIT_TIME_BUDGET = 0.002
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.module = klippy_fakes.load_module()
+        home = tempfile.TemporaryDirectory()
+        self.addCleanup(home.cleanup)
+        patcher = mock.patch.dict(os.environ, {'HOME': home.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _build(self):
+        printer = klippy_fakes.FakePrinter()
+        config = klippy_fakes.FakeConfig(printer, {'language': 'fr'})
+        return printer, self.module.load_config(config)
+
+    def test_init_does_no_filesystem_access(self):
+        with mock.patch.object(builtins, 'open', side_effect=AssertionError("open() during init")), \
+                mock.patch.object(os.path, 'exists', side_effect=AssertionError("exists() during init")):
+            self._build()
+
+    def test_init_time_budget(self):
+        self._build()  # warm up
+        runs = 50
+        start = time.perf_counter()
+        for _ in range(runs):
+            self._build()
+        per_init = (time.perf_counter() - start) / runs
+        self.assertLess(per_init, INIT_TIME_BUDGET,
+                        "AutoPowerOff.__init__ took %.3f ms" % (per_init * 1000.,))
+
+    def test_language_resolved_after_ready(self):
+        printer, apo = self._build()
+        self.assertIsNone(apo.translations)
+        printer.send_event("klippy:connect")
+        printer.send_event("klippy:ready")
+        self.assertIsNone(apo.translations)
+        printer.reactor.run_callbacks()
+        self.assertEqual(apo.lang, 'fr')
+        self.assertTrue(apo.translations)
+
+
+
+class NotificationTest(unittest.TestCase):
+    def setUp(self):
+        self.printer, self.apo = klippy_fakes.make_printer()
+        self.gcode = self.printer.lookup_object('gcode')
+        self.display = klippy_fakes.FakeStatusObject()
+        self.display.message = None
+        self.printer.add_object('display_status', self.display)
+        self.printer.reactor.advance(1.)
+        self.gcode.responses.clear()
+
+    def test_burst_is_coalesced_and_duplicates_dropped(self):
+        for _ in range(5):
+            self.apo._notify_user("timer_started")
+        self.apo._notify_user("timer_canceled")
+        self.printer.reactor.advance(1.)
+        self.assertEqual(len(self.gcode.responses), 1)
+        self.assertEqual(self.gcode.responses[0].count(" | "), 1)
+        self.assertEqual(self.display.message, self.apo.get_text("timer_canceled"))
+        self.assertEqual(self.gcode.scripts, [])
+        # Still inside the deduplication window / Toujours dans la fenêtre
+        self.apo._notify_user("timer_started")
+        self.printer.reactor.advance(1.)
+        self.assertEqual(len(self.gcode.responses), 1)
+
+    def test_repeated_recheck_is_announced_once(self):
+        for _ in range(4):
+            self.apo._notify_user("temperatures_too_high_custom", temp_msg="hotend: 60.0°C", max_temp=40.)
+            self.printer.reactor.advance(60.)
+        self.assertEqual(len(self.gcode.responses), 1)
+        self.printer.reactor.advance(61.)
+        self.apo._notify_user("temperatures_too_high_custom", temp_msg="hotend: 60.0°C", max_temp=40.)
+        self.printer.reactor.advance(1.)
+        self.assertEqual(len(self.gcode.responses), 2)
+
+    def test_buffered_while_mcu_disconnected(self):
+        self.printer.shutdown = True
+        self.apo._notify_user("timer_started")
+        self.printer.reactor.advance(10.)
+        self.assertEqual(self.gcode.responses, [])
+        self.printer.shutdown = False
+        self.printer.reactor.advance(10.)
+        self.assertEqual(self.gcode.responses, [self.apo.get_text("timer_started")])
+
+
+
+class ActivityTrackingTest(unittest.TestCase):
+    def setUp(self):
+        self.printer, self.apo = klippy_fakes.make_printer(
+            {'auto_poweroff_enabled': True, 'idle_timeout': 600})
+        self.gcode = self.printer.lookup_object('gcode')
+        self.power = self.printer.lookup_object('power psu_control')
+
+    def test_activity_pushes_deadline_back(self):
+        reactor = self.printer.reactor
+        self.apo._arm_timer()
+        reactor.advance(300.)
+        self.gcode.run_script("G1 X10")
+        reactor.advance(301.)
+        self.assertEqual(self.power.power_calls, [])
+        self.assertAlmostEqual(self.apo.runtime.countdown_end, reactor.clock + 299., places=3)
+        reactor.advance(300.)
+        self.assertEqual(self.power.power_calls, [0])
+
+    def test_own_scripts_are_not_activity(self):
+        self.apo._arm_timer()
+        self.apo._run_own_script("TURN_OFF_HEATERS")
+        self.assertLessEqual(self.apo.runtime.last_activity, self.apo.runtime.countdown_start)
+
+    def test_hook_overhead_is_negligible(self):
+        """Per-command cost of the hook while streaming a print."""
+        plain = klippy_fakes.FakeGCode()._process_commands
+        hooked = self.gcode._process_commands
+        batch = ["G1 X1 Y1 E0.1"]
+        runs = 200000
+
+        def measure(func):
+            start = time.perf_counter()
+            for _ in range(runs):
+                func(batch)
+            return (time.perf_counter() - start) / runs
+
+        measure(hooked)
+        overhead = min(measure(hooked) for _ in range(3)) - min(measure(plain) for _ in range(3))
+        del self.gcode.scripts[:]
+        self.assertLess(overhead, 2e-6, "hook costs %.0f ns per command" % (overhead * 1e9,))
+
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.printer, self.apo = klippy_fakes.make_printer(
+            {'moonraker_integration': True, 'moonraker_url': 'http://127.0.0.1:9',
+             'moonraker_socket': '', 'circuit_failure_threshold': 2, 'power_off_retry_delay': 0})
+        self.breaker = self.apo.circuit_breakers['moonraker']
+
+    def test_states_and_backoff(self):
+        reactor = self.printer.reactor
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state.name, 'CLOSED')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state.name, 'OPEN')
+        self.assertFalse(self.breaker.allow())
+        first_timeout = self.breaker.open_until - reactor.clock
+        self.assertTrue(15. <= first_timeout <= 30.)
+        reactor.clock = self.breaker.open_until
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state.name, 'HALF_OPEN')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state.name, 'OPEN')
+        self.assertTrue(30. <= self.breaker.open_until - reactor.clock <= 60.)
+        reactor.clock = self.breaker.open_until
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state.name, 'CLOSED')
+        self.assertEqual(self.apo.get_status(reactor.clock)['circuit_breakers']['moonraker'], 'closed')
+
+    def test_half_open_lets_one_trial_through(self):
+        reactor = self.printer.reactor
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        reactor.clock = self.breaker.open_until
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.trial_in_flight)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.trial_in_flight)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        reactor.clock = self.breaker.open_until
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state.name, 'OPEN')
+        self.assertFalse(self.breaker.trial_in_flight)
+        # A trial nobody reported on is given up / Un essai sans résultat est abandonné
+        reactor.clock = self.breaker.open_until
+        self.assertTrue(self.breaker.allow())
+        reactor.clock += self.breaker.reset_timeout - 1.
+        self.assertFalse(self.breaker.allow())
+        reactor.clock += 1.
+        self.assertTrue(self.breaker.allow())
+
+    def test_open_circuit_fails_fast(self):
+        with mock.patch('subprocess.run', side_effect=OSError("connection refused")) as run:
+            for _ in range(2):
+                with self.assertRaises(Exception):
+                    self.apo._check_print_status_via_moonraker()
+            self.assertEqual(run.call_count, 2)
+            self.assertIsNone(self.apo._check_print_status_via_moonraker())
+            error, elapsed = klippy_fakes.wall_clock(self._power_off_call)
+            self.assertIn("circuit is open", str(error))
+            self.assertEqual(run.call_count, 2)
+            self.assertLess(elapsed, 0.05)
+
+    def _power_off_call(self):
+        try:
+            self.apo._moonraker_call_with_retry(
+                'machine.device_power.post_device', 'POST', '/machine/device_power/device',
+                {'device': 'psu_control', 'action': 'off'}, 3, 1)
+        except Exception as e:
+            return e
+        return None
+
+
+
+class PlugDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.module = klippy_fakes.load_module()
+
+    def _driver(self, plug_type, port, **kwargs):
+        driver = self.module.PLUG_DRIVERS[plug_type]('127.0.0.1', port, 1.0, **kwargs)
+        self.addCleanup(driver.close)
+        return driver
+
+    def _check_http(self, kind, plug_type, **kwargs):
+        plug = network_standins.FakeSmartPlug(kind)
+        self.addCleanup(plug.stop)
+        driver = self._driver(plug_type, plug.server.port, **kwargs)
+        self.assertFalse(driver.set_power(False))
+        self.assertFalse(plug.on)
+        self.assertTrue(driver.set_power(True))
+        self.assertTrue(driver.get_state())
+        self.assertEqual(plug.server.connections, 1)
+
+    def test_drivers_implement_the_interface(self):
+        with self.assertRaises(TypeError):
+            self.module.PlugDriver('127.0.0.1')
+        for plug_type in self.module.PLUG_DRIVERS:
+            self._driver(plug_type, 1)
+
+    def test_tasmota(self):
+        self._check_http('tasmota', 'tasmota')
+
+    def test_shelly_gen1(self):
+        self._check_http('shelly1', 'shelly')
+
+    def test_shelly_gen2(self):
+        self._check_http('shelly2', 'shelly')
+
+    def test_home_assistant(self):
+        self._check_http('homeassistant', 'homeassistant', token='secret', entity_id='switch.printer')
+
+    def test_kasa(self):
+        plug = network_standins.FakeKasaPlug()
+        self.addCleanup(plug.stop)
+        driver = self._driver('kasa', plug.port)
+        self.assertFalse(driver.set_power(False))
+        self.assertFalse(plug.on)
+        self.assertTrue(driver.set_power(True))
+        self.assertEqual(plug.connections, 1)
+
+    def test_reconnects_after_plug_closed_connection(self):
+        plug = network_standins.FakeSmartPlug('tasmota')
+        self.addCleanup(plug.stop)
+        driver = self._driver('tasmota', plug.server.port)
+        driver.get_state()
+        driver._conn.sock.close()
+        self.assertFalse(driver.set_power(False))
+        self.assertEqual(plug.server.connections, 2)
+
+    def test_unreachable_plug(self):
+        driver = self._driver('tasmota', 9)
+        with self.assertRaises(self.module.NetworkDeviceUnreachableError):
+            driver.set_power(False)
+
+
+class PlugPowerOffTest(unittest.TestCase):
+    def _printer(self, stuck_on=False):
+        plug = network_standins.FakeSmartPlug('tasmota', stuck_on=stuck_on)
+        self.addCleanup(plug.stop)
+        printer, apo = klippy_fakes.make_printer({
+            'plug_type': 'tasmota', 'device_address': '127.0.0.1',
+            'plug_port': plug.server.port, 'power_off_retries': 1})
+        self.addCleanup(apo.plug_driver.close)
+        return plug, printer, apo
+
+    def test_plug_is_first_in_chain(self):
+        plug, printer, apo = self._printer()
+        self.assertEqual(apo.optimal_method.name, 'TASMOTA')
+        self.assertTrue(apo.device_capabilities['direct_plug'])
+        with mock.patch('time.sleep'):
+            apo._power_off()
+        self.assertFalse(plug.on)
+        self.assertEqual(apo.runtime.state, 'off')
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [])
+
+    def test_plug_stuck_on_falls_back(self):
+        plug, printer, apo = self._printer(stuck_on=True)
+        with mock.patch('time.sleep'):
+            apo._power_off()
+        self.assertTrue(plug.on)
+        self.assertEqual(apo.circuit_breakers['plug'].failures, 1)
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [0])
+
+
+class MqttBackendTest(unittest.TestCase):
+    def _printer(self, stuck_on=False, timeout=2.):
+        broker = network_standins.FakeMqttBroker(stuck_on=stuck_on)
+        self.addCleanup(broker.stop)
+        printer, apo = klippy_fakes.make_printer({
+            'mqtt_broker': '127.0.0.1', 'mqtt_port': broker.port,
+            'mqtt_command_topic': broker.command_topic, 'mqtt_state_topic': broker.state_topic,
+            'mqtt_timeout': timeout})
+        self.addCleanup(apo.mqtt_client.close)
+        self.assertTrue(apo.mqtt_client.connected.wait(2.))
+        return broker, printer, apo
+
+    def _wait_for(self, printer, predicate, timeout=3.):
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            time.sleep(0.01)
+            printer.reactor.run_callbacks()
+        return predicate()
+
+    def test_power_off_confirmed_by_state_topic(self):
+        broker, printer, apo = self._printer()
+        self.assertEqual(apo.optimal_method.name, 'MQTT')
+        with mock.patch('time.sleep'):
+            apo._power_off()
+        self.assertTrue(self._wait_for(printer, lambda: apo.runtime.state == 'off'))
+        self.assertFalse(broker.on)
+        self.assertIn((broker.command_topic, b'OFF'), broker.published)
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [])
+
+    def test_connection_is_reused(self):
+        broker, printer, apo = self._printer()
+        apo.mqtt_client.set_power(False)
+        apo.mqtt_client.set_power(True)
+        apo.mqtt_client.set_power(False)
+        self.assertEqual(broker.connections, 1)
+        self.assertEqual(broker.client_ids, ['auto_power_off_psu_control'])
+
+    def test_late_puback_is_not_kept(self):
+        broker, printer, apo = self._printer(timeout=0.2)
+        broker.puback_delay = 0.4
+        with self.assertRaises(Exception):
+            apo.mqtt_client.set_power(False)
+        broker.puback_delay = 0.
+        self.assertTrue(self._wait_for(printer, lambda: not broker.on))
+        self.assertEqual(apo.mqtt_client._acked, set())
+        self.assertEqual(apo.mqtt_client._pending, set())
+        apo.mqtt_client.set_power(True)
+        self.assertEqual(apo.mqtt_client._acked, set())
+
+    def test_unconfirmed_command_falls_back(self):
+        broker, printer, apo = self._printer(stuck_on=True, timeout=0.3)
+        power = printer.lookup_object('power psu_control')
+        with mock.patch('time.sleep'):
+            apo._power_off()
+            self.assertEqual(power.power_calls, [])
+            self.assertTrue(self._wait_for(printer, lambda: power.power_calls == [0]))
+        self.assertEqual(apo.circuit_breakers['mqtt'].failures, 1)
+
+    def test_reconnects_after_broker_drop(self):
+        broker, printer, apo = self._printer()
+        apo.mqtt_client._sock.shutdown(socket.SHUT_RDWR)
+        self.assertTrue(self._wait_for(printer, lambda: broker.connections == 2))
+        self.assertTrue(apo.mqtt_client.connected.wait(3.))
+        apo.mqtt_client.set_power(False)
+        self.assertFalse(broker.on)
+
+
+class MoonrakerTransportTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = os.path.join(tmp.name, 'moonraker.sock')
+        self.module = klippy_fakes.load_module()
+        self.printer, self.apo = klippy_fakes.make_printer({
+            'moonraker_integration': True, 'moonraker_socket': self.socket_path,
+            'power_off_retry_delay': 0}, self.module)
+        self.addCleanup(self.apo.moonraker.close)
+
+    def _serve(self):
+        server = network_standins.FakeMoonrakerSocket(self.socket_path)
+        self.addCleanup(server.stop)
+        return server
+
+    def test_unix_socket_is_preferred(self):
+        server = self._serve()
+        with mock.patch('subprocess.run') as run:
+            self.assertEqual(self.apo._check_print_status_via_moonraker(), 'standby')
+            self.apo._power_off_fallback(False)
+        run.assert_not_called()
+        self.assertEqual(self.apo.moonraker.transport, 'unix')
+        self.assertEqual(self.apo.runtime.state, 'off')
+        self.assertEqual([m for m, _ in server.calls],
+                         ['printer.objects.query', 'machine.device_power.post_device'])
+        self.assertEqual(server.calls[1][1], {'device': 'psu_control', 'action': 'off'})
+        self.assertEqual(server.connections, 1)
+
+    def test_http_fallback_without_socket(self):
+        answer = subprocess.CompletedProcess([], 0, '{"result": {"status": {"print_stats": {"state": "printing"}}}}', '')
+        with mock.patch('subprocess.run', return_value=answer) as run:
+            self.assertEqual(self.apo._check_print_status_via_moonraker(), 'printing')
+        self.assertEqual(self.apo.moonraker.transport, 'http')
+        command = run.call_args[0][0]
+        self.assertEqual(command[-1], 'http://localhost:7125/printer/objects/query')
+        self.assertIn('{"objects": {"print_stats": ["state"]}}', command)
+
+    def test_stale_socket_file_falls_back_to_http(self):
+        server = self._serve()
+        server.stop()
+        self.assertTrue(os.path.exists(self.socket_path))
+        answer = subprocess.CompletedProcess([], 0, '{"result": {"status": {"print_stats": {"state": "complete"}}}}', '')
+        with mock.patch('subprocess.run', return_value=answer):
+            self.assertEqual(self.apo._check_print_status_via_moonraker(), 'complete')
+        self.assertEqual(self.apo.moonraker.transport, 'http')
+
+    def test_rpc_error_is_reported(self):
+        server = self._serve()
+        server.errors['machine.device_power.post_device'] = 'Device not found'
+        with self.assertRaises(self.module.MoonrakerApiError) as ctx:
+            self.apo._moonraker_call_with_retry(
+                'machine.device_power.post_device', 'POST', '/machine/device_power/device',
+                {'device': 'nope', 'action': 'off'}, 1, 0)
+        self.assertIn('Device not found', str(ctx.exception))
+
+
+class MoonrakerFaultTest(unittest.TestCase):
+    """Power off through a misbehaving Moonraker, measuring how long the reactor is blocked."""
+    BUDGET = 2.
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = os.path.join(tmp.name, 'moonraker.sock')
+        self.http = network_standins.FakeMoonrakerHTTP()
+        self.addCleanup(self.http.stop)
+
+    def _printer(self, unix_socket=True):
+        if unix_socket:
+            self.moonraker = network_standins.FakeMoonrakerSocket(self.socket_path)
+            self.addCleanup(self.moonraker.stop)
+        else:
+            self.moonraker = self.http
+        self.printer, self.apo = klippy_fakes.make_printer({
+            'auto_poweroff_enabled': True, 'moonraker_integration': True,
+            'moonraker_url': self.http.url, 'moonraker_socket': self.socket_path,
+            'power_off_retries': 2, 'power_off_retry_delay': 0,
+            'power_off_retry_budget': self.BUDGET})
+        self.addCleanup(self.apo.moonraker.close)
+        self.power = self.printer.lookup_object('power psu_control')
+
+    def _power_off_from_reactor(self):
+        """Let the countdown expire and return the longest reactor stall in seconds."""
+        self.apo._arm_timer()
+        with mock.patch('time.sleep'):
+            self.printer.reactor.advance(self.apo.idle_timeout + 1.)
+        self.assertEqual(self.apo.journal.entries[-1]['decision'], 'powered_off')
+        return self.printer.reactor.longest_stall()[1]
+
+    def _post_device_calls(self, moonraker):
+        return [params for method, params in moonraker.calls if method == 'machine.device_power.post_device']
+
+    def test_slow_answer_within_timeout(self):
+        self._printer()
+        self.moonraker.latency = 0.3
+        stall = self._power_off_from_reactor()
+        self.assertEqual(self.moonraker.devices, {'psu_control': 'off'})
+        self.assertEqual(self.power.power_calls, [])
+        self.assertGreaterEqual(stall, 0.3)
+        self.assertLess(stall, 1.5)
+
+    def test_error_answer_falls_back_to_direct(self):
+        self._printer()
+        self.moonraker.errors['machine.device_power.post_device'] = 'Device psu_control not found'
+        self._power_off_from_reactor()
+        self.assertEqual(len(self._post_device_calls(self.moonraker)), 2)
+        self.assertEqual(self.power.power_calls, [0])
+        self.assertEqual(self.apo.runtime.state, 'off')
+
+    def test_hung_socket_is_bounded_by_retry_budget(self):
+        self._printer()
+        self.moonraker.faults['machine.device_power.post_device'] = 'hang'
+        stall = self._power_off_from_reactor()
+        self.assertEqual(self.power.power_calls, [0])
+        self.assertLess(stall, self.BUDGET + 1.)
+
+    def test_trickling_answer_is_bounded_by_retry_budget(self):
+        self._printer()
+        self.moonraker.faults['machine.device_power.post_device'] = 'trickle'
+        stall = self._power_off_from_reactor()
+        self.assertEqual(self.power.power_calls, [0])
+        self.assertLess(stall, self.BUDGET + 1.)
+
+    def test_reset_and_partial_answers_are_not_resent_over_http(self):
+        for fault in ('reset', 'partial'):
+            with self.subTest(fault=fault):
+                self._printer()
+                self.moonraker.faults['machine.device_power.post_device'] = fault
+                self._power_off_from_reactor()
+                # Moonraker may have acted on the request: retried on the socket only
+                # Moonraker a pu traiter la requête : relance sur le socket uniquement
+                self.assertEqual(len(self._post_device_calls(self.moonraker)), 2)
+                self.assertEqual(self._post_device_calls(self.http), [])
+                self.assertEqual(self.power.power_calls, [0])
+                self.moonraker.stop()
+                os.unlink(self.socket_path)
+                self.http.devices.clear()
+
+    def test_http_faults(self):
+        self._printer(unix_socket=False)
+        self.http.faults['machine.device_power.post_device'] = 'hang'
+        stall = self._power_off_from_reactor()
+        self.assertEqual(self.apo.moonraker.transport, 'http')
+        self.assertEqual(self.power.power_calls, [0])
+        self.assertLess(stall, self.BUDGET + 1.5)
+        self.http.faults.clear()
+        self.http.errors['machine.device_power.post_device'] = 'Device psu_control not found'
+        self.apo._reset_shutdown_state()
+        self._power_off_from_reactor()
+        self.assertEqual(self.power.power_calls, [0, 0])
+
+    def test_garbled_http_answers_fall_back_to_direct(self):
+        for fault in ('partial', 'html'):
+            with self.subTest(fault=fault):
+                self._printer(unix_socket=False)
+                self.http.faults['machine.device_power.post_device'] = fault
+                self._power_off_from_reactor()
+                # Retried like any other failed call / Relancé comme tout autre appel en échec
+                self.assertEqual(len(self._post_device_calls(self.http)), 2)
+                self.assertEqual(self.power.power_calls, [0])
+                self.assertEqual(self.apo.runtime.state, 'off')
+                self.http.calls.clear()
+
+    def test_plug_that_stays_on_falls_back_to_direct(self):
+        self._printer()
+        self.moonraker.stuck_devices.add('psu_control')
+        self._power_off_from_reactor()
+        self.assertEqual(len(self._post_device_calls(self.moonraker)), 1)
+        self.assertEqual(self.moonraker.devices, {})
+        self.assertEqual(self.power.power_calls, [0])
+
+
+class DecisionJournalTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'journal.jsonl')
+        self.module = klippy_fakes.load_module()
+        self.printer, self.apo = klippy_fakes.make_printer({
+            'auto_poweroff_enabled': True, 'journal_file': self.path,
+            'journal_max_size': 4096, 'journal_backups': 2}, self.module)
+        self.gcode = self.printer.lookup_object('gcode')
+        self.reactor = self.printer.reactor
+
+    def _read(self, path):
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_verdicts_are_batched_to_disk(self):
+        self.printer.lookup_object('extruder').temp = 120.
+        self.apo._arm_timer()
+        self.reactor.advance(601.)
+        entry = self.apo.journal.entries[-1]
+        self.assertEqual(entry['decision'], 'postponed_temperature')
+        self.assertEqual(entry['temps']['hotend'], 120.)
+        self.assertFalse(os.path.exists(self.path))
+        self.reactor.advance(30.)
+        self.assertEqual(self._read(self.path)[0]['decision'], 'postponed_temperature')
+        self.printer.lookup_object('extruder').temp = 30.
+        self.reactor.advance(60.)
+        entries = self._read(self.path)
+        self.assertEqual(entries[-1]['decision'], 'powered_off')
+        self.assertEqual(entries[-1]['outcome'], 'off')
+
+    def test_printing_is_recorded(self):
+        self.printer.lookup_object('print_stats').status['state'] = 'printing'
+        self.apo._arm_timer()
+        self.reactor.advance(601.)
+        self.assertEqual(self.apo.journal.query(1)[0]['decision'], 'canceled_printing')
+
+    def test_rotation_and_compression(self):
+        for i in range(300):
+            self.apo.journal.record(self.module.Decision.NOT_IDLE, state='busy', next_check=60.0)
+        self.apo.journal.flush()
+        self.assertTrue(os.path.exists(self.path + '.1.gz'))
+        self.assertTrue(os.path.exists(self.path + '.2.gz'))
+        self.assertFalse(os.path.exists(self.path + '.3.gz'))
+        self.assertLessEqual(os.path.getsize(self.path), 4096 + 200)
+        with gzip.open(self.path + '.1.gz', 'rt') as f:
+            self.assertEqual(json.loads(f.readline())['decision'], 'postponed_not_idle')
+        self.assertEqual(len(self.apo.journal.entries), 200)
+
+    def test_history_command(self):
+        handler = self.gcode.commands['AUTO_POWEROFF']
+        handler(klippy_fakes.FakeGCodeCommand(self.gcode, {'OPTION': 'HISTORY'}))
+        self.assertEqual(self.gcode.responses[-1], self.apo.get_text('history_empty'))
+        self.apo.journal.record(self.module.Decision.TEMPERATURE, temps={'hotend': 45.0})
+        self.apo.journal.record(self.module.Decision.NOT_IDLE, state='busy')
+        handler(klippy_fakes.FakeGCodeCommand(self.gcode, {'OPTION': 'HISTORY', 'DECISION': 'POSTPONED_TEMPERATURE'}))
+        lines = self.gcode.responses[-1].split('\n')
+        self.assertEqual(len(lines), 2)
+        self.assertIn("postponed_temperature (temps={'hotend': 45.0})", lines[1])
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        socket_path = os.path.join(tmp.name, 'moonraker.sock')
+        self.moonraker = network_standins.FakeMoonrakerSocket(socket_path, print_state='complete')
+        self.addCleanup(self.moonraker.stop)
+        self.printer, self.apo = klippy_fakes.make_printer({
+            'auto_poweroff_enabled': True, 'moonraker_integration': True,
+            'moonraker_socket': socket_path})
+        self.addCleanup(self.apo.moonraker.close)
+        self.reactor = self.printer.reactor
+
+    def test_queued_jobs_postpone_power_off(self):
+        self.moonraker.queued_jobs = ['next_part.gcode', 'other.gcode']
+        self.apo._arm_timer()
+        self.reactor.advance(601.)
+        self.assertEqual(self.moonraker.calls[-1][0], 'server.job_queue.status')
+        self.assertNotIn('machine.device_power.post_device', [m for m, _ in self.moonraker.calls])
+        self.assertEqual(self.apo.journal.query(1)[0]['decision'], 'postponed_jobs_queued')
+        self.assertEqual(self.apo.get_status(self.reactor.clock)['queued_jobs'], 2)
+        self.moonraker.queued_jobs = []
+        with mock.patch('time.sleep'):
+            self.reactor.advance(60.)
+        self.assertEqual(self.moonraker.calls[-1], ('machine.device_power.post_device',
+                                                    {'device': 'psu_control', 'action': 'off'}))
+
+    def test_paused_queue_does_not_block(self):
+        self.moonraker.queued_jobs = ['next_part.gcode']
+        self.moonraker.queue_state = 'paused'
+        self.assertEqual(self.apo._check_job_queue(), 0)
+
+    def test_unreachable_moonraker_does_not_block(self):
+        self.moonraker.errors['server.job_queue.status'] = 'Component job_queue not loaded'
+        self.assertEqual(self.apo._check_job_queue(), 0)
+
+    def test_missing_job_queue_does_not_open_the_circuit(self):
+        self.moonraker.missing.add('server.job_queue.status')
+        for _ in range(5):
+            self.assertEqual(self.apo._check_job_queue(), 0)
+        self.assertEqual([m for m, _ in self.moonraker.calls].count('server.job_queue.status'), 1)
+        breaker = self.apo.circuit_breakers['moonraker']
+        self.assertEqual((breaker.state.name, breaker.failures), ('CLOSED', 0))
+
+
+class StateFileTest(unittest.TestCase):
+    def test_data_is_synced_before_rename(self):
+        module = klippy_fakes.load_module()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'state.json')
+        state = module.StateFile(path)
+        order = []
+        real_fsync, real_replace = os.fsync, os.replace
+        with mock.patch('os.fsync', side_effect=lambda fd: (order.append('fsync'), real_fsync(fd))), \
+                mock.patch('os.replace', side_effect=lambda *a: (order.append('replace'), real_replace(*a))):
+            state.set('power_on', {'attempt': 1})
+        self.assertEqual(order, ['fsync', 'replace'])
+        self.assertEqual(module.StateFile(path).get('power_on'), {'attempt': 1})
+
+
+class IdleGapLearnerTest(unittest.TestCase):
+    def setUp(self):
+        self.module = klippy_fakes.load_module()
+        self.noon = time.mktime((2026, 6, 1, 12, 0, 0, 0, 0, -1))
+        self.midnight = time.mktime((2026, 6, 1, 0, 30, 0, 0, 0, -1))
+
+    def test_short_gaps_keep_printer_on(self):
+        learner = self.module.IdleGapLearner(power_cycle_cost=600.)
+        for _ in range(4):
+            learner.add_gap(200., self.noon)
+        self.assertIsNone(learner.suggestion(self.noon))  # Not enough samples yet
+        learner.add_gap(200., self.noon)
+        self.assertTrue(200. <= learner.suggestion(self.noon) < 260.)
+        self.assertIsNone(learner.suggestion(self.midnight))
+
+    def test_long_gaps_power_off_early(self):
+        learner = self.module.IdleGapLearner(power_cycle_cost=600.)
+        for _ in range(10):
+            learner.add_gap(8 * 3600., self.midnight)
+        self.assertEqual(learner.suggestion(self.midnight), learner.MIN_GAP)
+
+    def test_recent_habits_win(self):
+        learner = self.module.IdleGapLearner(power_cycle_cost=600.)
+        for _ in range(20):
+            learner.add_gap(8 * 3600., self.noon)
+        for _ in range(40):
+            learner.add_gap(120., self.noon)
+        self.assertTrue(120. <= learner.suggestion(self.noon) < 160.)
+        self.assertEqual(len(learner.weights[0]), learner.BINS)
+
+    def test_gaps_tracked_persisted_and_capped(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        state_path = os.path.join(tmp.name, 'state.json')
+        options = {'adaptive_idle_timeout': 'apply', 'idle_timeout': 600, 'auto_poweroff_enabled': True,
+                   'state_file': state_path}
+        printer, apo = klippy_fakes.make_printer(options, self.module)
+        print_stats = printer.lookup_object('print_stats')
+        wall = [self.noon]
+        with mock.patch('time.time', side_effect=lambda: wall[0]):
+            for _ in range(5):
+                for state, duration in (('printing', 1800.), ('complete', 300.)):
+                    print_stats.status['state'] = state
+                    printer.reactor.advance(5.)
+                    wall[0] += duration
+            print_stats.status['state'] = 'printing'
+            printer.reactor.advance(5.)
+            learned = apo.get_status(printer.reactor.clock)['learned_idle_timeout']
+            self.assertTrue(300 <= learned < 400, learned)
+            apo._arm_timer()
+            self.assertAlmostEqual(apo.runtime.countdown_end - printer.reactor.clock, learned, delta=1.)
+            apo.idle_timeout = 120.
+            apo._arm_timer()
+            self.assertEqual(apo.runtime.countdown_end - printer.reactor.clock, 120.)
+
+            # A new Klipper instance restores the histograms / Une nouvelle instance restaure l'historique
+            printer2, apo2 = klippy_fakes.make_printer(options, self.module)
+            self.assertEqual(apo2.get_status(printer2.reactor.clock)['learned_idle_timeout'], learned)
+
+
+class ConditionPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.module = klippy_fakes.load_module()
+
+    def _make(self, **options):
+        printer, apo = klippy_fakes.make_printer(dict({'auto_poweroff_enabled': True}, **options), self.module)
+        apo._arm_timer()
+        return printer, apo
+
+    def test_local_veto_skips_remote_queries(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        socket_path = os.path.join(tmp.name, 'moonraker.sock')
+        moonraker = network_standins.FakeMoonrakerSocket(socket_path, print_state='complete')
+        self.addCleanup(moonraker.stop)
+        printer, apo = self._make(moonraker_integration=True, moonraker_socket=socket_path)
+        self.addCleanup(apo.moonraker.close)
+        printer.lookup_object('extruder').temp = 120.
+        printer.reactor.advance(601.)
+        self.assertEqual(apo.journal.query(1)[0]['decision'], 'postponed_temperature')
+        self.assertEqual(moonraker.calls, [])
+        printer.lookup_object('extruder').temp = 30.
+        moonraker.queued_jobs = ['next_part.gcode']
+        printer.reactor.advance(60.)
+        self.assertEqual([m for m, _ in moonraker.calls], ['printer.objects.query', 'server.job_queue.status'])
+        self.assertEqual(apo.journal.query(1)[0]['decision'], 'postponed_jobs_queued')
+
+    def test_keep_on_when(self):
+        printer, apo = self._make(keep_on_when='\ngcode_macro KEEP_ON.active = True\ngcode_button door.state = PRESSED')
+        macro = klippy_fakes.FakeStatusObject(active=True)
+        printer.add_object('gcode_macro KEEP_ON', macro)
+        printer.reactor.advance(601.)
+        entry = apo.journal.query(1)[0]
+        self.assertEqual((entry['decision'], entry['condition'], entry['value']),
+                         ('postponed_condition', 'gcode_macro KEEP_ON.active', True))
+        macro.status['active'] = False
+        printer.add_object('gcode_button door', klippy_fakes.FakeStatusObject(state='RELEASED'))
+        printer.reactor.advance(60.)
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [0])
+        with self.assertRaises(klippy_fakes.ConfigError):
+            klippy_fakes.make_printer({'keep_on_when': 'gcode_button door'}, self.module)
+
+    def test_plugin_condition_and_report(self):
+        printer, apo = self._make()
+        module = self.module
+        calls = []
+
+        class SlowCondition(module.PowerOffCondition):
+            name = 'slow'
+            cost = 1.
+            ttl = 120.
+
+            def check(self, eventtime):
+                calls.append(eventtime)
+                time.sleep(0.002)
+                return module.Veto(module.Decision.CONDITION, "slow says no", condition='slow')
+
+        class NoCheck(module.PowerOffCondition):
+            name = 'no_check'
+
+        with self.assertRaises(TypeError):
+            NoCheck()
+        apo.register_condition(SlowCondition())
+        with self.assertRaises(ValueError):
+            apo.register_condition(SlowCondition())
+        printer.reactor.advance(601.)
+        printer.reactor.advance(60.)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(apo.journal.query(1)[0]['condition'], 'slow')
+        report = printer.lookup_object('webhooks').call('auto_power_off/conditions').response['conditions']
+        self.assertEqual(report[-1]['name'], 'slow')
+        self.assertEqual(report[-1]['veto'], 'postponed_condition')
+        self.assertGreaterEqual(report[-1]['cost_ms'], 2.)
+        self.assertEqual([c['name'] for c in report[:3]].count('temperature'), 1)
+        self.assertEqual(report[0]['name'], 'print_state')
+        self.assertEqual(sorted(c['cost_ms'] for c in report[1:]), [c['cost_ms'] for c in report[1:]])
+
+    def test_print_cancels_even_when_idle_measures_cheaper(self):
+        printer, apo = self._make()
+        printer.lookup_object('idle_timeout').status['state'] = 'Ready'
+        printer.reactor.advance(601.)
+        self.assertEqual(apo.journal.query(1)[0]['decision'], 'postponed_not_idle')
+        # Timing noise: idle now measures far cheaper / Bruit de mesure : idle paraît bien moins coûteux
+        costs = {c.name: c for c in apo.conditions.conditions}
+        costs['idle'].cost, costs['print_state'].cost = 1e-9, 1.
+        printer.lookup_object('idle_timeout').status['state'] = 'Printing'
+        printer.lookup_object('print_stats').status['state'] = 'printing'
+        printer.reactor.advance(60.)
+        self.assertEqual(apo.journal.query(1)[0]['decision'], 'canceled_printing')
+        self.assertIsNone(apo.shutdown_timer)
+
+
+class DryRunTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = os.path.join(tmp.name, 'moonraker.sock')
+        self.moonraker = network_standins.FakeMoonrakerSocket(self.socket_path, print_state='complete')
+        self.addCleanup(self.moonraker.stop)
+
+    def _make(self, **options):
+        printer, apo = klippy_fakes.make_printer(dict({'auto_poweroff_enabled': True, 'dry_run_mode': True},
+                                                      **options))
+        if apo.moonraker_integration:
+            self.addCleanup(apo.moonraker.close)
+        return printer, apo, printer.lookup_object('gcode')
+
+    def test_direct_sequence_is_simulated(self):
+        printer, apo, gcode = self._make()
+        apo._arm_timer()
+        printer.reactor.advance(601.)
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [])
+        self.assertNotIn('TURN_OFF_HEATERS', gcode.scripts)
+        self.assertEqual(apo.journal.query(1)[0]['outcome'], 'dry_run')
+        report = apo.last_dry_run
+        self.assertEqual(report['outcome'], 'direct')
+        self.assertEqual([p['name'] for p in report['phases']], ['state_checks', 'preflight', 'direct'])
+        self.assertEqual(report['calls'], ['gcode TURN_OFF_HEATERS', 'direct set_power(0)'])
+        self.assertEqual(report['phases'][1]['simulated_ms'], 1500.)
+        self.assertGreaterEqual(report['predicted_latency'], 1.5)
+        self.assertIn(apo.get_text('power_off_success'), report['notifications'])
+        self.assertTrue(gcode.responses[-1].startswith('DRY RUN: predicted shutdown latency'))
+        self.assertEqual(apo.runtime.state, 'init')
+        self.assertFalse(apo.runtime.shutdown_in_progress)
+
+    def test_real_power_off_turns_heaters_off_first(self):
+        printer, apo, gcode = self._make(dry_run_mode=False)
+        with mock.patch('time.sleep'):
+            apo._power_off()
+        self.assertEqual(gcode.scripts, ['TURN_OFF_HEATERS'])
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [0])
+
+    def test_injected_failure_exercises_retries_and_fallback(self):
+        printer, apo, gcode = self._make(moonraker_integration=True, moonraker_socket=self.socket_path,
+                                         power_off_retry_delay=2)
+        request = printer.lookup_object('webhooks').call('auto_power_off/dry_run', fail='moonraker')
+        report = request.response
+        self.assertEqual(report['outcome'], 'direct')
+        self.assertEqual(report['calls'], ['gcode TURN_OFF_HEATERS'] + ['moonraker post_device off'] * 3
+                         + ['direct set_power(0)'])
+        moonraker_phase = [p for p in report['phases'] if p['name'] == 'moonraker'][0]
+        self.assertGreaterEqual(moonraker_phase['simulated_ms'], 1500.)
+        # Only the read-only probe reached Moonraker / Seule la sonde en lecture a atteint Moonraker
+        self.assertEqual([m for m, _ in self.moonraker.calls], ['machine.device_power.get_device'])
+        self.assertEqual(apo.circuit_breakers['moonraker'].failures, 0)
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [])
+        with self.assertRaises(klippy_fakes.CommandError):
+            printer.lookup_object('webhooks').call('auto_power_off/dry_run', fail='toaster')
+
+    def test_unreachable_backend_is_reported(self):
+        self.moonraker.errors['machine.device_power.get_device'] = 'Component power not loaded'
+        printer, apo, gcode = self._make(moonraker_integration=True, moonraker_socket=self.socket_path)
+        gcode.commands['AUTO_POWEROFF_DRYRUN'](klippy_fakes.FakeGCodeCommand(gcode, {'VALUE': 1, 'FAIL': ''}))
+        report = apo._power_off_dry_run()
+        self.assertIn('moonraker', report['unreachable'])
+        self.assertEqual(report['outcome'], 'direct')
+        self.assertIn('moonraker unreachable', gcode.responses[-1])
+        with self.assertRaises(klippy_fakes.CommandError):
+            gcode.commands['AUTO_POWEROFF_DRYRUN'](klippy_fakes.FakeGCodeCommand(gcode, {'FAIL': 'toaster'}))
+
+    def test_probes_are_bounded_and_notify_nobody(self):
+        self.moonraker.faults['machine.device_power.get_device'] = 'hang'
+        printer, apo, gcode = self._make(moonraker_integration=True, moonraker_socket=self.socket_path,
+                                         network_device=True, device_address='192.0.2.1')  # TEST-NET-1
+        start = time.monotonic()
+        report = apo._power_off_dry_run()
+        self.assertLess(time.monotonic() - start, klippy_fakes.load_module().DryRunRecorder.PROBE_BUDGET + 0.5)
+        self.assertEqual(set(report['unreachable']), {'network', 'moonraker'})
+        self.assertTrue(report['outcome'].startswith('failed'))
+        # Kept in the report, never sent / Conservées dans le rapport, jamais envoyées
+        self.assertIn(apo.get_text('network_device_unreachable_poweroff', device='192.0.2.1'),
+                      report['notifications'])
+        self.assertEqual(apo._notify_pending, [])
+        self.assertEqual(len(gcode.responses), 1)
+
+
+class RuntimeSettingsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.options = {'auto_poweroff_enabled': True, 'idle_timeout': 600,
+                        'state_file': os.path.join(tmp.name, 'state.json')}
+        self.module = klippy_fakes.load_module()
+        self.printer, self.apo = klippy_fakes.make_printer(self.options, self.module)
+        self.gcode = self.printer.lookup_object('gcode')
+        self.reactor = self.printer.reactor
+
+    def _set(self, **params):
+        self.gcode.commands['AUTO_POWEROFF_SET'](klippy_fakes.FakeGCodeCommand(self.gcode, params))
+
+    def test_running_countdown_is_moved_in_place(self):
+        self.apo._arm_timer()
+        timer = self.apo.shutdown_timer
+        self.reactor.advance(100.)
+        self._set(IDLE_TIMEOUT=300, TEMP_THRESHOLD=50)
+        self.assertIs(self.apo.shutdown_timer, timer)
+        self.assertEqual(timer.waketime, self.apo.runtime.countdown_start + 300.)
+        self.assertEqual(self.apo.temp_threshold, 50.)
+        self.assertEqual(self.printer.lookup_object('auto_power_off_info').get_status(0)['idle_timeout'], 300)
+        self.reactor.advance(201.)
+        self.assertEqual(self.printer.lookup_object('power psu_control').power_calls, [0])
+
+    def test_invalid_values_change_nothing(self):
+        for params in ({'IDLE_TIMEOUT': 300, 'TEMP_THRESHOLD': 'hot'},
+                       {'IDLE_TIMEOUT': 300, 'MONITOR_BED': 'maybe'},
+                       {'IDLE_TIMEOUT': 300, 'POWER_DEVICE': 'missing'},
+                       {'IDLE_TIMEOUT': -1},
+                       {'UNKNOWN': 1}, {}):
+            with self.assertRaises(klippy_fakes.CommandError):
+                self._set(**params)
+        self.assertEqual(self.apo.idle_timeout, 600.)
+        self.assertTrue(self.apo.monitor_bed)
+        self.assertEqual(self.apo.power_device, 'psu_control')
+
+    def test_power_device_is_fixed_with_a_plug(self):
+        printer, apo = klippy_fakes.make_printer(dict(self.options, plug_type='homeassistant',
+                                                      device_address='127.0.0.1'), self.module)
+        self.addCleanup(apo.plug_driver.close)
+        with self.assertRaises(klippy_fakes.CommandError):
+            printer.lookup_object('webhooks').call('auto_power_off/set', power_device='other')
+        self.assertEqual(apo.power_device, 'psu_control')
+        self.assertEqual(apo.plug_driver.entity_id, 'switch.psu_control')
+
+    def test_webhook_and_save(self):
+        webhooks = self.printer.lookup_object('webhooks')
+        request = webhooks.call('auto_power_off/set', idle_timeout=900, monitor_bed=False, save=True)
+        self.assertEqual(request.response, {'applied': {'idle_timeout': 900., 'monitor_bed': False}, 'saved': True})
+        with self.assertRaises(klippy_fakes.CommandError):
+            webhooks.call('auto_power_off/set', power_off_retries=0)
+        self.assertEqual(self.apo.power_off_retries, 3)
+        printer2, apo2 = klippy_fakes.make_printer(self.options, self.module)
+        self.assertEqual(apo2.idle_timeout, 900.)
+        self.assertFalse(apo2.monitor_bed)
+
+
+class WebhookApiTest(unittest.TestCase):
+    def setUp(self):
+        self.module = klippy_fakes.load_module()
+        self.printer, self.apo = klippy_fakes.make_printer({'auto_poweroff_enabled': True}, self.module)
+        self.webhooks = self.printer.lookup_object('webhooks')
+        self.gcode = self.printer.lookup_object('gcode')
+
+    def test_status_is_plain_json(self):
+        response = self.webhooks.call('auto_power_off/status').response
+        self.assertEqual(json.loads(json.dumps(response)), response)
+        self.assertEqual(response['status']['state'], self.apo.get_status(0)['state'])
+        self.assertEqual(response['info']['idle_timeout'], 600)
+
+    def test_arm_and_cancel(self):
+        response = self.webhooks.call('auto_power_off/arm').response
+        self.assertTrue(response['armed'])
+        self.assertAlmostEqual(response['deadline'] - response['server_time'], 600., places=2)
+        self.assertFalse(self.webhooks.call('auto_power_off/arm').response['armed'])
+        self.assertTrue(self.webhooks.call('auto_power_off/status').response['status']['active'])
+        self.assertEqual(self.webhooks.call('auto_power_off/cancel').response, {'canceled': True})
+        self.assertEqual(self.webhooks.call('auto_power_off/cancel').response, {'canceled': False})
+        self.assertIsNone(self.apo.shutdown_timer)
+        # Nothing went through the G-code path / Rien n'est passé par le G-code
+        self.assertEqual((self.gcode.responses, self.gcode.scripts), ([], []))
+
+    def test_arm_refused_when_disabled(self):
+        self.apo.enabled = False
+        with self.assertRaises(klippy_fakes.CommandError):
+            self.webhooks.call('auto_power_off/arm')
+        self.assertIsNone(self.apo.shutdown_timer)
+
+    def test_history(self):
+        self.apo.journal.record(self.module.Decision.TEMPERATURE, temps={'hotend': 45.0})
+        self.apo.journal.record(self.module.Decision.NOT_IDLE, state='busy')
+        entries = self.webhooks.call('auto_power_off/history').response['entries']
+        self.assertEqual([e['decision'] for e in entries], ['postponed_temperature', 'postponed_not_idle'])
+        entries = self.webhooks.call('auto_power_off/history', count=5, decision='POSTPONED_TEMPERATURE').response['entries']
+        self.assertEqual(entries[0]['temps'], {'hotend': 45.0})
+        self.assertEqual(len(entries), 1)
+        for count in (0, 'many'):
+            with self.assertRaises(klippy_fakes.CommandError):
+                self.webhooks.call('auto_power_off/history', count=count)
+
+
+class TemperatureHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.module = klippy_fakes.load_module()
+
+    def test_tiers_average_and_stay_bounded(self):
+        history = self.module.TemperatureHistory([(1., 10.), (5., 60.)])
+        for second in range(100):
+            history.add(float(second), float(second), math.nan, math.nan)
+        fine = history.query(100., resolution=1.)
+        self.assertEqual(fine['step'], 1.)
+        self.assertEqual(fine['time'], [float(t) for t in range(89, 99)])
+        self.assertEqual(fine['temps'], {'hotend': [float(t) for t in range(89, 99)]})
+        coarse = history.query(100., resolution=2.)
+        self.assertEqual(coarse['step'], 5.)
+        self.assertEqual(len(coarse['time']), 12)
+        self.assertEqual(coarse['temps']['hotend'][-1], 92.)
+        self.assertEqual(history.query(100., resolution=2., count=3)['time'], [80., 85., 90.])
+        # The finest tier reaching back to since / Le palier le plus fin qui remonte jusqu'à since
+        self.assertEqual(history.query(100., since=95.)['time'], [95., 96., 97., 98.])
+        self.assertEqual(history.query(100., since=50.)['step'], 5.)
+
+    def test_webhook_serves_unix_times(self):
+        printer, apo = klippy_fakes.make_printer({'temp_history': '1:60, 10:600', 'idle_sample_interval': 1},
+                                                 self.module)
+        webhooks = printer.lookup_object('webhooks')
+        printer.lookup_object('extruder').temp = 200.
+        printer.reactor.advance(30.)
+        printer.lookup_object('extruder').temp = 100.
+        printer.reactor.advance(30.)
+        response = webhooks.call('auto_power_off/temperature_history', resolution=10).response
+        self.assertEqual(response['step'], 10.)
+        # The 10 s bucket with the change holds one reading at 200 and nine at 100
+        self.assertEqual(response['temps']['hotend'], [200., 200., 200., 110., 100., 100.])
+        self.assertEqual(response['temps']['bed'], [25.] * 6)
+        self.assertAlmostEqual(response['time'][-1], time.time() - 10., delta=2.)
+        since = time.time() - 5.
+        response = webhooks.call('auto_power_off/temperature_history', since=since).response
+        self.assertEqual(response['step'], 1.)
+        self.assertEqual(len(response['time']), 5)
+        with self.assertRaises(klippy_fakes.CommandError):
+            webhooks.call('auto_power_off/temperature_history', count=0)
+
+    def test_config(self):
+        with self.assertRaises(klippy_fakes.ConfigError):
+            klippy_fakes.make_printer({'temp_history': '10:600, 1:60'}, self.module)
+        with self.assertRaises(klippy_fakes.ConfigError):
+            klippy_fakes.make_printer({'temp_history': '10'}, self.module)
+        printer, apo = klippy_fakes.make_printer({'temp_history': ''}, self.module)
+        with self.assertRaises(klippy_fakes.CommandError):
+            printer.lookup_object('webhooks').call('auto_power_off/temperature_history')
+
+
+class IdleAllocationTest(unittest.TestCase):
+    def setUp(self):
+        self.printer, self.apo = klippy_fakes.make_printer({'auto_poweroff_enabled': True})
+        self.apo._arm_timer()
+
+    def _idle(self, seconds):
+        for _ in range(seconds * 4):
+            self.printer.reactor.advance(.25)
+            self.apo.get_status(self.printer.reactor.clock)
+            self.apo.info.get_status(self.printer.reactor.clock)
+
+    def test_status_is_reused_until_a_field_changes(self):
+        self.printer.reactor.advance(1.)
+        status = self.apo.get_status(0)
+        self.assertIs(self.apo.get_status(0), status)
+        self.printer.lookup_object('extruder').temp = 30.
+        self.printer.reactor.advance(1.)
+        changed = self.apo.get_status(0)
+        self.assertIsNot(changed, status)
+        self.assertEqual(changed['current_temps']['hotend'], 30.)
+        self.assertEqual(status['current_temps']['hotend'], 25.)
+
+    def test_sensor_noise_does_not_change_status(self):
+        heater = self.printer.lookup_object('extruder')
+        reactor = self.printer.reactor
+        heater.temp = 24.98
+        reactor.advance(1.)
+        status = self.apo.get_status(0)
+        for i in range(30):
+            heater.temp = 25. + (0.03 if i % 2 else -0.04)
+            reactor.advance(1.)
+            self.assertIs(self.apo.get_status(0), status)
+        heater.temp = 26.2
+        reactor.advance(1.)
+        self.assertEqual(self.apo.get_status(0)['current_temps']['hotend'], 26.)
+        # The history keeps the raw readings / L'historique garde les valeurs brutes
+        self.assertEqual(self.apo.temp_history.query(reactor.clock, count=2)['temps']['hotend'], [24.96, 25.03])
+
+    def test_temperature_ticks_keep_the_chamber(self):
+        printer, apo = klippy_fakes.make_printer({'monitor_chamber': True})
+        printer.objects['temperature_sensor chamber'] = klippy_fakes.FakeHeater('chamber', 40.)
+        apo.conditions.evaluate(printer.reactor.clock)
+        self.assertEqual(apo.get_status(0)['current_temps']['chamber'], 40.)
+        status = apo.get_status(0)
+        printer.reactor.advance(1.)
+        self.assertIs(apo.get_status(0), status)
+        printer.lookup_object('extruder').temp = 30.
+        printer.reactor.advance(1.)
+        self.assertEqual(apo.get_status(0)['current_temps'], {'hotend': 30., 'bed': 25., 'chamber': 40.})
+        self.assertEqual(status['current_temps']['hotend'], 25.)
+
+    def test_status_only_changes_on_countdown_events(self):
+        reactor = self.printer.reactor
+        self.printer.reactor.advance(1.)
+        status = self.apo.get_status(0)
+        self.assertTrue(status['active'])
+        self.assertAlmostEqual(status['deadline'] - status['server_time'], self.apo.idle_timeout, places=2)
+        self.assertAlmostEqual(status['deadline'], time.time() + self.apo.idle_timeout, delta=1.)
+        for _ in range(30):
+            reactor.advance(1.)
+            self.assertIs(self.apo.get_status(reactor.clock), status)
+        self.printer.lookup_object('gcode').run_script("G28")
+        reactor.advance(self.apo.idle_timeout - 20.)
+        postponed = self.apo.get_status(reactor.clock)
+        self.assertIsNot(postponed, status)
+        self.assertAlmostEqual(postponed['deadline'] - postponed['server_time'], 31., places=2)
+        self.printer.lookup_object('print_stats').status['state'] = 'printing'
+        reactor.advance(30.)
+        canceled = self.apo.get_status(reactor.clock)
+        self.assertFalse(canceled['active'])
+        self.assertIsNone(canceled['deadline'])
+        self.assertIsNone(self.apo.shutdown_timer)
+
+    def test_idle_ticks_do_not_allocate(self):
+        self.assertFalse(hasattr(self.apo.runtime, '__dict__'))
+        module_file = klippy_fakes.MODULE_PATH
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        # Warm up under tracing so that live buffers are traced in both snapshots
+        self._idle(20)
+        before = tracemalloc.take_snapshot()
+        self._idle(60)
+        after = tracemalloc.take_snapshot()
+        # Net growth over the whole module: a float replaced by another one is not a leak.
+        # The few timer deadlines and averages alive at each snapshot come from
+        # different lines depending on the phase, so allow a handful of objects,
+        # far below one per tick (240 ticks here).
+        # Croissance nette sur tout le module, à quelques valeurs en cours près
+        growth = [stat for stat in after.compare_to(before, 'filename')
+                  if stat.traceback[0].filename == module_file]
+        self.assertLessEqual(sum(stat.count_diff for stat in growth), 4, growth)
+        self.assertLessEqual(sum(stat.size_diff for stat in growth), 256, growth)
+
+
+class StatusExportTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'auto_power_off')
+        self.module = klippy_fakes.load_module()
+        self.printer, self.apo = klippy_fakes.make_printer(
+            {'auto_poweroff_enabled': True, 'status_export': self.path}, self.module)
+        self.addCleanup(self.apo._handle_disconnect)
+        self.read = self.module.StatusExport.read
+
+    def test_record_follows_the_countdown(self):
+        reactor = self.printer.reactor
+        reactor.advance(1.)
+        record = self.read(self.path)
+        self.assertEqual(os.path.getsize(self.path), 96)
+        self.assertFalse(record['active'])
+        self.assertTrue(math.isnan(record['deadline']))
+        self.assertEqual((record['hotend'], record['bed']), (25., 25.))
+        self.apo._arm_timer()
+        reactor.run_callbacks()
+        armed = self.read(self.path)
+        self.assertTrue(armed['active'])
+        self.assertAlmostEqual(armed['deadline'] - armed['server_time'], self.apo.idle_timeout, places=2)
+        self.assertEqual(armed['state'], self.apo.get_status(0)['state'])
+        # Idle ticks leave the record alone / Les ticks au repos ne réécrivent pas
+        reactor.advance(30.)
+        self.assertEqual(self.read(self.path)['seq'], armed['seq'])
+        self.printer.lookup_object('extruder').temp = 60.
+        reactor.advance(1.)
+        heated = self.read(self.path)
+        self.assertEqual(heated['hotend'], 60.)
+        self.assertGreater(heated['seq'], armed['seq'])
+        self.assertEqual(heated['seq'] % 2, 0)
+        self.apo._cancel_timer()
+        reactor.run_callbacks()
+        self.assertFalse(self.read(self.path)['active'])
+
+    def test_reader_rejects_torn_and_foreign_records(self):
+        self.printer.reactor.advance(1.)
+        with open(self.path, 'r+b') as f:
+            f.seek(8)
+            seq = int.from_bytes(f.read(8), 'little')
+            f.seek(8)
+            f.write((seq + 1).to_bytes(8, 'little'))
+        self.assertIsNone(self.read(self.path, retries=3))
+        with open(self.path, 'r+b') as f:
+            f.write(b'XXXX')
+        self.assertIsNone(self.read(self.path))
+        self.assertIsNone(self.read(self.path + '.missing'))
+
+    def test_unwritable_path_disables_the_export(self):
+        printer, apo = klippy_fakes.make_printer(
+            {'status_export': os.path.join(self.path, 'missing', 'status')}, self.module)
+        with self.assertLogs('auto_power_off', 'WARNING'):
+            printer.reactor.advance(1.)
+        self.assertIsNone(apo.status_export.path)
+        printer.reactor.advance(5.)
+
+
+class StateEventTest(unittest.TestCase):
+    EVENTS = ('armed', 'postponed', 'canceled', 'powering_off', 'powered_off')
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = os.path.join(tmp.name, 'moonraker.sock')
+        self.module = klippy_fakes.load_module()
+
+    def _make(self, **options):
+        printer, apo = klippy_fakes.make_printer(dict({'auto_poweroff_enabled': True}, **options), self.module)
+        received = []
+        for name in self.EVENTS:
+            printer.register_event_handler('auto_power_off:' + name, received.append)
+        return printer, apo, received
+
+    def test_countdown_lifecycle(self):
+        printer, apo, received = self._make()
+        printer.reactor.advance(1.)
+        apo._arm_timer()
+        printer.reactor.advance(10.)
+        printer.lookup_object('gcode').run_script("G28")
+        printer.reactor.advance(apo.idle_timeout - 5.)
+        printer.lookup_object('print_stats').status['state'] = 'printing'
+        printer.reactor.advance(apo.idle_timeout + 1.)
+        events = [payload.event for payload in received]
+        self.assertEqual(events, [self.module.PowerOffEvent.ARMED, self.module.PowerOffEvent.POSTPONED,
+                                  self.module.PowerOffEvent.CANCELED])
+        armed, postponed, canceled = received
+        self.assertAlmostEqual(armed.deadline - armed.time, apo.idle_timeout, delta=1.)
+        self.assertEqual(postponed.reason, 'postponed_activity')
+        # Pushed back by the 10 s between arming and G28 / Repoussé des 10 s entre l'armement et G28
+        self.assertAlmostEqual(postponed.deadline - postponed.time, 10., delta=1.)
+        self.assertEqual((canceled.reason, canceled.deadline), ('canceled_printing', None))
+        self.assertEqual(armed.temps, {'hotend': 25., 'bed': 25.})
+        # Manual cancel without a countdown sends nothing / Sans compte à rebours, rien n'est envoyé
+        apo._cancel_timer()
+        self.assertEqual(len(received), 3)
+
+    def test_power_off_and_faulty_handler(self):
+        printer, apo, received = self._make()
+        printer.register_event_handler('auto_power_off:armed', lambda payload: 1 / 0)
+        apo._arm_timer()
+        self.assertIsNotNone(apo.shutdown_timer)
+        printer.reactor.advance(apo.idle_timeout + 1.)
+        self.assertEqual([payload.event.value for payload in received],
+                         ['auto_power_off:armed', 'auto_power_off:powering_off', 'auto_power_off:powered_off'])
+        self.assertEqual(received[-1].method, apo.optimal_method.name)
+        self.assertFalse(received[-1].dry_run)
+
+    def test_dry_run_reports_simulated_power_off(self):
+        printer, apo, received = self._make(dry_run_mode=True)
+        apo._power_off()
+        self.assertEqual([(p.event.name, p.dry_run) for p in received],
+                         [('POWERING_OFF', True), ('POWERED_OFF', True)])
+        apo.dry_run_failures = {'direct'}
+        received.clear()
+        apo._power_off()
+        self.assertEqual([p.event.name for p in received], ['POWERING_OFF'])
+
+    def test_forwarded_to_moonraker_clients(self):
+        moonraker = network_standins.FakeMoonrakerSocket(self.socket_path, print_state='complete')
+        self.addCleanup(moonraker.stop)
+        printer, apo, received = self._make(moonraker_integration=True, moonraker_events=True,
+                                            moonraker_socket=self.socket_path, job_queue_aware=False)
+        self.addCleanup(apo.moonraker.close)
+        self.addCleanup(apo.moonraker_event_sender.close)
+        moonraker.latency = 0.2
+        start = time.monotonic()
+        apo._arm_timer()
+        apo._cancel_timer()
+        # Queued for the worker thread, the reactor did not wait / En file, le réacteur n'a pas attendu
+        self.assertLess(time.monotonic() - start, 0.1)
+        deadline = time.monotonic() + 5.
+        while len(moonraker.calls) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.3)
+        printer.reactor.run_callbacks()
+        self.assertEqual(apo.circuit_breakers['moonraker'].failures, 0)
+        methods = [method for method, _ in moonraker.calls]
+        self.assertEqual(methods.count('server.connection.identify'), 1)
+        events = [params for method, params in moonraker.calls if method == 'connection.send_event']
+        self.assertEqual([e['event'] for e in events], ['armed', 'canceled'])
+        self.assertEqual(events[1]['data']['reason'], 'command')
+        self.assertEqual(json.loads(json.dumps(events[0]['data'])), received[0].as_dict())
+        # Moonraker down: the countdown goes on / Moonraker arrêté : le compte à rebours continue
+        moonraker.stop()
+        apo._arm_timer()
+        self.assertIsNotNone(apo.shutdown_timer)
+
+
+class AdaptiveSamplingTest(unittest.TestCase):
+    def setUp(self):
+        self.printer, self.apo = klippy_fakes.make_printer({'auto_poweroff_enabled': True})
+        self.reactor = self.printer.reactor
+
+    def _readings(self, seconds):
+        start = len(self.reactor.stalls)
+        self.reactor.advance(seconds)
+        return sum(1 for name, _ in self.reactor.stalls[start:] if name == '_update_temps')
+
+    def test_idle_printer_samples_slowly(self):
+        self.assertEqual(self.apo.idle_sample_interval, 10.)
+        self._readings(10.)
+        self.assertLessEqual(self._readings(100.), 11)
+        self.apo._arm_timer()
+        self.assertEqual(self._readings(0.), 1)
+        self.assertEqual(self._readings(30.), 30)
+        self.apo._cancel_timer()
+        self._readings(1.)
+        self.assertLessEqual(self._readings(100.), 11)
+
+    def test_status_queries_keep_full_rate(self):
+        self._readings(20.)
+        self.printer.lookup_object('extruder').temp = 80.
+        self.apo.get_status(self.reactor.monotonic())
+        self.assertEqual(self._readings(0.), 1)
+        self.assertEqual(self.apo.get_status(0)['current_temps']['hotend'], 80.)
+        # A subscribed UI polls every 250 ms / Une interface abonnée interroge toutes les 250 ms
+        readings = 0
+        for _ in range(40):
+            readings += self._readings(.25)
+            self.apo.get_status(self.reactor.monotonic())
+        self.assertEqual(readings, 10)
+        self._readings(self.apo.STATUS_QUERY_WINDOW)
+        self.assertLessEqual(self._readings(100.), 11)
+
+
+class CooldownAssistTest(unittest.TestCase):
+    def setUp(self):
+        self.printer, self.apo = klippy_fakes.make_printer({
+            'auto_poweroff_enabled': True, 'cooldown_assist': True,
+            'cooldown_fans': 'fan, fan_generic enclosure', 'cooldown_fan_speed': 0.8})
+        self.gcode = self.printer.lookup_object('gcode')
+        self.extruder = self.printer.lookup_object('extruder')
+        self.extruder.temp = 200.
+
+    def test_fans_run_until_threshold(self):
+        self.apo._arm_timer()
+        self.printer.reactor.run_callbacks()
+        self.assertEqual(self.gcode.scripts, ['TURN_OFF_HEATERS', 'M106 S204', 'SET_FAN_SPEED FAN=enclosure SPEED=0.80'])
+        self.assertTrue(self.apo.get_status(0)['cooldown_active'])
+        self.printer.reactor.advance(9.)
+        self.extruder.temp = 35.
+        self.printer.reactor.advance(5.)
+        self.assertEqual(self.gcode.scripts[-2:], ['M107', 'SET_FAN_SPEED FAN=enclosure SPEED=0.00'])
+        status = self.apo.get_status(0)
+        self.assertFalse(status['cooldown_active'])
+        self.assertEqual(status['time_to_threshold'], 10.)
+        self.assertIsNotNone(self.apo.shutdown_timer)
+
+    def test_already_cool(self):
+        self.extruder.temp = 30.
+        self.apo._arm_timer()
+        self.printer.reactor.run_callbacks()
+        self.assertEqual(self.gcode.scripts, ['TURN_OFF_HEATERS'])
+        self.assertEqual(self.apo.get_status(0)['time_to_threshold'], 0.)
+
+    def test_cancel_stops_fans_but_print_keeps_them(self):
+        self.apo._arm_timer()
+        self.printer.reactor.run_callbacks()
+        self.gcode.commands['AUTO_POWEROFF'](klippy_fakes.FakeGCodeCommand(self.gcode, {'OPTION': 'CANCEL'}))
+        self.printer.reactor.run_callbacks()
+        self.assertEqual(self.gcode.scripts[-1], 'SET_FAN_SPEED FAN=enclosure SPEED=0.00')
+        self.apo._arm_timer()
+        self.printer.reactor.run_callbacks()
+        count = len(self.gcode.scripts)
+        self.printer.lookup_object('print_stats').status['state'] = 'printing'
+        self.printer.reactor.advance(self.apo.idle_timeout + 1.)
+        self.assertEqual(len(self.gcode.scripts), count)
+        self.assertIsNone(self.apo._cooldown_timer)
+        self.assertFalse(self.apo.get_status(0)['cooldown_active'])
+
+    def test_webhooks_run_cooldown_gcode_under_the_mutex(self):
+        webhooks = self.printer.lookup_object('webhooks')
+        webhooks.call('auto_power_off/arm')
+        self.assertEqual(self.gcode.scripts, [])
+        self.printer.reactor.run_callbacks()
+        webhooks.call('auto_power_off/cancel')
+        self.printer.reactor.run_callbacks()
+        self.assertEqual(self.gcode.scripts, ['TURN_OFF_HEATERS', 'M106 S204', 'SET_FAN_SPEED FAN=enclosure SPEED=0.80',
+                                              'M107', 'SET_FAN_SPEED FAN=enclosure SPEED=0.00'])
+        self.assertEqual(self.gcode.from_command, [])
+
+    def test_only_controllable_fans(self):
+        with self.assertRaises(klippy_fakes.ConfigError):
+            klippy_fakes.make_printer({'cooldown_fans': 'heater_fan hotend_fan'})
+
+
+class PowerOnTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.module = klippy_fakes.load_module()
+        self.options = {'state_file': os.path.join(tmp.name, 'state.json'),
+                        'power_on_macro': 'G28', 'power_on_delay': 1.}
+
+    def _start(self, ready=False, **options):
+        printer, apo = klippy_fakes.make_printer(dict(self.options, **options), self.module, ready=ready)
+        return printer, apo, printer.lookup_object('gcode')
+
+    def _finish_switch_on(self, printer, apo):
+        """Wait for the power on worker, then run its reactor callback."""
+        apo._power_on_worker.join(10.)
+        printer.reactor.run_callbacks()
+        self.assertIsNone(apo._power_on_worker)
+
+    def test_power_on_resumes_after_firmware_restart(self):
+        printer, apo, gcode = self._start()
+        gcode.commands['AUTO_POWEROFF_POWER_ON'](klippy_fakes.FakeGCodeCommand(gcode, {}))
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [1])
+        self.assertEqual(apo.get_status(0)['state'], 'starting')
+        printer.reactor.advance(0.5)
+        self.assertEqual(printer.exit_requests, [])
+        printer.reactor.advance(1.)
+        self.assertEqual(printer.exit_requests, ['firmware_restart'])
+        # FIRMWARE_RESTART builds a new instance from the config
+        printer, apo, gcode = self._start(ready=True)
+        self.assertEqual(gcode.scripts, ['G28'])
+        status = apo.get_status(0)
+        self.assertEqual(status['state'], 'on')
+        last = status['last_power_on']
+        self.assertEqual((last['source'], last['method'], last['attempts']), ('gcode', 'SET_POWER', 1))
+        self.assertEqual(set(last['steps']), {'switch_on', 'mcu_port', 'mcu_ready', 'warmup', 'total'})
+        self.assertIsNone(apo.state_file.get('power_on'))
+        # Kept for the next start / Conservé pour le prochain démarrage
+        _, apo, _ = self._start(ready=True)
+        self.assertEqual(apo.get_status(0)['last_power_on'], last)
+
+    def test_mcu_not_back_retries_then_gives_up(self):
+        printer, apo, gcode = self._start(power_on_timeout=60.)
+        gcode.commands['AUTO_POWEROFF_POWER_ON'](klippy_fakes.FakeGCodeCommand(gcode, {}))
+        printer.reactor.advance(2.)
+        printer, apo, gcode = self._start(power_on_timeout=60.)
+        printer.reactor.advance(2.)
+        self.assertEqual(printer.exit_requests, ['firmware_restart'])
+        self.assertEqual(apo.state_file.get('power_on')['attempt'], 2)
+        with mock.patch('time.time', return_value=time.time() + 61.):
+            printer, apo, gcode = self._start(power_on_timeout=60.)
+            printer.reactor.advance(60.)
+        self.assertEqual(printer.exit_requests, [])
+        self.assertIsNone(apo.state_file.get('power_on'))
+        self.assertEqual(apo.get_status(0)['state'], 'init')
+
+    def test_ready_after_resume_cancels_the_retry(self):
+        printer, apo, gcode = self._start()
+        gcode.commands['AUTO_POWEROFF_POWER_ON'](klippy_fakes.FakeGCodeCommand(gcode, {}))
+        printer.reactor.advance(2.)
+        # The new instance resumes while the MCU is still connecting
+        # La nouvelle instance reprend pendant la connexion du MCU
+        printer, apo, gcode = self._start()
+        self.assertIsNotNone(apo._power_on_timer)
+        printer.send_event("klippy:connect")
+        printer.send_event("klippy:ready")
+        printer.reactor.run_callbacks()
+        self.assertIsNone(apo._power_on_timer)
+        printer.reactor.advance(200.)
+        self.assertEqual(printer.exit_requests, [])
+        self.assertEqual(gcode.scripts, ['G28'])
+        self.assertEqual(apo.get_status(0)['state'], 'on')
+        self.assertEqual(apo.journal.query(1)[0]['decision'], 'powered_on')
+
+    def test_waits_for_mcu_serial_port(self):
+        serial = os.path.join(self.dir, 'usb-Klipper_stm32')
+        printer, apo, gcode = self._start(power_on_mcu_serial=serial)
+        request = printer.lookup_object('webhooks').call('auto_power_off/power_on', macro='G28\nBED_MESH_PROFILE LOAD=default')
+        self.assertTrue(request.response['started'])
+        printer.reactor.advance(10.)
+        self.assertEqual(printer.exit_requests, [])
+        open(serial, 'w').close()
+        printer.reactor.advance(6.)
+        self.assertEqual(printer.exit_requests, ['firmware_restart'])
+        printer, apo, gcode = self._start(ready=True, power_on_mcu_serial=serial)
+        self.assertEqual(gcode.scripts, ['G28', 'BED_MESH_PROFILE LOAD=default'])
+        self.assertGreaterEqual(apo.get_status(0)['last_power_on']['steps']['mcu_port'], 0.)
+
+    def test_already_on(self):
+        printer, apo, gcode = self._start(ready=True)
+        gcode.commands['AUTO_POWEROFF_POWER_ON'](klippy_fakes.FakeGCodeCommand(gcode, {}))
+        self.assertEqual(gcode.responses[-1], apo.get_text('power_on_already'))
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [])
+
+    def test_queued_job_powers_on(self):
+        socket_path = os.path.join(self.dir, 'moonraker.sock')
+        moonraker = network_standins.FakeMoonrakerSocket(socket_path, print_state='complete')
+        self.addCleanup(moonraker.stop)
+        printer, apo, gcode = self._start(moonraker_integration=True, moonraker_socket=socket_path,
+                                          power_on_when_queued=True, power_on_poll_interval=30.)
+        self.addCleanup(apo.moonraker.close)
+        printer.reactor.advance(31.)
+        self.assertNotIn('machine.device_power.post_device', [m for m, _ in moonraker.calls])
+        moonraker.queued_jobs = ['next_part.gcode']
+        printer.reactor.advance(30.)
+        self._finish_switch_on(printer, apo)
+        self.assertEqual(moonraker.calls[-1], ('machine.device_power.post_device',
+                                               {'device': 'psu_control', 'action': 'on'}))
+        self.assertEqual(apo.state_file.get('power_on')['source'], 'job_queue')
+
+    def test_network_backends_run_off_the_reactor(self):
+        socket_path = os.path.join(self.dir, 'moonraker.sock')
+        moonraker = network_standins.FakeMoonrakerSocket(socket_path)
+        self.addCleanup(moonraker.stop)
+        moonraker.latency = 0.5
+        printer, apo, gcode = self._start(moonraker_integration=True, moonraker_socket=socket_path)
+        self.addCleanup(apo.moonraker.close)
+        gcode.commands['AUTO_POWEROFF_POWER_ON'](klippy_fakes.FakeGCodeCommand(gcode, {}))
+        self.assertEqual(gcode.responses[-1], apo.get_text('power_on_switching', source='gcode'))
+        self.assertIsNone(apo.state_file.get('power_on'))
+        # A second request while switching is not sent again / Pas de second envoi
+        gcode.commands['AUTO_POWEROFF_POWER_ON'](klippy_fakes.FakeGCodeCommand(gcode, {}))
+        self._finish_switch_on(printer, apo)
+        self.assertLess(printer.reactor.longest_stall()[1], 0.2)
+        self.assertEqual(moonraker.calls, [('machine.device_power.post_device',
+                                            {'device': 'psu_control', 'action': 'on'})])
+        self.assertEqual(apo.state_file.get('power_on')['method'], 'MOONRAKER')
+        self.assertEqual(apo.get_status(0)['state'], 'starting')
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [])
+
+    def test_failed_network_backends_fall_back_to_power_object(self):
+        socket_path = os.path.join(self.dir, 'moonraker.sock')
+        moonraker = network_standins.FakeMoonrakerSocket(socket_path)
+        self.addCleanup(moonraker.stop)
+        moonraker.errors['machine.device_power.post_device'] = 'Device psu_control not found'
+        printer, apo, gcode = self._start(moonraker_integration=True, moonraker_socket=socket_path,
+                                          power_off_retries=1)
+        self.addCleanup(apo.moonraker.close)
+        request = printer.lookup_object('webhooks').call('auto_power_off/power_on')
+        self.assertEqual(request.response, {'started': True, 'power_on': None})
+        self._finish_switch_on(printer, apo)
+        self.assertEqual(printer.lookup_object('power psu_control').power_calls, [1])
+        self.assertEqual(apo.state_file.get('power_on')['method'], 'SET_POWER')
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.printer, self.apo = klippy_fakes.make_printer(
+            {'auto_poweroff_enabled': True, 'profile_dir': tmp.name})
+        self.gcode = self.printer.lookup_object('gcode')
+
+    def _profile(self, action):
+        self.gcode.commands['AUTO_POWEROFF_PROFILE'](
+            klippy_fakes.FakeGCodeCommand(self.gcode, {'ACTION': action}))
+        return self.gcode.responses[-1]
+
+    def test_profile_module_callbacks(self):
+        original = self.apo._temps_timer.callback
+        self._profile('START')
+        self.assertIsNot(self.apo._temps_timer.callback, original)
+        self.apo._arm_timer()
+        self.printer.reactor.advance(30.)
+        self.printer.lookup_object('auto_power_off').get_status(0)
+        report = self._profile('STOP')
+        self.assertIn('_update_temps', report)
+        self.assertIn(self.dir, report)
+        path = report.rsplit(' ', 1)[-1]
+        with open(path) as f:
+            content = f.read()
+        self.assertIn('get_status', content)
+        self.assertIn('tracemalloc', content)
+        self.assertTrue(os.path.exists(path[:-len('.txt')] + '.prof'))
+
+    def test_no_trace_left_when_stopped(self):
+        self._profile('START')
+        self.apo._arm_timer()
+        self._profile('STOP')
+        self.assertEqual(self.apo._temps_timer.callback, self.apo._update_temps)
+        self.assertEqual(self.apo.shutdown_timer.callback, self.apo._check_conditions)
+        for name in self.apo.profiler.CALLBACKS:
+            self.assertNotIn(name, vars(self.apo))
+        self.assertNotIn('get_status', vars(self.apo.info))
+        self.assertEqual(self._profile('STOP'), self.apo.get_text('profile_not_running'))
+
+
+if __name__ == '__main__':
+    unittest.main()